@@ -1,9 +1,15 @@
 from flask import Flask, request, render_template, redirect
-from chatbot_manage import chat_with_gpt, create_session_for_user, update_session_title
+from chatbot_manage import update_session_title
 from user_process import compare_passwords, get_current_user, search_for_existing_user, add_new_user
 from db_utilities import (get_messages_for_session, is_session_owner,
-                         delete_session_for_user, get_session_id_for_message,
-                         print_sessions, get_user_id, get_message_by_id)
+                         delete_session_for_user, print_sessions, get_user_id,
+                         initialize_idempotency_table, initialize_summary_job_table,
+                         initialize_summary_checkpoint_table, initialize_search_cache_table)
+from idempotency import idempotent
+from chat_requests import chatbot_request, edit_message_request, run_request
+from summary_jobs import start_summary_job_dispatcher
+from shared_state import initialize_shared_state
+from metrics import get_metrics_snapshot, metrics_enabled
 from dotenv import load_dotenv
 import os
 import jwt
@@ -18,10 +24,28 @@ flaskDebugging = os.getenv("flaskDebugging", "false").lower() == "true"
 app = Flask(__name__)
 flaskIP, flaskPort = os.getenv("flaskIP", "127.0.0.1"), int(os.getenv("flaskPort", 5000))
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me')
-
-if debugging:
-    print("Debugging is enabled.")
-    print("Using JWT_SECRET_KEY:", app.config['JWT_SECRET_KEY'])
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_REQUEST_BODY_BYTES", "1048576"))
+
+def initialize_storage():
+    initialize_idempotency_table()
+    initialize_summary_job_table()
+    initialize_summary_checkpoint_table()
+    initialize_search_cache_table()
+    initialize_shared_state()
+
+def start_background_services():
+    # Threads do not survive a fork, so a server that preloads the app calls this once in
+    # every worker process after forking (see gunicorn.conf.py).
+    start_summary_job_dispatcher()
+
+def create_app(start_services=True):
+    initialize_storage()
+    if start_services:
+        start_background_services()
+    if debugging:
+        print("Debugging is enabled.")
+        print("Using JWT_SECRET_KEY:", app.config['JWT_SECRET_KEY'])
+    return app
 
 @app.route('/')
 def home():
@@ -194,102 +218,10 @@ def session_messages():
             return get_messages_for_session(session_id, tree_path)
 
 @app.route('/chatbot', methods=['POST', 'GET'])
+@idempotent('chatbot')
 def chatbot():
     user = get_current_user() or "guest"
-    
-    json_data = request.get_json() or {}
-    message = json_data.get('message')
-    parent_message_id = json_data.get('parent_message_id')
-    session_id = request.args.get('session')
-    
-    if not message or not message.strip():
-        if debugging:
-            print("Empty or missing message received")
-        return {"message": "Message content is required."}, 400
-    
-    if user == "guest":
-        if not session_id == "guest":
-            if debugging:
-                print("Guest user attempted to create or access a session, which is not allowed")
-            return {"message": "Guest users cannot create or access sessions."}, 403
-        if debugging:
-            print("Chatbot accessed by guest user, sessions will not be saved")
-            print("Prompt:", message)
-        reply = chat_with_gpt(user, message, session_id=None, first_message=True)
-        if debugging:
-            print("Reply from the API:", reply)
-
-        if not reply:
-            if debugging:
-                print("Failed to get a reply from the API")
-            return {"message": "Failed to get a reply from the API."}, 500
-        elif isinstance(reply, dict) and reply.get("error"):
-            if debugging:
-                print(f"API error: {reply.get('message')}")
-            return {"message": reply.get("message", "Failed to get a reply from the API.")}, 500
-        
-        return reply
-    else:
-        if debugging:
-            print(f"Chatbot accessed by user {user}, session_id={session_id}, message={message}, parent_message_id={parent_message_id}")
-        
-        if parent_message_id:
-            actual_session_id = get_session_id_for_message(parent_message_id)
-            if not actual_session_id:
-                if debugging:
-                    print(f"Parent message {parent_message_id} not found")
-                return {"message": "Parent message not found."}, 404
-            if debugging:
-                print(f"Using session {actual_session_id} from parent message {parent_message_id}")
-            session_id = actual_session_id
-        
-        if not session_id or session_id == "" or session_id == "new":
-            if debugging:
-                print("No session ID provided, creating a new session")
-            session_id = create_session_for_user(user)
-            if not session_id:
-                if debugging:
-                    print("Failed to create a new session for user:", user)
-                return {"message": "Failed to create a new session."}, 500
-            reply = chat_with_gpt(user, message, session_id=session_id, first_message=True)
-            
-            if not reply:
-                if debugging:
-                    print("Failed to get a reply from the API")
-                delete_session_for_user(user, session_id)
-                return {"message": "Failed to get a reply from the API."}, 500
-            elif isinstance(reply, dict) and reply.get("error"):
-                if debugging:
-                    print(f"API error: {reply.get('message')}")
-                delete_session_for_user(user, session_id)
-                return {"message": reply.get("message", "Failed to get a reply from the API.")}, 500
-            
-            return reply
-        else:
-            if debugging:
-                print(f"User {user} is trying to access session: {session_id}")
-            
-            if not is_session_owner(user, session_id):
-                if debugging:
-                    print(f"User {user} is not authorized to access session: {session_id}")
-                return {"message": "Forbidden: You do not have access to this session."}, 403
-            reply = chat_with_gpt(user, message, session_id=session_id, first_message=False, parent_message_id=parent_message_id)
-            
-            if not reply:
-                if parent_message_id:
-                    if debugging:
-                        print(f"Branching failed for parent_message_id: {parent_message_id}")
-                    return {"message": "Forbidden: Cannot branch from the first message."}, 403
-                else:
-                    if debugging:
-                        print("Failed to get a reply from the API for session:", session_id)
-                    return {"message": "Failed to get a reply from the API."}, 500
-            elif isinstance(reply, dict) and reply.get("error"):
-                if debugging:
-                    print(f"API error: {reply.get('message')}")
-                return {"message": reply.get("message", "Failed to get a reply from the API.")}, 500
-            
-            return reply
+    return run_request(chatbot_request(user, request.get_json() or {}, request.args.get('session')))
 
 @app.route('/login')
 def login_page():
@@ -461,66 +393,10 @@ def refresh_token():
         return {"message": "Token refresh failed"}, 500
 
 @app.route('/chatbot/edit-message', methods=['POST'])
+@idempotent('chatbot/edit-message')
 def edit_message():
     user = get_current_user() or "guest"
-    data = request.get_json() or {}
-    session_id = data.get('session_id')
-    message_id = data.get('message_id')
-    new_message = data.get('message')
-    
-    if debugging:
-        print(f"edit_message called by user={user}, session_id={session_id}, message_id={message_id}, new_message={new_message}")
-    
-    if user == "guest":
-        if debugging:
-            print("Guest user attempted to edit a message")
-        return {"message": "Forbidden: Guest users cannot edit messages."}, 403
-    
-    if not session_id or not message_id or not new_message:
-        if debugging:
-            print("Missing required parameters for message edit")
-        return {"message": "session_id, message_id, and message are required."}, 400
-    
-    if not is_session_owner(user, session_id):
-        if debugging:
-            print(f"User {user} is not authorized to edit messages in session: {session_id}")
-        return {"message": "Forbidden: You do not have access to this session."}, 403
-    
-    try:
-        original_message = get_message_by_id(message_id)
-        if not original_message:
-            if debugging:
-                print(f"Message {message_id} not found")
-            return {"message": "Message not found."}, 404
-        
-        if original_message['sender'] != 'user':
-            if debugging:
-                print(f"Attempted to edit non-user message {message_id}")
-            return {"message": "Only user messages can be edited."}, 400
-        
-        parent_message_id = original_message['connected_from']
-        if parent_message_id == 'main':
-            if debugging:
-                print(f"Attempted to edit root message {message_id}")
-            return {"message": "Root message cannot be edited."}, 400
-        
-        reply = chat_with_gpt(user, new_message, session_id=session_id, first_message=False, parent_message_id=parent_message_id)
-
-        if not reply:
-            if debugging:
-                print("Failed to get a reply from GPT API for edited message")
-            return {"message": "Failed to get a reply from the API."}, 500
-        elif isinstance(reply, dict) and reply.get("error"):
-            if debugging:
-                print(f"API error during message edit: {reply.get('message')}")
-            return {"message": reply.get("message", "Failed to get a reply from the API.")}, 500
-        
-        return reply
-        
-    except Exception as e:
-        if debugging:
-            print(f"Error in edit_message: {e}")
-        return {"message": "Internal server error during message edit."}, 500
+    return run_request(edit_message_request(user, request.get_json() or {}))
 
 @app.route('/chatbot/save-tree-path', methods=['POST'])
 def save_tree_path():
@@ -660,5 +536,11 @@ def update_session_title_route():
 def chatbot_page():
     return render_template('chatbot.html')
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not metrics_enabled:
+        return {"message": "Metrics are disabled."}, 404
+    return get_metrics_snapshot()
+
 if __name__ == '__main__':
-    app.run(host=flaskIP, port=flaskPort, debug=flaskDebugging)
\ No newline at end of file
+    create_app().run(host=flaskIP, port=flaskPort, debug=flaskDebugging)
\ No newline at end of file
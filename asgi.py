@@ -0,0 +1,167 @@
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from __init__ import app as flask_app, create_app, flaskIP, flaskPort
+from chat_requests import chatbot_request, edit_message_request, run_request_async
+from user_process import get_user_for_authorization
+from deepseek_api import close_async_client
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+# Threads for the short database steps of async chats and for the Flask routes served through the bridge.
+asgi_worker_threads = int(os.getenv("ASGI_WORKER_THREADS", "64"))
+
+# Idempotent retries keep going through the Flask view, which owns the idempotency bookkeeping.
+ASYNC_CHAT_PATHS = {"/chatbot", "/chatbot/edit-message"}
+IDEMPOTENCY_HEADER = "idempotency-key"
+
+ASYNC_CHAT_HANDLERS = {
+    "/chatbot": lambda user, query, data: chatbot_request(user, data, query.get('session')),
+    "/chatbot/edit-message": lambda user, query, data: edit_message_request(user, data)
+}
+
+class RequestTooLarge(Exception):
+    pass
+
+async def _read_body(receive, max_bytes):
+    # Returns None when the client disconnected; raises RequestTooLarge past max_bytes.
+    body = bytearray()
+    while True:
+        event = await receive()
+        if event["type"] == "http.disconnect":
+            return None
+        body.extend(event.get("body", b""))
+        if len(body) > max_bytes:
+            raise RequestTooLarge()
+        if not event.get("more_body"):
+            return bytes(body)
+
+async def _send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_json(send, payload, status):
+    body = flask_app.json.dumps(payload).encode("utf-8")
+    await _send_response(send, status, [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii"))], body)
+
+async def _handle_async_chat(scope, headers, body, send):
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await _send_json(send, {"message": "Request body must be a JSON object."}, 400)
+        return
+
+    query = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode("utf-8", "replace")).items()}
+    user = await asyncio.to_thread(get_user_for_authorization, headers.get("authorization", ""), flask_app.config['JWT_SECRET_KEY'])
+    payload, status = await run_request_async(ASYNC_CHAT_HANDLERS[scope["path"]](user or "guest", query, data))
+    increment_counter("asgi_chat_requests", path=scope["path"], status=status)
+    await _send_json(send, payload, status)
+
+def _wsgi_environ(scope, headers, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    for name, value in headers.items():
+        key = name.upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        environ[key] = value
+    return environ
+
+def _run_wsgi(environ):
+    # Responses are buffered; none of the Flask routes stream.
+    response = {}
+    chunks = []
+
+    def start_response(status, response_headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response_headers]
+        return chunks.append
+
+    result = flask_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+async def _lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(asgi_worker_threads, thread_name_prefix="asgi"))
+            await asyncio.to_thread(create_app)
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    # Chat requests are handled on the event loop and await the provider, so an in-flight chat
+    # holds a coroutine instead of a thread. Everything else is served by the Flask app.
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    headers = {}
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1").lower(), value.decode("latin-1")
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+
+    # The same cap Flask applies through MAX_CONTENT_LENGTH, checked before the body is buffered.
+    max_body_bytes = flask_app.config['MAX_CONTENT_LENGTH']
+    try:
+        if int(headers.get("content-length") or 0) > max_body_bytes:
+            raise RequestTooLarge()
+        body = await _read_body(receive, max_body_bytes)
+    except RequestTooLarge:
+        increment_counter("asgi_rejected_requests", reason="too_large")
+        await _send_json(send, {"message": f"Request body is larger than {max_body_bytes} bytes."}, 413)
+        return
+    except ValueError:
+        await _send_json(send, {"message": "Invalid Content-Length header."}, 400)
+        return
+    if body is None:
+        return
+
+    if scope["method"] == "POST" and scope["path"] in ASYNC_CHAT_PATHS and not headers.get(IDEMPOTENCY_HEADER):
+        await _handle_async_chat(scope, headers, body, send)
+        return
+
+    status, response_headers, response_body = await asyncio.to_thread(_run_wsgi, _wsgi_environ(scope, headers, body))
+    await _send_response(send, status, response_headers, response_body)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:application", host=flaskIP, port=flaskPort, log_level="debug" if debugging else "info")
@@ -0,0 +1,158 @@
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import increment_counter, set_gauge, register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+JOB_PRIORITY_SUMMARY = 0
+JOB_PRIORITY_TITLE = 1
+JOB_PRIORITY_REFRESH = 2
+
+background_workers = int(os.getenv("BACKGROUND_WORKERS", "4"))
+background_queue_size = int(os.getenv("BACKGROUND_QUEUE_SIZE", "200"))
+background_submit_wait_seconds = float(os.getenv("BACKGROUND_SUBMIT_WAIT_SECONDS", "2"))
+background_drain_seconds = float(os.getenv("BACKGROUND_DRAIN_SECONDS", "30"))
+
+class BackgroundJob:
+    def __init__(self, name, fn, args, on_drop=None):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.on_drop = on_drop
+
+    def drop(self, reason):
+        increment_counter("background_jobs_dropped", job=self.name, reason=reason)
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop(*self.args)
+        except Exception as e:
+            print(f"Background job {self.name} drop handler failed: {e}")
+
+class BackgroundJobPool:
+    # Fixed worker threads pull from one bounded priority queue. A full queue pushes back on
+    # the request thread for a short while and then drops the job through its on_drop
+    # handler, so bursts never turn into an unbounded number of provider calls.
+    def __init__(self, workers, queue_size):
+        self.workers = max(1, workers)
+        self._queue = queue.PriorityQueue(maxsize=max(1, queue_size))
+        self._sequence = itertools.count()
+        self._threads = []
+        self._accepting = True
+        self._active = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._started = False
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"background-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _publish_depth(self):
+        set_gauge("background_queue_depth", self._queue.qsize())
+
+    def submit(self, name, fn, args=(), priority=JOB_PRIORITY_SUMMARY, on_drop=None):
+        job = BackgroundJob(name, fn, args, on_drop)
+        if not self._accepting:
+            job.drop("shutting_down")
+            return False
+
+        self._start()
+        try:
+            self._queue.put((priority, next(self._sequence), job), timeout=background_submit_wait_seconds)
+        except queue.Full:
+            if debugging:
+                print(f"Background queue full, dropping {name} job")
+            job.drop("queue_full")
+            return False
+
+        increment_counter("background_jobs_submitted", job=name)
+        self._publish_depth()
+        return True
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                self._active += 1
+            self._publish_depth()
+            start_time = time.time()
+            try:
+                job.fn(*job.args)
+                increment_counter("background_jobs_completed", job=job.name)
+            except Exception as e:
+                increment_counter("background_jobs_failed", job=job.name)
+                print(f"Background job {job.name} failed: {e}")
+            finally:
+                increment_counter("background_job_seconds", time.time() - start_time, job=job.name)
+                with self._lock:
+                    self._active -= 1
+                    self._idle.notify_all()
+                self._queue.task_done()
+
+    def drain(self, timeout):
+        # Stop taking new work, give queued and running jobs until `timeout` to finish, then
+        # hand anything still queued to its on_drop handler so it can be picked up later.
+        self._accepting = False
+        deadline = time.time() + timeout
+        with self._lock:
+            while (self._queue.qsize() > 0 or self._active > 0) and time.time() < deadline:
+                self._idle.wait(min(0.5, max(0.0, deadline - time.time())))
+
+        abandoned = 0
+        while True:
+            try:
+                _, _, job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            job.drop("shutdown")
+            abandoned += 1
+            self._queue.task_done()
+        self._publish_depth()
+        if debugging:
+            print(f"Background pool drained, {abandoned} queued jobs abandoned, {self._active} still running")
+        return abandoned
+
+    def stats(self):
+        with self._lock:
+            active = self._active
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "active": active,
+            "accepting": self._accepting
+        }
+
+background_pool = BackgroundJobPool(background_workers, background_queue_size)
+
+def _reset_after_fork():
+    # Worker threads do not survive a fork; a forked server worker starts with an empty pool of its own.
+    global background_pool
+    background_pool = BackgroundJobPool(background_workers, background_queue_size)
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def submit_background_job(name, fn, args=(), priority=JOB_PRIORITY_SUMMARY, on_drop=None):
+    return background_pool.submit(name, fn, args, priority, on_drop)
+
+def drain_background_jobs(timeout=None):
+    return background_pool.drain(background_drain_seconds if timeout is None else timeout)
+
+def get_background_job_stats():
+    return background_pool.stats()
+
+atexit.register(drain_background_jobs)
+register_collector("background_jobs", get_background_job_stats)
@@ -0,0 +1,168 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from chatbot_manage import chat_with_gpt, chat_with_gpt_async, create_session_for_user
+from db_utilities import is_session_owner, delete_session_for_user, get_session_id_for_message, get_message_by_id
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+# The /chatbot and /chatbot/edit-message request handling, shared by the Flask views and the
+# ASGI app. Each handler is a generator that yields (CHAT_STEP, kwargs) for the chat reply and
+# (function, args) for each database step, and returns (body, status).
+CHAT_STEP = "chat"
+
+def _reply_response(reply, failure_context=""):
+    if not reply:
+        if debugging:
+            print(f"Failed to get a reply from the API{failure_context}")
+        return {"message": "Failed to get a reply from the API."}, 500
+    if isinstance(reply, dict) and reply.get("error"):
+        if debugging:
+            print(f"API error{failure_context}: {reply.get('message')}")
+        return {"message": reply.get("message", "Failed to get a reply from the API.")}, 500
+    return reply, 200
+
+def chatbot_request(user, data, session_id):
+    message = data.get('message')
+    parent_message_id = data.get('parent_message_id')
+
+    if not message or not message.strip():
+        if debugging:
+            print("Empty or missing message received")
+        return {"message": "Message content is required."}, 400
+
+    if user == "guest":
+        if not session_id == "guest":
+            if debugging:
+                print("Guest user attempted to create or access a session, which is not allowed")
+            return {"message": "Guest users cannot create or access sessions."}, 403
+        if debugging:
+            print("Chatbot accessed by guest user, sessions will not be saved")
+            print("Prompt:", message)
+        reply = yield CHAT_STEP, dict(username=user, message=message, session_id=None, first_message=True)
+        if debugging:
+            print("Reply from the API:", reply)
+        return _reply_response(reply)
+
+    if debugging:
+        print(f"Chatbot accessed by user {user}, session_id={session_id}, message={message}, parent_message_id={parent_message_id}")
+
+    if parent_message_id:
+        actual_session_id = yield get_session_id_for_message, (parent_message_id,)
+        if not actual_session_id:
+            if debugging:
+                print(f"Parent message {parent_message_id} not found")
+            return {"message": "Parent message not found."}, 404
+        if debugging:
+            print(f"Using session {actual_session_id} from parent message {parent_message_id}")
+        session_id = actual_session_id
+
+    if not session_id or session_id == "new":
+        if debugging:
+            print("No session ID provided, creating a new session")
+        session_id = yield create_session_for_user, (user,)
+        if not session_id:
+            if debugging:
+                print("Failed to create a new session for user:", user)
+            return {"message": "Failed to create a new session."}, 500
+        reply = yield CHAT_STEP, dict(username=user, message=message, session_id=session_id, first_message=True)
+        body, status = _reply_response(reply)
+        if status != 200:
+            yield delete_session_for_user, (user, session_id)
+        return body, status
+
+    if debugging:
+        print(f"User {user} is trying to access session: {session_id}")
+    if not (yield is_session_owner, (user, session_id)):
+        if debugging:
+            print(f"User {user} is not authorized to access session: {session_id}")
+        return {"message": "Forbidden: You do not have access to this session."}, 403
+    reply = yield CHAT_STEP, dict(username=user, message=message, session_id=session_id, first_message=False, parent_message_id=parent_message_id)
+    if not reply and parent_message_id:
+        if debugging:
+            print(f"Branching failed for parent_message_id: {parent_message_id}")
+        return {"message": "Forbidden: Cannot branch from the first message."}, 403
+    return _reply_response(reply, f" for session {session_id}")
+
+def edit_message_request(user, data):
+    session_id = data.get('session_id')
+    message_id = data.get('message_id')
+    new_message = data.get('message')
+
+    if debugging:
+        print(f"edit_message called by user={user}, session_id={session_id}, message_id={message_id}, new_message={new_message}")
+
+    if user == "guest":
+        if debugging:
+            print("Guest user attempted to edit a message")
+        return {"message": "Forbidden: Guest users cannot edit messages."}, 403
+
+    if not session_id or not message_id or not new_message:
+        if debugging:
+            print("Missing required parameters for message edit")
+        return {"message": "session_id, message_id, and message are required."}, 400
+
+    if not (yield is_session_owner, (user, session_id)):
+        if debugging:
+            print(f"User {user} is not authorized to edit messages in session: {session_id}")
+        return {"message": "Forbidden: You do not have access to this session."}, 403
+
+    try:
+        original_message = yield get_message_by_id, (message_id,)
+        if not original_message:
+            if debugging:
+                print(f"Message {message_id} not found")
+            return {"message": "Message not found."}, 404
+
+        if original_message['sender'] != 'user':
+            if debugging:
+                print(f"Attempted to edit non-user message {message_id}")
+            return {"message": "Only user messages can be edited."}, 400
+
+        parent_message_id = original_message['connected_from']
+        if parent_message_id == 'main':
+            if debugging:
+                print(f"Attempted to edit root message {message_id}")
+            return {"message": "Root message cannot be edited."}, 400
+
+        reply = yield CHAT_STEP, dict(username=user, message=new_message, session_id=session_id, first_message=False, parent_message_id=parent_message_id)
+        return _reply_response(reply, " during message edit")
+    except Exception as e:
+        if debugging:
+            print(f"Error in edit_message: {e}")
+        return {"message": "Internal server error during message edit."}, 500
+
+def run_request(steps):
+    method, value = steps.send, None
+    while True:
+        try:
+            function, args = method(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            if function == CHAT_STEP:
+                method, value = steps.send, chat_with_gpt(**args)
+            else:
+                method, value = steps.send, function(*args)
+        except Exception as e:
+            method, value = steps.throw, e
+
+async def run_request_async(steps):
+    # The chat reply is awaited; the short database steps run on a worker thread.
+    method, value = steps.send, None
+    while True:
+        try:
+            function, args = method(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            if function == CHAT_STEP:
+                method, value = steps.send, await chat_with_gpt_async(**args)
+            else:
+                method, value = steps.send, await asyncio.to_thread(function, *args)
+        except asyncio.CancelledError:
+            steps.close()
+            raise
+        except Exception as e:
+            method, value = steps.throw, e
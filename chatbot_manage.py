@@ -1,34 +1,218 @@
+import asyncio
 import datetime
 import sqlite3
 import os
-import threading
+import re
+import json
 import time
 from dotenv import load_dotenv
-from gemini_api import call_gemini_api, GeminiAPIError
-from deepseek_api import call_deepseek_api, DeepSeekAPIError
-from db_utilities import get_user_id, get_title_for_session, get_summary_for_session, get_summary_for_message_branch, get_message_by_id, update_session_last_change
+from gemini_api import call_gemini_api, call_gemini_api_async, GeminiAPIError
+from deepseek_api import call_deepseek_api, call_deepseek_api_async, DeepSeekAPIError
+from db_utilities import (get_user_id, get_title_for_session, get_summary_for_message_branch, get_message_by_id,
+                          update_session_last_change, get_summary_job_inputs, get_summary_job_state_for_session,
+                          get_branch_context, update_message_summary, store_summary_checkpoint)
+from prompt_cache import is_cacheable_prompt_type, cache_namespace, lookup_similar_reply, store_reply
+from latency_stats import record_latency, get_latency_percentile
+from hedging import hedging_enabled, hedged_call, compute_hedge_delay
+from circuit_breaker import get_breaker, is_provider_failure, CircuitOpenError
+from retry_budget import try_acquire_retry
+from rate_limiter import ProviderSlot, AsyncProviderSlot, RateLimitExceededError, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from single_flight import single_flight, make_call_key
+from summary_jobs import enqueue_summary, register_summary_job_handler
+from local_summarizer import classify_turn, build_turn_summary, update_rolling_summary, record_summary_source
+from deadline import Deadline, DeadlineExceededError, summary_timeout_seconds, title_timeout_seconds
+from model_routing import PROVIDER_DEFAULT_MODELS, task_for_prompt_type, get_route, record_routing_decision
+from tool_intent import detect_tool_intent
+from shared_state import bump_version, get_version, wait_for_version
 
 load_dotenv()
 debugging = os.getenv("debugging", "false").lower() == "true"
 
-pending_summaries = {}
-summary_locks = {}
-ai_provider = os.getenv("AI_PROVIDER", "gemini").lower()
+combined_summary_title = os.getenv("COMBINED_SUMMARY_TITLE", "true").lower() == "true"
+summary_state_recheck_seconds = float(os.getenv("SUMMARY_STATE_RECHECK_SECONDS", "15"))
+continuation_mode = os.getenv("CONTINUATION_MODE", "true").lower() == "true"
+continuation_token_budget = int(os.getenv("CONTINUATION_TOKEN_BUDGET", "6000"))
+summary_context_token_budget = int(os.getenv("SUMMARY_CONTEXT_TOKEN_BUDGET", "8000"))
+hierarchical_summaries = os.getenv("HIERARCHICAL_SUMMARIES", "true").lower() == "true"
+summary_checkpoint_interval = int(os.getenv("SUMMARY_CHECKPOINT_INTERVAL", "8"))
 
-def call_ai_api(messages, model=None, temperature=0.3, candidate_count=1, use_tools=False):
+PROVIDER_API_KEY_VARS = {
+    "gemini": "GEMINI_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY"
+}
+HEDGED_PROMPT_TYPES = {"first_message", "continuing", "guest"}
+
+def get_secondary_provider(primary_provider):
+    secondary = os.getenv("HEDGE_SECONDARY_PROVIDER", "deepseek" if primary_provider != "deepseek" else "gemini").lower()
+    if secondary == primary_provider or secondary not in PROVIDER_DEFAULT_MODELS:
+        return None
+    if not os.getenv(PROVIDER_API_KEY_VARS[secondary]):
+        return None
+    return secondary
+
+def _record_call_latency(provider, start_time, use_tools, deadline, failed=False):
+    # Failures and deadline expiries count too, capped at the deadline, so the percentiles that
+    # drive timeouts and hedging are not biased towards fast successes. A call that failed
+    # because it was cancelled after losing a hedge is not recorded.
+    if start_time is None or (failed and deadline is not None and deadline.cancelled()):
+        return
+    elapsed = time.time() - start_time
+    if deadline is not None and deadline.expires_at is not None:
+        elapsed = min(elapsed, max(0.0, deadline.expires_at - start_time))
+    record_latency(provider, elapsed, "tools" if use_tools else "plain")
+
+def call_provider(provider, messages, model, temperature=0.3, candidate_count=1, use_tools=False, deadline=None, priority=PRIORITY_INTERACTIVE, max_tokens=None, tool_intent=None):
+    breaker = get_breaker(provider)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"{provider} provider is temporarily unavailable (circuit open)")
+
+    start_time = None
     try:
-        if ai_provider == "deepseek":
-            if debugging:
-                print("Using DeepSeek API")
-            return call_deepseek_api(messages, model or "deepseek-chat", temperature, candidate_count, use_tools)
+        with ProviderSlot(provider, model, messages, priority, deadline):
+            start_time = time.time()
+            if provider == "deepseek":
+                if debugging:
+                    print("Using DeepSeek API")
+                reply = call_deepseek_api(messages, model, temperature, candidate_count, use_tools, deadline=deadline, max_tokens=max_tokens, tool_intent=tool_intent)
+            else:
+                if debugging:
+                    print("Using Gemini API")
+                reply = call_gemini_api(messages, model, temperature, candidate_count, use_tools, deadline=deadline, max_tokens=max_tokens, tool_intent=tool_intent)
+    except RateLimitExceededError:
+        breaker.release_probe()
+        raise
+    except Exception as e:
+        _record_call_latency(provider, start_time, use_tools, deadline, failed=True)
+        # A hedged call abandoned in favour of the other provider says nothing about provider health.
+        if is_provider_failure(e) and not (deadline is not None and deadline.cancelled()):
+            breaker.record_failure()
         else:
+            breaker.release_probe()
+        raise
+
+    breaker.record_success()
+    _record_call_latency(provider, start_time, use_tools, deadline)
+    return reply
+
+async def call_provider_async(provider, messages, model, temperature=0.3, candidate_count=1, use_tools=False, deadline=None, priority=PRIORITY_INTERACTIVE, max_tokens=None, tool_intent=None):
+    breaker = get_breaker(provider)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"{provider} provider is temporarily unavailable (circuit open)")
+
+    start_time = None
+    try:
+        async with AsyncProviderSlot(provider, model, messages, priority, deadline):
+            start_time = time.time()
+            if provider == "deepseek":
+                reply = await call_deepseek_api_async(messages, model, temperature, candidate_count, use_tools, deadline=deadline, max_tokens=max_tokens, tool_intent=tool_intent)
+            else:
+                reply = await call_gemini_api_async(messages, model, temperature, candidate_count, use_tools, deadline=deadline, max_tokens=max_tokens, tool_intent=tool_intent)
+    except (RateLimitExceededError, asyncio.CancelledError):
+        # A client that disconnected says nothing about provider health either.
+        breaker.release_probe()
+        raise
+    except Exception as e:
+        _record_call_latency(provider, start_time, use_tools, deadline, failed=True)
+        if is_provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release_probe()
+        raise
+
+    breaker.record_success()
+    _record_call_latency(provider, start_time, use_tools, deadline)
+    return reply
+
+def resolve_provider_call(prompt_type, model=None, temperature=None):
+    task = task_for_prompt_type(prompt_type)
+    route = get_route(task)
+    provider = route["provider"]
+    model = model or route["model"]
+    temperature = route["temperature"] if temperature is None else temperature
+    record_routing_decision(task, provider, model)
+    return provider, model, temperature, route["max_tokens"]
+
+def similarity_cache_key(provider, model, prompt_type, temperature, use_tools, user_message):
+    # Tool-assisted replies depend on live search results, so only plain stateless prompts are reused.
+    if user_message and not use_tools and is_cacheable_prompt_type(prompt_type):
+        return cache_namespace(provider, model, prompt_type, temperature)
+    return None
+
+def to_api_error(e):
+    if isinstance(e, (GeminiAPIError, DeepSeekAPIError)):
+        return APIError(f"AI API call failed: {e.message}")
+    if isinstance(e, CircuitOpenError):
+        return APIError(f"AI API unavailable: {e.message}", error_type="circuit_open")
+    if isinstance(e, RateLimitExceededError):
+        return APIError(f"AI API rate limited: {e.message}", error_type="rate_limited")
+    if isinstance(e, DeadlineExceededError):
+        return APIError(f"AI API call did not finish in time: {e.message}", error_type=e.error_type)
+    return APIError(f"Unexpected AI API error: {str(e)}")
+
+def call_ai_api(messages, model=None, temperature=None, candidate_count=1, use_tools=False, prompt_type=None, user_message=None, priority=PRIORITY_INTERACTIVE, deadline=None, tool_intent=None):
+    provider, model, temperature, max_tokens = resolve_provider_call(prompt_type, model, temperature)
+
+    cache_namespace_key = similarity_cache_key(provider, model, prompt_type, temperature, use_tools, user_message)
+    if cache_namespace_key is not None:
+        cached_reply = lookup_similar_reply(cache_namespace_key, user_message)
+        if cached_reply is not None:
+            if debugging:
+                print(f"Serving {prompt_type} reply from similarity cache")
+            return cached_reply
+
+    secondary_provider = get_secondary_provider(provider) if hedging_enabled and prompt_type in HEDGED_PROMPT_TYPES else None
+
+    def dispatch():
+        if secondary_provider and get_breaker(provider).is_open():
+            if debugging:
+                print(f"Primary provider {provider} circuit open, failing over to {secondary_provider}")
+            return call_provider(secondary_provider, messages, PROVIDER_DEFAULT_MODELS[secondary_provider], temperature, candidate_count, use_tools, deadline, priority, max_tokens, tool_intent)
+        if secondary_provider:
+            latency_kind = "tools" if use_tools else "plain"
+            hedge_delay = compute_hedge_delay(get_latency_percentile(provider, 0.95, latency_kind))
+            return hedged_call(
+                lambda call_deadline: call_provider(provider, messages, model, temperature, candidate_count, use_tools, call_deadline, priority, max_tokens, tool_intent),
+                lambda call_deadline: call_provider(secondary_provider, messages, PROVIDER_DEFAULT_MODELS[secondary_provider], temperature, candidate_count, use_tools, call_deadline, priority, max_tokens, tool_intent),
+                hedge_delay,
+                deadline
+            )
+        return call_provider(provider, messages, model, temperature, candidate_count, use_tools, deadline, priority, max_tokens, tool_intent)
+
+    # Identical prompts already in flight (double submits, client retries) share one upstream call.
+    call_key = make_call_key(provider, model, temperature, candidate_count, use_tools, max_tokens, messages)
+
+    try:
+        reply = single_flight(call_key, dispatch)
+    except Exception as e:
+        raise to_api_error(e)
+
+    if cache_namespace_key is not None:
+        store_reply(cache_namespace_key, user_message, reply)
+    return reply
+
+async def call_ai_api_async(messages, model=None, temperature=None, candidate_count=1, use_tools=False, prompt_type=None, user_message=None, priority=PRIORITY_INTERACTIVE, deadline=None, tool_intent=None):
+    # The event-loop counterpart of call_ai_api for the ASGI app. Hedging and single-flight are
+    # thread based and stay on the WSGI path; routing, caching, breakers and limits are shared.
+    provider, model, temperature, max_tokens = resolve_provider_call(prompt_type, model, temperature)
+
+    cache_namespace_key = similarity_cache_key(provider, model, prompt_type, temperature, use_tools, user_message)
+    if cache_namespace_key is not None:
+        cached_reply = lookup_similar_reply(cache_namespace_key, user_message)
+        if cached_reply is not None:
             if debugging:
-                print("Using Gemini API")
-            return call_gemini_api(messages, model or "gemini-2.0-flash-exp", temperature, candidate_count, use_tools)
-    except (GeminiAPIError, DeepSeekAPIError) as e:
-        raise APIError(f"AI API call failed: {e.message}")
+                print(f"Serving {prompt_type} reply from similarity cache")
+            return cached_reply
+
+    try:
+        reply = await call_provider_async(provider, messages, model, temperature, candidate_count, use_tools, deadline, priority, max_tokens, tool_intent)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        raise APIError(f"Unexpected AI API error: {str(e)}")
+        raise to_api_error(e)
+
+    if cache_namespace_key is not None:
+        store_reply(cache_namespace_key, user_message, reply)
+    return reply
 
 class APIError(Exception):
     def __init__(self, message, error_type="api_error"):
@@ -166,8 +350,10 @@ def create_deepseek_guest_prompt(message):
         }
     ]
 
-def get_prompt_for_provider(prompt_type, **kwargs):
-    if ai_provider == "deepseek":
+def get_prompt_for_provider(prompt_type, provider=None, **kwargs):
+    # Prompts are phrased for the provider the task is routed to, not just the global default.
+    provider = provider or get_route(task_for_prompt_type(prompt_type))["provider"]
+    if provider == "deepseek":
         if prompt_type == "first_message":
             return create_deepseek_first_message_prompt(kwargs["message"])
         elif prompt_type == "continuing":
@@ -178,6 +364,10 @@ def get_prompt_for_provider(prompt_type, **kwargs):
             return create_deepseek_summary_prompt(kwargs.get("session_summary", ""), kwargs["message"], kwargs["reply"])
         elif prompt_type == "title":
             return create_deepseek_title_prompt(kwargs.get("session_summary", ""), kwargs["message"], kwargs["reply"])
+        elif prompt_type == "summary_title":
+            return create_deepseek_summary_title_prompt(kwargs.get("session_summary", ""), kwargs["message"], kwargs["reply"])
+        elif prompt_type == "checkpoint":
+            return create_deepseek_checkpoint_prompt(kwargs["context"])
     else:
         if prompt_type == "first_message":
             return create_gemini_first_message_prompt(kwargs["message"])
@@ -189,6 +379,10 @@ def get_prompt_for_provider(prompt_type, **kwargs):
             return create_gemini_summary_prompt(kwargs.get("session_summary", ""), kwargs["message"], kwargs["reply"])
         elif prompt_type == "title":
             return create_gemini_title_prompt(kwargs.get("session_summary", ""), kwargs["message"], kwargs["reply"])
+        elif prompt_type == "summary_title":
+            return create_gemini_summary_title_prompt(kwargs.get("session_summary", ""), kwargs["message"], kwargs["reply"])
+        elif prompt_type == "checkpoint":
+            return create_gemini_checkpoint_prompt(kwargs["context"])
         else:
             return create_gemini_guest_prompt(kwargs["message"])
 
@@ -328,123 +522,238 @@ def create_deepseek_title_prompt(session_summary, message, reply):
         }
     ]
 
+def create_gemini_summary_title_prompt(session_summary, message, reply):
+    context = f"{session_summary}\n" if session_summary else ""
+    return [
+        {
+            "author": "user",
+            "content": (
+                "You are a precise summarizer. Use ONLY the text between the fences. "
+                "Do NOT add external knowledge. If something is unclear, write 'Unknown'. "
+                "Preserve exact wording for personal details, lists, identifiers, and code.\n\n"
+                "IMPORTANT: If code was provided earlier and later edited or corrected, include the MOST RECENT version verbatim.\n\n"
+                "=== BEGIN CONTEXT ===\n"
+                f"{context}"
+                f"User just said:\n```user\n{message}\n```\n"
+                f"I responded:\n```assistant\n{reply}\n```\n"
+                "=== END CONTEXT ===\n\n"
+                "OUTPUT (JSON only):\n"
+                "{\n"
+                '  "title": "<short 3–5 word title, or exactly New Conversation if there is not enough information>",\n'
+                '  "summary": {\n'
+                '    "language": "<match the user message language>",\n'
+                '    "timeline": {"user_message": "<1–2 sentence gist>", "assistant_reply": "<1–2 sentence gist>"},\n'
+                '    "personal_information": {"name": "<verbatim or Unknown>", "preferences": [], "interests": [], "goals": []},\n'
+                '    "tasks_and_lists": [{"type":"to-do|reminder|plan|shopping|other","items": []}],\n'
+                '    "ongoing_projects": [{"title":"","status":"Unknown","details":""}],\n'
+                '    "technical_details": {"code_snippets":[{"language":"","purpose":"","content":""}], "configs": [], "commands": [], "solutions": []},\n'
+                '    "context_and_preferences": {"preferred_language":"Unknown","communication_style":"Unknown","specific_requirements":[]},\n'
+                '    "important_facts": [],\n'
+                '    "open_questions": [],\n'
+                '    "next_steps": [{"assignee":"Unknown","action":"","when":"Unknown"}],\n'
+                '    "memory_candidates": [{"text":"","why":""}]\n'
+                "  }\n"
+                "}\n\n"
+                "RULES: Output valid JSON only (no prose, no code fences). "
+                "The title has no quotes, no punctuation and no 'Title:' prefix. "
+                "If a section has no content, use an empty array/object."
+            )
+        }
+    ]
+
+def create_deepseek_summary_title_prompt(session_summary, message, reply):
+    context = f"Previous summary: {session_summary}\n\n" if session_summary else ""
+    return [
+        {
+            "author": "user",
+            "content": (
+                f"Please create a title and a JSON summary of this conversation exchange:\n\n"
+                f"{context}"
+                f"User: {message}\n"
+                f"Assistant: {reply}\n\n"
+                "Return a single JSON object with exactly two keys:\n"
+                "- title: a concise 3-5 word title that captures the main topic "
+                "(use New Conversation if the conversation is too vague)\n"
+                "- summary: an object with these fields:\n"
+                "  - language: detected language\n"
+                "  - timeline: brief summary of exchange\n"
+                "  - personal_information: any personal details mentioned\n"
+                "  - tasks_and_lists: any tasks or lists discussed\n"
+                "  - ongoing_projects: any projects mentioned\n"
+                "  - technical_details: code, configs, commands, solutions\n"
+                "  - context_and_preferences: user preferences and style\n"
+                "  - important_facts: key information to remember\n"
+                "  - open_questions: unresolved questions\n"
+                "  - next_steps: planned actions\n"
+                "  - memory_candidates: important things to remember\n\n"
+                "Return only valid JSON without code fences or explanations."
+            )
+        }
+    ]
+
+def create_gemini_checkpoint_prompt(context):
+    return [
+        {
+            "author": "user",
+            "content": (
+                "You are a precise summarizer. Merge the conversation summary and the later turn summaries between the fences "
+                "into ONE summary of the whole conversation so far. Use ONLY the fenced text. "
+                "Do NOT add external knowledge. Preserve exact wording for personal details, lists, identifiers, and code.\n\n"
+                "IMPORTANT: Later turns override earlier ones. If code was edited or corrected, keep only the MOST RECENT version verbatim. "
+                "Drop details that were resolved or superseded.\n\n"
+                "=== BEGIN CONTEXT ===\n"
+                f"{context}\n"
+                "=== END CONTEXT ===\n\n"
+                "OUTPUT (JSON only), with the same fields as the summaries above: language, timeline, personal_information, "
+                "tasks_and_lists, ongoing_projects, technical_details, context_and_preferences, important_facts, "
+                "open_questions, next_steps, memory_candidates.\n\n"
+                "RULES: Output valid JSON only (no prose, no code fences). "
+                "Keep the timeline to the key moments of the conversation, not one entry per turn."
+            )
+        }
+    ]
+
+def create_deepseek_checkpoint_prompt(context):
+    return [
+        {
+            "author": "user",
+            "content": (
+                f"Please merge this conversation summary and the later turn summaries into one JSON summary of the whole conversation:\n\n"
+                f"{context}\n\n"
+                "Later turns override earlier ones, keep only the most recent version of any code, "
+                "and drop details that were resolved or superseded.\n"
+                "Use these fields: language, timeline (key moments only), personal_information, tasks_and_lists, "
+                "ongoing_projects, technical_details, context_and_preferences, important_facts, open_questions, "
+                "next_steps, memory_candidates.\n\n"
+                "Return only valid JSON without code fences or explanations."
+            )
+        }
+    ]
+
+def parse_summary_title_response(response_text):
+    if not response_text:
+        return None
+
+    text = response_text.strip()
+    fence_match = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fence_match:
+        text = fence_match.group(1).strip()
+
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    title = data.get("title")
+    summary = data.get("summary")
+    if not isinstance(title, str) or not title.strip() or not summary:
+        return None
+
+    if isinstance(summary, (dict, list)):
+        summary = json.dumps(summary, ensure_ascii=False)
+    elif not isinstance(summary, str):
+        return None
+
+    title = title.strip().strip('"').strip('*').strip()
+    if title.lower().startswith("title:"):
+        title = title[len("title:"):].strip()
+    return summary, (title or "New Conversation")
+
+def build_context_summary(context, token_budget):
+    # Last completed summary plus the raw turns after it, newest turns kept first when over budget.
+    summary = context["summary"] or ""
+    remaining_chars = max(0, token_budget * 4 - len(summary))
+    recent_lines = []
+    for sender, content in reversed(context["messages"]):
+        label = {"user": "User", "turn": "Turn summary"}.get(sender, "Assistant")
+        line = f"{label}: {content}"
+        if len(line) > remaining_chars:
+            if remaining_chars > 200:
+                recent_lines.append(line[:remaining_chars] + "...")
+            break
+        recent_lines.append(line)
+        remaining_chars -= len(line)
+
+    if not recent_lines:
+        return summary
+    recent_text = "\n".join(reversed(recent_lines))
+    if not summary:
+        return f"Recent exchanges:\n{recent_text}"
+    return f"{summary}\n\nLater exchanges not yet included in the summary above:\n{recent_text}"
+
 def wait_for_pending_summary_completion(session_id, timeout=45):
-    if session_id not in pending_summaries:
+    if get_summary_job_state_for_session(session_id) != "pending":
         return True
     
     start_time = time.time()
     if debugging:
         print(f"Waiting for pending summary completion for session {session_id}")
     
-    while session_id in pending_summaries and (time.time() - start_time) < timeout:
-        time.sleep(0.3)
-        
-    completed = session_id not in pending_summaries
+    # Whichever worker process finishes a job for the session bumps its shared version, which
+    # wakes the waiter; the job table stays the source of truth and is re-read after every wake.
+    completed = False
+    version_key = summary_version_key(session_id)
+    while True:
+        seen_version = get_version(version_key)
+        if get_summary_job_state_for_session(session_id) != "pending":
+            completed = True
+            break
+        remaining = timeout - (time.time() - start_time)
+        if remaining <= 0:
+            break
+        wait_for_version(version_key, seen_version, min(remaining, summary_state_recheck_seconds))
+    
     if debugging:
         elapsed = time.time() - start_time
         print(f"Summary wait completed in {elapsed:.1f}s, success: {completed}")
-        if not completed:
-            print(f"Pending summaries: {pending_summaries[session_id]}")
     return completed
 
-def check_and_retry_failed_summary(session_id):
+def requeue_failed_summary(session_id):
+    # Recovery goes back through the summary job queue; the request thread only waits for it.
     conn = sqlite3.connect('database.sqlite')
     cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, summary, sender, content, connected_from 
-        FROM message 
-        WHERE session_id = ? AND summary = 'failed' 
-        ORDER BY timestamp DESC 
-        LIMIT 1
-    """, (session_id,))
-    
-    failed_message = cursor.fetchone()
-    if not failed_message:
-        conn.close()
-        return True
-    
-    message_id, _, sender, content, connected_from = failed_message
-    
-    if debugging:
-        print(f"Found failed summary for message {message_id}, attempting retry")
-    
     try:
-        if connected_from:
-            cursor.execute("SELECT content, sender FROM message WHERE id = ?", (connected_from,))
-            prev_msg = cursor.fetchone()
-            if prev_msg and sender == "bot":
-                cursor.execute("SELECT content FROM message WHERE id = ?", (connected_from,))
-                user_msg = cursor.fetchone()
-                if user_msg:
-                    user_content = user_msg[0]
-                    bot_reply = content
-                    
-                    session_summary = get_summary_for_session(session_id)
-                    
-                    summary_prompt = get_prompt_for_provider("summary", session_summary=session_summary, message=user_content, reply=bot_reply)
-                    new_summary = call_ai_api(summary_prompt, use_tools=False)
-                    
-                    cursor.execute("UPDATE message SET summary = ? WHERE id = ?", (new_summary, message_id))
-                    conn.commit()
-                    
-                    if debugging:
-                        print(f"Successfully retried summary for message {message_id}")
-                    
-                    conn.close()
-                    return True
-    except Exception as e:
+        cursor.execute(
+            "SELECT id FROM message WHERE session_id = ? AND sender = 'bot' AND summary = 'failed' ORDER BY created_at DESC LIMIT 1",
+            (session_id,)
+        )
+        failed_message = cursor.fetchone()
+    except sqlite3.Error as e:
         if debugging:
-            print(f"Failed to retry summary for message {message_id}: {e}")
+            print(f"Error getting failed summary: {e}")
+        return False
+    finally:
+        cursor.close()
         conn.close()
+
+    if not failed_message:
+        return True
+    if not try_acquire_retry("failed_summary"):
         return False
-    
-    conn.close()
-    return False
+    if debugging:
+        print(f"Found failed summary for message {failed_message[0]}, requeueing it")
+    return enqueue_summary(failed_message[0], session_id) is not None
 
 def has_pending_or_failed_summary(session_id):
-    if session_id in pending_summaries:
-        return True, "pending"
-    
-    conn = sqlite3.connect('database.sqlite')
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(*) FROM message 
-        WHERE session_id = ? AND summary = 'failed' AND sender = 'bot'
-    """, (session_id,))
-    
-    failed_count = cursor.fetchone()[0]
-    conn.close()
-    
-    if failed_count > 0:
-        return True, "failed"
-    
+    state = get_summary_job_state_for_session(session_id)
+    if state is not None:
+        return True, state
     return False, None
 
-def mark_summary_pending(session_id, message_id):
-    if session_id not in summary_locks:
-        summary_locks[session_id] = threading.Lock()
-    
-    with summary_locks[session_id]:
-        pending_summaries[session_id] = message_id
-        if debugging:
-            print(f"Marked summary as pending for session {session_id}, message {message_id}")
+def summary_version_key(session_id):
+    return f"summary:{session_id}"
 
 def mark_summary_complete(session_id):
-    if session_id not in summary_locks:
-        return
-        
-    with summary_locks[session_id]:
-        if session_id in pending_summaries:
-            del pending_summaries[session_id]
-            if debugging:
-                print(f"Marked summary as complete for session {session_id}")
-
-def cleanup_old_session_locks():
-    empty_sessions = [sid for sid, lock in summary_locks.items() if sid not in pending_summaries]
-    for sid in empty_sessions[:10]:
-        if sid in summary_locks:
-            del summary_locks[sid]
+    bump_version(summary_version_key(session_id))
+    if debugging:
+        print(f"Marked summary as complete for session {session_id}")
 
 def get_pending_summary_for_session(session_id):
     conn = sqlite3.connect('database.sqlite')
@@ -463,130 +772,32 @@ def get_pending_summary_for_session(session_id):
             print(f"Error getting pending summary: {e}")
         return None
 
-def process_pending_summary(session_id, session_summary, user_message, bot_reply):
+def process_pending_summary(session_id):
     pending = get_pending_summary_for_session(session_id)
     if not pending:
-        return session_summary
+        return True
     
     message_id, bot_content, sender = pending
-    try:
-        conn = sqlite3.connect('database.sqlite')
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT content FROM message WHERE session_id = ? AND connects_to = ? AND sender = 'user' ORDER BY created_at DESC LIMIT 1",
-            (session_id, str(message_id))
-        )
-        user_result = cursor.fetchone()
-        conn.close()
-        
-        if user_result:
-            previous_user_message = user_result[0]
-        else:
-            previous_user_message = "No user message found"
-        
-        summary_prompt = get_prompt_for_provider("summary", session_summary=session_summary, message=previous_user_message, reply=bot_content)
-        summary = call_ai_api(summary_prompt, use_tools=False)
-        
-        conn = sqlite3.connect('database.sqlite')
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE message SET summary = ? WHERE id = ?",
-            (summary, message_id)
-        )
-        conn.commit()
-        conn.close()
-        
-        if debugging:
-            print(f"Updated pending summary for message {message_id}")
-        
-        return summary
-        
-    except Exception as e:
-        conn = sqlite3.connect('database.sqlite')
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE message SET summary = ? WHERE id = ?",
-            ("failed", message_id)
-        )
-        conn.commit()
-        conn.close()
-        
+    if enqueue_summary(message_id, session_id) is None:
         if debugging:
-            print(f"Failed to generate pending summary for message {message_id}: {e}")
-        
-        return "failed"
+            print(f"Failed to enqueue pending summary for message {message_id}")
+        return False
+    return wait_for_pending_summary_completion(session_id, timeout=60)
 
-def process_summary_in_background(message_id, session_summary, message, reply, session_id):
-    max_retries = 2
-    retry_count = 0
-    
-    while retry_count <= max_retries:
-        try:
-            summary_prompt = get_prompt_for_provider("summary", session_summary=session_summary, message=message, reply=reply)
-            
-            timeout_seconds = int(os.getenv("SUMMARY_TIMEOUT_SECONDS", "120"))
-            
-            original_timeout = os.getenv("DEEPSEEK_TIMEOUT")
-            os.environ["DEEPSEEK_TIMEOUT"] = str(min(60, timeout_seconds))
-            
-            try:
-                summary = call_ai_api(summary_prompt, use_tools=False)
-                conn = sqlite3.connect('database.sqlite')
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE message SET summary = ? WHERE id = ?",
-                    (summary, message_id)
-                )
-                conn.commit()
-                conn.close()
-                
-                if debugging:
-                    print(f"Background summary updated for message {message_id} after {retry_count} retries")
-                
-                break
-                    
-            finally:
-                if original_timeout:
-                    os.environ["DEEPSEEK_TIMEOUT"] = original_timeout
-                else:
-                    os.environ.pop("DEEPSEEK_TIMEOUT", None)
-                
-        except Exception as e:
-            retry_count += 1
-            if debugging:
-                print(f"Background summary attempt {retry_count} failed for message {message_id}: {e}")
-            
-            if retry_count > max_retries:
-                conn = sqlite3.connect('database.sqlite')
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE message SET summary = ? WHERE id = ?",
-                    ("failed", message_id)
-                )
-                conn.commit()
-                conn.close()
-                
-                if debugging:
-                    print(f"Background summary permanently failed for message {message_id} after {max_retries + 1} attempts")
-            else:
-                time.sleep(2 ** retry_count)
+def store_message_summary(message_id, summary, summary_level=None):
+    return update_message_summary(message_id, summary, summary_level)
 
-    mark_summary_complete(session_id)
+def store_job_summary(message_id, summary, summary_level=None):
+    # Inside a summary job a summary that could not be stored fails the job, so it is retried.
+    if not store_message_summary(message_id, summary, summary_level):
+        raise RuntimeError(f"Could not store summary for message {message_id}")
 
-def process_title_in_background(session_id, session_summary, message, reply):
+def process_title_in_background(session_id, session_summary, message, reply, deadline=None):
     try:
         title_prompt = get_prompt_for_provider("title", session_summary=session_summary, message=message, reply=reply)
         
-        original_timeout = os.getenv("DEEPSEEK_TIMEOUT")
-        os.environ["DEEPSEEK_TIMEOUT"] = "30"
-        
-        try:
-            title_candidate = call_ai_api(title_prompt, use_tools=False)
-        finally:
-            if original_timeout:
-                os.environ["DEEPSEEK_TIMEOUT"] = original_timeout
-            else:
-                os.environ.pop("DEEPSEEK_TIMEOUT", None)
+        title_candidate = call_ai_api(title_prompt, use_tools=False, prompt_type="title", priority=PRIORITY_BACKGROUND,
+                                      deadline=_job_step_deadline(deadline, title_timeout_seconds))
                 
         session_title = (title_candidate or "New Conversation").strip().strip('"').strip('*')
         
@@ -599,28 +810,170 @@ def process_title_in_background(session_id, session_summary, message, reply):
         if debugging:
             print(f"Background title generation failed for session {session_id}: {e}")
 
+def process_summary_and_title(message_id, session_summary, message, reply, session_id, deadline, summary_level=None):
+    try:
+        combined_prompt = get_prompt_for_provider("summary_title", session_summary=session_summary, message=message, reply=reply)
+        response_text = call_ai_api(combined_prompt, use_tools=False, prompt_type="summary_title", priority=PRIORITY_BACKGROUND,
+                                    deadline=deadline)
+    except Exception as e:
+        if debugging:
+            print(f"Combined summary/title call failed for message {message_id}: {e}")
+        return False
+
+    summary_and_title = parse_summary_title_response(response_text)
+    if summary_and_title is None:
+        if debugging:
+            print(f"Combined summary/title response for message {message_id} could not be parsed, falling back")
+        return False
+
+    summary, session_title = summary_and_title
+    if not store_message_summary(message_id, summary, summary_level):
+        return False
+    update_session_title(session_id, session_title)
+    if debugging:
+        print(f"Combined summary and title updated for session {session_id}: {session_title}")
+    return True
+
+def maybe_create_checkpoint(session_id, message_id, deadline=None):
+    # Every N turn summaries on a branch are folded, together with the checkpoint before them,
+    # into a new checkpoint at this message. Branches below it start from here.
+    context = get_branch_context(message_id)
+    if context["turn_summaries"] < summary_checkpoint_interval:
+        return False
+    try:
+        checkpoint_prompt = get_prompt_for_provider("checkpoint", context=build_context_summary(context, summary_context_token_budget))
+        checkpoint = call_ai_api(checkpoint_prompt, use_tools=False, prompt_type="checkpoint", priority=PRIORITY_BACKGROUND,
+                                 deadline=_job_step_deadline(deadline, summary_timeout_seconds))
+    except Exception as e:
+        # The turn summary is already stored; the next turn on this branch tries the rollup again.
+        if debugging:
+            print(f"Checkpoint rollup failed at message {message_id}: {e}")
+        return False
+    return store_summary_checkpoint(session_id, message_id, context["turn_summaries"], checkpoint)
+
+def _job_step_deadline(job_deadline, seconds):
+    # Each provider call keeps its own timeout but never outlives the summary job's deadline.
+    return job_deadline.child(seconds) if job_deadline is not None else Deadline(seconds)
+
+def summarize_message(message_id, needs_title=False, job_deadline=None):
+    # Inputs are read back from the database so a job resumed after a restart sees the same turn.
+    inputs = get_summary_job_inputs(message_id)
+    if inputs is None:
+        if debugging:
+            print(f"Message {message_id} no longer exists, skipping summary")
+        return False
+
+    session_id = inputs["session_id"]
+    message = inputs["message"]
+    reply = inputs["reply"]
+    needs_title = needs_title and get_title_for_session(session_id) == "New Conversation"
+    # Hierarchical mode summarizes only this turn; the branch context comes from checkpoints instead,
+    # so it is only read when the title prompt needs it.
+    context_summary = ""
+    if inputs["previous_message_id"] and (needs_title or not hierarchical_summaries):
+        context_summary = build_context_summary(get_branch_context(inputs["previous_message_id"]), summary_context_token_budget)
+    summary_context = "" if hierarchical_summaries else context_summary
+    summary_level = "turn" if hierarchical_summaries else None
+    deadline = _job_step_deadline(job_deadline, summary_timeout_seconds)
+
+    summarized = False
+    turn_type = classify_turn(message, reply)
+    if turn_type is not None:
+        # Acknowledgements and bare calculations are summarized locally without a provider call.
+        if hierarchical_summaries:
+            summary = build_turn_summary(message, reply, turn_type)
+        else:
+            summary = update_rolling_summary(context_summary, message, reply, turn_type)
+        store_job_summary(message_id, summary, summary_level)
+        record_summary_source("local")
+        summarized = True
+        if debugging:
+            print(f"Local {turn_type} summary stored for message {message_id}")
+
+    if not summarized and needs_title and combined_summary_title:
+        summarized = process_summary_and_title(message_id, summary_context, message, reply, session_id, deadline, summary_level)
+        needs_title = not summarized
+        if summarized:
+            record_summary_source("provider")
+
+    if not summarized:
+        summary_prompt = get_prompt_for_provider("summary", session_summary=summary_context, message=message, reply=reply)
+        summary = call_ai_api(summary_prompt, use_tools=False, prompt_type="summary", priority=PRIORITY_BACKGROUND, deadline=deadline)
+        store_job_summary(message_id, summary, summary_level)
+        record_summary_source("provider")
+        if debugging:
+            print(f"Summary updated for message {message_id}")
+
+    if needs_title:
+        process_title_in_background(session_id, context_summary, message, reply, job_deadline)
+    if hierarchical_summaries:
+        maybe_create_checkpoint(session_id, message_id, job_deadline)
+    return True
+
+def execute_summary_job(job, deadline):
+    summarize_message(job["message_id"], job["needs_title"], deadline)
+
+def finish_summary_job(job, succeeded):
+    mark_summary_complete(job["session_id"])
+
+register_summary_job_handler(execute_summary_job, finish_summary_job)
+
+def start_background_summary(message_id, session_id, needs_title):
+    if enqueue_summary(message_id, session_id, needs_title) is None:
+        store_message_summary(message_id, "failed")
+        mark_summary_complete(session_id)
+
+def resume_chat_steps(method, value):
+    # Returns (finished, result): the chat response once the flow is done, else the next provider request.
+    try:
+        return False, method(value)
+    except StopIteration as done:
+        return True, done.value
+
+def run_chat_steps(steps, call):
+    # Drives a chat_steps generator: each provider request it yields is answered with call(**request),
+    # and a failed call is thrown back in so the step's own error handling decides the response.
+    method, value = steps.send, None
+    while True:
+        finished, request = resume_chat_steps(method, value)
+        if finished:
+            return request
+        try:
+            method, value = steps.send, call(**request)
+        except Exception as e:
+            method, value = steps.throw, e
+
 def chat_with_gpt(username, message, session_id=None, first_message=False, parent_message_id=None):
+    return run_chat_steps(chat_steps(username, message, session_id, first_message, parent_message_id), call_ai_api)
+
+async def chat_with_gpt_async(username, message, session_id=None, first_message=False, parent_message_id=None):
+    # Database steps between provider calls are short and blocking, so they run on a worker
+    # thread; the provider call itself is awaited and holds no thread while it is in flight.
+    steps = chat_steps(username, message, session_id, first_message, parent_message_id)
+    method, value = steps.send, None
+    while True:
+        finished, request = await asyncio.to_thread(resume_chat_steps, method, value)
+        if finished:
+            return request
+        try:
+            method, value = steps.send, await call_ai_api_async(**request)
+        except asyncio.CancelledError:
+            steps.close()
+            raise
+        except Exception as e:
+            method, value = steps.throw, e
+
+def chat_steps(username, message, session_id=None, first_message=False, parent_message_id=None):
+    # The chat flow as a generator so the WSGI app and the ASGI app share it; only the provider call differs.
     stateful = bool(username and session_id)
     user_id = get_user_id(username)
+    tool_intent = detect_tool_intent(message)
 
     if stateful:
         if first_message:
             first_prompt = get_prompt_for_provider("first_message", message=message)
             try:
-                user_msg_lower = message.lower()
-                needs_tools = (
-                    "search" in user_msg_lower or 
-                    "find" in user_msg_lower or 
-                    "calculate" in user_msg_lower or
-                    "what is" in user_msg_lower or
-                    "current" in user_msg_lower or
-                    "latest" in user_msg_lower or
-                    "what's" in user_msg_lower or
-                    "whats" in user_msg_lower or
-                    any(symbol in message for symbol in ["+", "-", "*", "/", "="])
-                )
-                
-                reply = call_ai_api(first_prompt, use_tools=needs_tools)
+                reply = yield dict(messages=first_prompt, use_tools=tool_intent.needs_tools, prompt_type="first_message", user_message=message, tool_intent=tool_intent)
                 
                 try:
                     user_msg_id = add_message_to_session(session_id, "user", message, "", "main", "", 0)
@@ -630,19 +983,7 @@ def chat_with_gpt(username, message, session_id=None, first_message=False, paren
                     
                     update_session_last_change(session_id)
                     
-                    mark_summary_pending(session_id, bot_msg_id)
-                    
-                    threading.Thread(
-                        target=process_summary_in_background, 
-                        args=(bot_msg_id, "", message, reply, session_id),
-                        daemon=True
-                    ).start()
-                    
-                    threading.Thread(
-                        target=process_title_in_background,
-                        args=(session_id, "", message, reply),
-                        daemon=True
-                    ).start()
+                    start_background_summary(bot_msg_id, session_id, needs_title=True)
                     
                 except Exception as db_error:
                     if debugging:
@@ -677,62 +1018,51 @@ def chat_with_gpt(username, message, session_id=None, first_message=False, paren
             }
 
         else:
-            if debugging:
-                print(f"Checking for pending or failed summaries for session {session_id}")
+            if not continuation_mode:
+                if debugging:
+                    print(f"Checking for pending or failed summaries for session {session_id}")
             
-            has_issues, issue_type = has_pending_or_failed_summary(session_id)
+                has_issues, issue_type = has_pending_or_failed_summary(session_id)
             
-            if has_issues:
-                if issue_type == "pending":
+                if has_issues:
+                    if issue_type == "failed":
+                        if debugging:
+                            print(f"Attempting to retry failed summary for session {session_id}")
+                        if not requeue_failed_summary(session_id):
+                            if debugging:
+                                print(f"Failed to retry summary for session {session_id}")
+                            return {"error": "summary_failed", "message": "Previous message summary failed and could not be recovered. Cannot process new messages."}
+                    
                     summary_completed = wait_for_pending_summary_completion(session_id, timeout=60)
                     if not summary_completed:
                         if debugging:
                             print(f"Timeout waiting for summary completion in session {session_id}")
                         return {"error": "summary_timeout", "message": "Previous message summary is still being processed. Please wait and try again."}
-                
-                elif issue_type == "failed":
-                    if debugging:
-                        print(f"Attempting to retry failed summary for session {session_id}")
-                    retry_success = check_and_retry_failed_summary(session_id)
-                    if not retry_success:
-                        if debugging:
-                            print(f"Failed to retry summary for session {session_id}")
-                        return {"error": "summary_failed", "message": "Previous message summary failed and could not be recovered. Cannot process new messages."}
             
-            has_remaining_issues, _ = has_pending_or_failed_summary(session_id)
-            if has_remaining_issues:
-                if debugging:
-                    print(f"Summary issues still exist for session {session_id}, blocking new message")
-                return {"error": "summary_required", "message": "Previous message summary must be completed before sending new messages."}
+                has_remaining_issues, _ = has_pending_or_failed_summary(session_id)
+                if has_remaining_issues:
+                    if debugging:
+                        print(f"Summary issues still exist for session {session_id}, blocking new message")
+                    return {"error": "summary_required", "message": "Previous message summary must be completed before sending new messages."}
             
-            if parent_message_id:
-                session_summary = get_summary_for_message_branch(parent_message_id)
-            else:
-                session_summary = get_summary_for_session(session_id)
+                if not process_pending_summary(session_id):
+                    return {"error": "summary_required", "message": "Previous message summary must be completed before sending new messages."}
             
-            updated_summary = process_pending_summary(session_id, session_summary, "", "")
-            if updated_summary and updated_summary != "failed":
-                session_summary = updated_summary
+            # Build on the last checkpoint or completed summary of this branch plus the turns it does not
+            # cover yet; in continuation mode a summary still being generated never blocks the next message.
+            context_message_id = parent_message_id or get_last_message_id_for_session(session_id)
+            session_summary = ""
+            if context_message_id:
+                session_summary = build_context_summary(get_branch_context(context_message_id), continuation_token_budget)
+            if debugging:
+                print(f"Reply context for session {session_id} built from message {context_message_id}")
             
             session_title = get_title_for_session(session_id)
             
             prompt = get_prompt_for_provider("continuing", session_title=session_title, session_summary=session_summary, message=message)
 
             try:
-                user_msg_lower = message.lower()
-                needs_tools = (
-                    "search" in user_msg_lower or 
-                    "find" in user_msg_lower or 
-                    "calculate" in user_msg_lower or
-                    "what is" in user_msg_lower or
-                    "current" in user_msg_lower or
-                    "latest" in user_msg_lower or
-                    "whats" in user_msg_lower or
-                    "what's" in user_msg_lower or
-                    any(symbol in message for symbol in ["+", "-", "*", "/", "="])
-                )
-                
-                reply = call_ai_api(prompt, use_tools=needs_tools)
+                reply = yield dict(messages=prompt, use_tools=tool_intent.needs_tools, prompt_type="continuing", tool_intent=tool_intent)
                 
                 user_msg_id = None
                 bot_msg_id = None
@@ -765,20 +1095,7 @@ def chat_with_gpt(username, message, session_id=None, first_message=False, paren
                     
                     update_session_last_change(session_id)
                     
-                    mark_summary_pending(session_id, bot_msg_id)
-                    
-                    threading.Thread(
-                        target=process_summary_in_background, 
-                        args=(bot_msg_id, session_summary, message, reply, session_id),
-                        daemon=True
-                    ).start()
-                    
-                    if session_title == "New Conversation":
-                        threading.Thread(
-                            target=process_title_in_background,
-                            args=(session_id, session_summary, message, reply),
-                            daemon=True
-                        ).start()
+                    start_background_summary(bot_msg_id, session_id, needs_title=(session_title == "New Conversation"))
                         
                 except Exception as db_error:
                     if debugging:
@@ -828,15 +1145,7 @@ def chat_with_gpt(username, message, session_id=None, first_message=False, paren
     else:
         try:
             prompt = get_prompt_for_provider("guest", message=message)
-            user_msg_lower = message.lower()
-            needs_tools = (
-                "search" in user_msg_lower or 
-                "find" in user_msg_lower or 
-                "calculate" in user_msg_lower or
-                any(symbol in message for symbol in ["+", "-", "*", "/", "="])
-            )
-            
-            reply = call_ai_api(prompt, use_tools=needs_tools)
+            reply = yield dict(messages=prompt, use_tools=tool_intent.needs_tools, prompt_type="guest", user_message=message, tool_intent=tool_intent)
             return {
                 "session_id": "None",
                 "user_id": "guest",
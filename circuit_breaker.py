@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+breaker_failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+breaker_open_seconds = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+breaker_half_open_probes = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Only errors that say something about the provider's health count towards opening a breaker;
+# the caller's own deadline, bad requests, tool errors and missing configuration do not.
+PROVIDER_FAILURE_TYPES = {"transport", "timeout", "server_error"}
+
+def is_provider_failure(error):
+    return getattr(error, "error_type", None) in PROVIDER_FAILURE_TYPES
+
+class CircuitOpenError(Exception):
+    def __init__(self, message, error_type="circuit_open"):
+        self.message = message
+        self.error_type = error_type
+        super().__init__(self.message)
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, open_seconds=30.0, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected_calls = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def _refresh_state(self):
+        if self.state == STATE_OPEN and time.time() - self.opened_at >= self.open_seconds:
+            self.state = STATE_HALF_OPEN
+            self.probes_in_flight = 0
+            if debugging:
+                print(f"Circuit breaker {self.name} moved to half-open")
+
+    def _open(self):
+        self.state = STATE_OPEN
+        self.opened_at = time.time()
+        self.probes_in_flight = 0
+        self.times_opened += 1
+        if debugging:
+            print(f"Circuit breaker {self.name} opened after {self.consecutive_failures} consecutive failures")
+
+    def is_open(self):
+        with self._lock:
+            self._refresh_state()
+            return self.state == STATE_OPEN
+
+    def allow_request(self):
+        with self._lock:
+            self._refresh_state()
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+                self.probes_in_flight += 1
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.total_successes += 1
+            self.consecutive_failures = 0
+            if self.state != STATE_CLOSED:
+                if debugging:
+                    print(f"Circuit breaker {self.name} closed after successful probe")
+                self.state = STATE_CLOSED
+                self.probes_in_flight = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            if self.state == STATE_HALF_OPEN:
+                self._open()
+            elif self.state == STATE_CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def release_probe(self):
+        with self._lock:
+            if self.state == STATE_HALF_OPEN and self.probes_in_flight > 0:
+                self.probes_in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            self._refresh_state()
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_failures": self.total_failures,
+                "total_successes": self.total_successes,
+                "rejected_calls": self.rejected_calls,
+                "times_opened": self.times_opened,
+                "open_for_seconds": round(time.time() - self.opened_at, 1) if self.state == STATE_OPEN else 0
+            }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, breaker_failure_threshold, breaker_open_seconds, breaker_half_open_probes)
+            _breakers[name] = breaker
+        return breaker
+
+def get_breaker_states():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+register_collector("circuit_breakers", get_breaker_states)
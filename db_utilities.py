@@ -702,4 +702,618 @@ def get_message_connected_from(message_id):
         return None
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def initialize_idempotency_table():
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_key (
+                id               INTEGER PRIMARY KEY AUTOINCREMENT,
+                username         TEXT    NOT NULL,
+                endpoint         TEXT    NOT NULL,
+                idempotency_key  TEXT    NOT NULL,
+                request_hash     TEXT    NOT NULL,
+                status           TEXT    NOT NULL DEFAULT 'in_progress'
+                                 CHECK(status IN('in_progress','completed')),
+                response_status  INTEGER,
+                response_body    TEXT,
+                created_at       DATETIME NOT NULL,
+                UNIQUE(username, endpoint, idempotency_key)
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_key_created_at ON idempotency_key(created_at)")
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in initialize_idempotency_table:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def claim_idempotency_key(username, endpoint, key, request_hash, ttl_seconds, in_progress_timeout_seconds):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        expired_before = (now - datetime.timedelta(seconds=ttl_seconds)).isoformat()
+        stale_before = (now - datetime.timedelta(seconds=in_progress_timeout_seconds)).isoformat()
+
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("DELETE FROM idempotency_key WHERE created_at < ?", (expired_before,))
+        cur.execute(
+            "DELETE FROM idempotency_key "
+            "WHERE username = ? AND endpoint = ? AND idempotency_key = ? "
+            "AND status = 'in_progress' AND created_at < ?",
+            (username, endpoint, key, stale_before)
+        )
+        cur.execute(
+            "SELECT request_hash, status, response_status, response_body FROM idempotency_key "
+            "WHERE username = ? AND endpoint = ? AND idempotency_key = ?",
+            (username, endpoint, key)
+        )
+        row = cur.fetchone()
+        if row:
+            conn.commit()
+            stored_hash, status, response_status, response_body = row
+            if stored_hash != request_hash:
+                return "mismatch", None
+            if status == "completed":
+                return "completed", (response_status, response_body)
+            return "in_progress", None
+
+        cur.execute(
+            "INSERT INTO idempotency_key (username, endpoint, idempotency_key, request_hash, status, created_at) "
+            "VALUES (?, ?, ?, ?, 'in_progress', ?)",
+            (username, endpoint, key, request_hash, now.isoformat())
+        )
+        conn.commit()
+        if debugging:
+            print(f"Claimed idempotency key {key} for {username} on {endpoint}")
+        return "claimed", None
+    except sqlite3.Error as e:
+        conn.rollback()
+        if debugging:
+            print("SQLite error in claim_idempotency_key:", e)
+        return "error", None
+    finally:
+        cur.close()
+        conn.close()
+
+def complete_idempotency_key(username, endpoint, key, response_status, response_body):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE idempotency_key SET status = 'completed', response_status = ?, response_body = ? "
+            "WHERE username = ? AND endpoint = ? AND idempotency_key = ?",
+            (response_status, response_body, username, endpoint, key)
+        )
+        conn.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in complete_idempotency_key:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def release_idempotency_key(username, endpoint, key):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "DELETE FROM idempotency_key "
+            "WHERE username = ? AND endpoint = ? AND idempotency_key = ? AND status = 'in_progress'",
+            (username, endpoint, key)
+        )
+        conn.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in release_idempotency_key:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def initialize_summary_job_table():
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS summary_job (
+                id                INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id        INTEGER NOT NULL UNIQUE,
+                session_id        INTEGER NOT NULL,
+                needs_title       INTEGER NOT NULL DEFAULT 0,
+                status            TEXT    NOT NULL DEFAULT 'pending'
+                                  CHECK(status IN('pending','running','dead')),
+                attempts          INTEGER NOT NULL DEFAULT 0,
+                available_at      DATETIME NOT NULL,
+                lease_owner       TEXT,
+                lease_expires_at  DATETIME,
+                last_error        TEXT,
+                sweep_count       INTEGER NOT NULL DEFAULT 0,
+                created_at        DATETIME NOT NULL,
+                FOREIGN KEY(message_id)
+                  REFERENCES message(id)
+                  ON DELETE CASCADE
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_job_session_status ON summary_job(session_id, status)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_job_status_available ON summary_job(status, available_at)")
+        cur.execute("PRAGMA table_info(summary_job)")
+        if "sweep_count" not in [row[1] for row in cur.fetchall()]:
+            cur.execute("ALTER TABLE summary_job ADD COLUMN sweep_count INTEGER NOT NULL DEFAULT 0")
+        # Partial index: only the few failed rows are indexed, so the sweeper never scans message.
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_message_failed_summary ON message(created_at) WHERE summary = 'failed'")
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in initialize_summary_job_table:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def enqueue_summary_job(message_id, session_id, needs_title=False):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        cur.execute(
+            "INSERT INTO summary_job (message_id, session_id, needs_title, status, attempts, available_at, created_at) "
+            "VALUES (?, ?, ?, 'pending', 0, ?, ?) "
+            "ON CONFLICT(message_id) DO UPDATE SET needs_title = MAX(needs_title, excluded.needs_title)",
+            (message_id, session_id, 1 if needs_title else 0, now, now)
+        )
+        # A running job keeps its lease; only rows that are not running go back to pending.
+        cur.execute(
+            "UPDATE summary_job SET status = 'pending', attempts = 0, available_at = ?, lease_owner = NULL, lease_expires_at = NULL "
+            "WHERE message_id = ? AND status != 'running'",
+            (now, message_id)
+        )
+        cur.execute("SELECT id FROM summary_job WHERE message_id = ?", (message_id,))
+        job_id = cur.fetchone()[0]
+        conn.commit()
+        if debugging:
+            print(f"Enqueued summary job {job_id} for message {message_id}")
+        return job_id
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in enqueue_summary_job:", e)
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+def enqueue_missing_summary_jobs():
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        cur.execute(
+            "INSERT INTO summary_job (message_id, session_id, needs_title, status, attempts, available_at, created_at) "
+            "SELECT m.id, m.session_id, 0, 'pending', 0, ?, ? FROM message m "
+            "JOIN session s ON s.id = m.session_id "
+            "WHERE m.sender = 'bot' AND (m.summary = '' OR m.summary IS NULL) AND s.isDeleted = 'FALSE' "
+            "AND NOT EXISTS (SELECT 1 FROM summary_job j WHERE j.message_id = m.id)",
+            (now, now)
+        )
+        conn.commit()
+        if debugging and cur.rowcount:
+            print(f"Resumed {cur.rowcount} unsummarized messages as summary jobs")
+        return cur.rowcount
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in enqueue_missing_summary_jobs:", e)
+        return 0
+    finally:
+        cur.close()
+        conn.close()
+
+def get_due_summary_job_ids(limit):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        cur.execute(
+            "SELECT id FROM summary_job WHERE status = 'pending' AND available_at <= ? "
+            "UNION ALL "
+            "SELECT id FROM summary_job WHERE status = 'running' AND lease_expires_at < ? "
+            "LIMIT ?",
+            (now, now, limit)
+        )
+        return [row[0] for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in get_due_summary_job_ids:", e)
+        return []
+    finally:
+        cur.close()
+        conn.close()
+
+def claim_summary_job(job_id, worker_id, lease_seconds):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        lease_expires_at = (now + datetime.timedelta(seconds=lease_seconds)).isoformat()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            "UPDATE summary_job SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires_at = ? "
+            "WHERE id = ? AND ((status = 'pending' AND available_at <= ?) OR (status = 'running' AND lease_expires_at < ?))",
+            (worker_id, lease_expires_at, job_id, now.isoformat(), now.isoformat())
+        )
+        if cur.rowcount != 1:
+            conn.commit()
+            return None
+        cur.execute(
+            "SELECT id, message_id, session_id, needs_title, attempts, sweep_count FROM summary_job WHERE id = ?",
+            (job_id,)
+        )
+        row = cur.fetchone()
+        conn.commit()
+        return {
+            "id": row[0],
+            "message_id": row[1],
+            "session_id": row[2],
+            "needs_title": bool(row[3]),
+            "attempts": row[4],
+            "sweep_count": row[5]
+        }
+    except sqlite3.Error as e:
+        conn.rollback()
+        if debugging:
+            print("SQLite error in claim_summary_job:", e)
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+def complete_summary_job(job_id, worker_id):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM summary_job WHERE id = ? AND lease_owner = ?", (job_id, worker_id))
+        conn.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in complete_summary_job:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def reschedule_summary_job(job_id, worker_id, delay_seconds, error):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        available_at = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=delay_seconds)).isoformat()
+        cur.execute(
+            "UPDATE summary_job SET status = 'pending', available_at = ?, lease_owner = NULL, lease_expires_at = NULL, last_error = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (available_at, str(error)[:1000], job_id, worker_id)
+        )
+        conn.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in reschedule_summary_job:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def dead_letter_summary_job(job_id, worker_id, error):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            "UPDATE summary_job SET status = 'dead', available_at = ?, lease_owner = NULL, lease_expires_at = NULL, last_error = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (datetime.datetime.now(datetime.timezone.utc).isoformat(), str(error)[:1000], job_id, worker_id)
+        )
+        dead_lettered = cur.rowcount == 1
+        if dead_lettered:
+            cur.execute(
+                "UPDATE message SET summary = 'failed' WHERE id = (SELECT message_id FROM summary_job WHERE id = ?)",
+                (job_id,)
+            )
+        conn.commit()
+        return dead_lettered
+    except sqlite3.Error as e:
+        conn.rollback()
+        if debugging:
+            print("SQLite error in dead_letter_summary_job:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def get_summary_job_state_for_session(session_id):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT "
+            "EXISTS(SELECT 1 FROM summary_job WHERE session_id = ? AND status IN('pending','running')), "
+            "EXISTS(SELECT 1 FROM summary_job WHERE session_id = ? AND status = 'dead')",
+            (session_id, session_id)
+        )
+        has_open, has_dead = cur.fetchone()
+        if has_open:
+            return "pending"
+        if has_dead:
+            return "failed"
+        return None
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in get_summary_job_state_for_session:", e)
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+def get_summary_job_inputs(message_id):
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT b.session_id, b.content, u.content, u.connected_from FROM message b "
+            "JOIN message u ON CAST(b.connected_from AS INTEGER) = u.id "
+            "WHERE b.id = ? AND b.sender = 'bot'",
+            (message_id,)
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        session_id, reply, message, previous_id = row
+        return {
+            "session_id": session_id,
+            "message": message,
+            "reply": reply,
+            "previous_message_id": previous_id if previous_id and previous_id != "main" else None
+        }
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in get_summary_job_inputs:", e)
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+def get_branch_context(message_id, max_messages=60):
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        # Walk up connected_from until the nearest checkpoint, or the nearest legacy rolling summary
+        # (summary_level NULL), which already covers everything before it.
+        cur.execute("""
+            WITH RECURSIVE ancestry(id, sender, content, summary, summary_level, checkpoint, connected_from, depth) AS (
+                SELECT m.id, m.sender, m.content, m.summary, m.summary_level, c.summary, m.connected_from, 0
+                FROM message m LEFT JOIN summary_checkpoint c ON c.message_id = m.id
+                WHERE m.id = ?
+                UNION ALL
+                SELECT m.id, m.sender, m.content, m.summary, m.summary_level, c.summary, m.connected_from, a.depth + 1
+                FROM message m JOIN ancestry a ON m.id = CAST(a.connected_from AS INTEGER)
+                LEFT JOIN summary_checkpoint c ON c.message_id = m.id
+                WHERE a.depth < ? AND a.checkpoint IS NULL
+                  AND NOT (a.sender = 'bot' AND a.summary_level IS NULL
+                           AND a.summary IS NOT NULL AND a.summary NOT IN ('', 'failed'))
+            )
+            SELECT sender, content, summary, summary_level, checkpoint FROM ancestry ORDER BY depth
+        """, (message_id, max_messages))
+        summary = ""
+        messages = []
+        turn_summaries = 0
+        skip_user = False
+        for sender, content, message_summary, summary_level, checkpoint in cur.fetchall():
+            if checkpoint is not None:
+                summary = checkpoint
+                break
+            has_summary = sender == "bot" and message_summary and message_summary != "failed"
+            if has_summary and summary_level is None:
+                summary = message_summary
+                break
+            if has_summary:
+                # A turn summary covers this reply and the user message before it.
+                messages.append(("turn", message_summary))
+                turn_summaries += 1
+                skip_user = True
+                continue
+            if sender == "user" and skip_user:
+                skip_user = False
+                continue
+            skip_user = False
+            messages.append((sender, content))
+        messages.reverse()
+        return {"summary": summary, "messages": messages, "turn_summaries": turn_summaries}
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in get_branch_context:", e)
+        return {"summary": "", "messages": [], "turn_summaries": 0}
+    finally:
+        cur.close()
+        conn.close()
+
+def initialize_summary_checkpoint_table():
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        cur.execute("PRAGMA table_info(message)")
+        if "summary_level" not in [row[1] for row in cur.fetchall()]:
+            cur.execute("ALTER TABLE message ADD COLUMN summary_level TEXT")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS summary_checkpoint (
+                id             INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id     INTEGER NOT NULL,
+                message_id     INTEGER NOT NULL UNIQUE,
+                covered_turns  INTEGER NOT NULL,
+                summary        TEXT    NOT NULL,
+                created_at     DATETIME NOT NULL,
+                FOREIGN KEY(message_id)
+                  REFERENCES message(id)
+                  ON DELETE CASCADE
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_checkpoint_session_id ON summary_checkpoint(session_id)")
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in initialize_summary_checkpoint_table:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def update_message_summary(message_id, summary, summary_level=None):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE message SET summary = ?, summary_level = ? WHERE id = ?",
+            (summary, summary_level, message_id)
+        )
+        conn.commit()
+        return cur.rowcount == 1
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in update_message_summary:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def store_summary_checkpoint(session_id, message_id, covered_turns, summary):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO summary_checkpoint (session_id, message_id, covered_turns, summary, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(message_id) DO UPDATE SET covered_turns = excluded.covered_turns, summary = excluded.summary, "
+            "created_at = excluded.created_at",
+            (session_id, message_id, covered_turns, summary, datetime.datetime.now(datetime.timezone.utc).isoformat())
+        )
+        conn.commit()
+        if debugging:
+            print(f"Stored summary checkpoint at message {message_id} covering {covered_turns} turns")
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in store_summary_checkpoint:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def requeue_failed_summaries(limit, cooldown_seconds, max_sweeps):
+    conn = sqlite3.connect('database.sqlite', timeout=10)
+    cur = conn.cursor()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cooled_before = (now - datetime.timedelta(seconds=cooldown_seconds)).isoformat()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            "SELECT m.id, m.session_id, j.id FROM message m "
+            "LEFT JOIN summary_job j ON j.message_id = m.id "
+            "WHERE m.summary = 'failed' AND m.sender = 'bot' "
+            "AND (j.id IS NULL OR (j.status = 'dead' AND j.sweep_count < ? AND j.available_at < ?)) "
+            "ORDER BY m.created_at DESC LIMIT ?",
+            (max_sweeps, cooled_before, limit)
+        )
+        rows = cur.fetchall()
+        for message_id, session_id, job_id in rows:
+            if job_id is None:
+                cur.execute(
+                    "INSERT INTO summary_job (message_id, session_id, needs_title, status, attempts, available_at, sweep_count, created_at) "
+                    "VALUES (?, ?, 0, 'pending', 0, ?, 1, ?)",
+                    (message_id, session_id, now.isoformat(), now.isoformat())
+                )
+            else:
+                cur.execute(
+                    "UPDATE summary_job SET status = 'pending', attempts = 0, available_at = ?, sweep_count = sweep_count + 1 "
+                    "WHERE id = ?",
+                    (now.isoformat(), job_id)
+                )
+        conn.commit()
+        return len(rows)
+    except sqlite3.Error as e:
+        conn.rollback()
+        if debugging:
+            print("SQLite error in requeue_failed_summaries:", e)
+        return 0
+    finally:
+        cur.close()
+        conn.close()
+
+def initialize_search_cache_table():
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                cache_key    TEXT    PRIMARY KEY,
+                result       TEXT    NOT NULL,
+                fresh_until  REAL    NOT NULL,
+                stale_until  REAL    NOT NULL,
+                created_at   DATETIME NOT NULL
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_stale_until ON search_cache(stale_until)")
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in initialize_search_cache_table:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def get_search_cache_entry(cache_key, now):
+    conn = sqlite3.connect('database.sqlite', timeout=5)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT result, fresh_until, stale_until FROM search_cache WHERE cache_key = ? AND stale_until > ?",
+            (cache_key, now)
+        )
+        return cur.fetchone()
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in get_search_cache_entry:", e)
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+def store_search_cache_entry(cache_key, result, fresh_until, stale_until, now):
+    conn = sqlite3.connect('database.sqlite', timeout=5)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO search_cache (cache_key, result, fresh_until, stale_until, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(cache_key) DO UPDATE SET result = excluded.result, fresh_until = excluded.fresh_until, "
+            "stale_until = excluded.stale_until, created_at = excluded.created_at",
+            (cache_key, result, fresh_until, stale_until, datetime.datetime.now(datetime.timezone.utc).isoformat())
+        )
+        cur.execute("DELETE FROM search_cache WHERE stale_until <= ?", (now,))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in store_search_cache_entry:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
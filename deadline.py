@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+summary_timeout_seconds = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "120"))
+title_timeout_seconds = float(os.getenv("TITLE_TIMEOUT_SECONDS", "30"))
+
+class DeadlineExceededError(Exception):
+    def __init__(self, message, error_type="deadline_exceeded"):
+        self.message = message
+        self.error_type = error_type
+        super().__init__(self.message)
+
+class Deadline:
+    # Carried by a single call from call_ai_api down to the HTTP request, so every
+    # wait (rate limiter, retries, backoff, socket timeout) draws on the same budget.
+    # Children share the parent's expiry and see its cancellation, but can be
+    # cancelled on their own (e.g. the losing side of a hedged call).
+    def __init__(self, seconds=None, parent=None):
+        self.parent = parent
+        self.expires_at = None if seconds is None else time.time() + seconds
+        if parent is not None and parent.expires_at is not None:
+            self.expires_at = parent.expires_at if self.expires_at is None else min(self.expires_at, parent.expires_at)
+        self._cancelled = threading.Event()
+
+    def child(self, seconds=None):
+        return Deadline(seconds, parent=self)
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled())
+
+    def done(self):
+        return self.cancelled() or self.expired()
+
+    def timeout_for(self, default_timeout):
+        remaining = self.remaining()
+        if remaining is None:
+            return default_timeout
+        return min(default_timeout, remaining)
+
+    def check(self, what="call"):
+        if self.cancelled():
+            raise DeadlineExceededError(f"{what} cancelled", error_type="cancelled")
+        if self.expired():
+            raise DeadlineExceededError(f"{what} deadline exceeded")
@@ -1,25 +1,139 @@
+import asyncio
 import os
-import re
 import json
+import time
+import httpx
 import requests
 from dotenv import load_dotenv
 from typing import List, Dict
-from tools import AVAILABLE_TOOLS, execute_tool
+from tools import apply_tool_intent, execute_tools, openai_tool_specs, parse_tool_arguments, native_tool_calling, max_tool_rounds
+from circuit_breaker import get_breaker
+from latency_stats import get_adaptive_timeout
+from retry_budget import record_first_attempt, try_acquire_retry
+from deadline import DeadlineExceededError
 
 load_dotenv()
 debugging = os.getenv("debugging", "false").lower() == "true"
 
-def call_deepseek_api(
-    messages: List[Dict[str, str]],
-    model: str = "deepseek-chat",
-    temperature: float = 0.3,
-    candidate_count: int = 1,
-    use_tools: bool = False
-) -> str:
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise RuntimeError("DEEPSEEK_API_KEY environment variable is not set")
+DEEPSEEK_CHAT_URL = "https://api.deepseek.com/v1/chat/completions"
+deepseek_async_max_connections = int(os.getenv("DEEPSEEK_ASYNC_MAX_CONNECTIONS", "200"))
+max_retries = 3
+
+_async_client = None
+
+def _get_async_client():
+    # One pooled client for the ASGI app's event loop; connections are reused across chats.
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=deepseek_async_max_connections,
+            max_keepalive_connections=deepseek_async_max_connections
+        ))
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+def _retry_backoff(attempt, breaker, deadline):
+    if deadline is not None:
+        deadline.check("DeepSeek API call")
+
+    if debugging and attempt > 0:
+        print(f"   Retry attempt {attempt + 1}/{max_retries + 1}")
+
+    if attempt == 0:
+        record_first_attempt("deepseek_api")
+        return 0
+    if breaker.is_open():
+        raise DeepSeekAPIError("DeepSeek API circuit open, not retrying after timeout")
+    if not try_acquire_retry("deepseek_api"):
+        raise DeepSeekAPIError("DeepSeek API timeout, retry budget exhausted", error_type="timeout")
+
+    backoff_time = min(2 ** attempt, 8)  # Max 8 seconds
+    if deadline is not None and deadline.remaining() is not None and deadline.remaining() <= backoff_time:
+        raise DeadlineExceededError("DeepSeek API deadline exceeded before retry")
+    if debugging:
+        print(f"   Waiting {backoff_time}s before retry...")
+    return backoff_time
+
+def _retry_or_raise(attempt, e, error_type):
+    if attempt < max_retries:
+        if debugging:
+            print(f"   Timeout/connection error on attempt {attempt + 1}, retrying...")
+        return
+    if debugging:
+        print("   All retry attempts failed")
+    raise DeepSeekAPIError(f"DeepSeek API timeout after {max_retries + 1} attempts: {str(e)}", error_type=error_type)
+
+def _read_response(response):
+    if debugging:
+        print(f"   DeepSeek API response status: {response.status_code}")
+    
+    response.raise_for_status()
+    
+    result = response.json()
+    
+    if debugging:
+        print(f"   DeepSeek API response: {json.dumps(result, indent=2)[:500]}...")
+    
+    return result
+
+def _post_chat_completion(headers, payload, timeout, deadline=None):
+    breaker = get_breaker("deepseek")
 
+    if debugging:
+        print(f"   DeepSeek API request: {json.dumps(payload, indent=2)[:500]}...")
+    
+    for attempt in range(max_retries + 1):
+        try:
+            backoff_time = _retry_backoff(attempt, breaker, deadline)
+            if backoff_time:
+                time.sleep(backoff_time)
+            
+            response = requests.post(
+                DEEPSEEK_CHAT_URL,
+                headers=headers,
+                json=payload,
+                timeout=deadline.timeout_for(timeout) if deadline is not None else timeout
+            )
+            break
+            
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            _retry_or_raise(attempt, e, "timeout" if isinstance(e, requests.exceptions.Timeout) else "transport")
+    
+    return _read_response(response)
+
+async def _post_chat_completion_async(headers, payload, timeout, deadline=None):
+    breaker = get_breaker("deepseek")
+
+    if debugging:
+        print(f"   DeepSeek API async request: {json.dumps(payload, indent=2)[:500]}...")
+
+    for attempt in range(max_retries + 1):
+        try:
+            backoff_time = _retry_backoff(attempt, breaker, deadline)
+            if backoff_time:
+                await asyncio.sleep(backoff_time)
+
+            response = await _get_async_client().post(
+                DEEPSEEK_CHAT_URL,
+                headers=headers,
+                json=payload,
+                timeout=deadline.timeout_for(timeout) if deadline is not None else timeout
+            )
+            break
+
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            _retry_or_raise(attempt, e, "timeout" if isinstance(e, httpx.TimeoutException) else "transport")
+
+    return _read_response(response)
+
+def _chat_steps(api_key, messages, model, temperature, use_tools, max_tokens):
+    # The request/tool-round protocol, shared by the blocking and the async client. It yields
+    # ("intent", text), ("post", headers, payload, timeout) or ("tools", calls) and is sent the result.
     openai_messages = []
     for m in messages:
         role = "user" if m["author"] in ["user", "system"] else "assistant"
@@ -28,311 +142,148 @@ def call_deepseek_api(
             "content": m["content"]
         })
 
-    try:
-        if use_tools and openai_messages:
-            if debugging:
-                print(f" DEEPSEEK API DEBUG - Tool processing enabled")
-            
-            full_message = openai_messages[-1]["content"]
-            
-            if debugging:
-                print(f"   Full message length: {len(full_message)} characters")
-                print(f"   Full message preview: {full_message[:100]}...")
-            
-            user_message = full_message
-            if "Current message:" in full_message:
-                current_msg_match = re.search(r"Current message:\s*(.+?)(?:\n\n|$)", full_message, re.DOTALL)
-                if current_msg_match:
-                    user_message = current_msg_match.group(1).strip()
-                    if debugging:
-                        print(f"   Extracted current message: '{user_message}'")
-            elif "User message:" in full_message:
-                user_msg_match = re.search(r"User message:\s*(.+?)(?:\n\n|$)", full_message, re.DOTALL)
-                if user_msg_match:
-                    user_message = user_msg_match.group(1).strip()
-                    if debugging:
-                        print(f"   Extracted user message: '{user_message}'")
-            else:
-                if debugging:
-                    print(f"   Using full message as user message")
-            
-            user_message_lower = user_message.lower()
-            
-            if debugging:
-                print(f"   Analyzing message: '{user_message}'")
-            
-            search_keywords = [
-                "search web", "web search", "search for", "look up", 
-                "find information", "current", "latest", "recent", 
-                "what is the", "exchange rate", "news about", "information about",
-                "find", "search", "whats"
-            ]
-            
-            found_keywords = [kw for kw in search_keywords if kw in user_message_lower]
-            should_search = len(found_keywords) > 0 and (
-                "search" in user_message_lower or 
-                "find" in user_message_lower or 
-                "current" in user_message_lower or
-                "latest" in user_message_lower or
-                "what is" in user_message_lower
-            )
-            
-            if debugging:
-                print(f"   Search keywords found: {found_keywords}")
-                print(f"   Should search: {should_search}")
-            
-            if should_search:
-                if debugging:
-                    print(f"    INITIATING WEB SEARCH")
-                
-                search_query = user_message
-                
-                if debugging:
-                    print(f"   Original search query: '{search_query}'")
-                
-                patterns_to_remove = [
-                    r"search\s+(web\s+)?for\s+",
-                    r"look\s+up\s+",
-                    r"find\s+information\s+(about\s+)?",
-                    r"web\s+search\s*",
-                    r"search\s+the\s+web\s+for\s+",
-                    r"can\s+you\s+search\s+(for\s+)?",
-                    r"please\s+search\s+(for\s+)?",
-                    r"\.?\s*search\s+web\s*\.?$"
-                ]
-                
-                for pattern in patterns_to_remove:
-                    old_query = search_query
-                    search_query = re.sub(pattern, "", search_query, flags=re.IGNORECASE).strip()
-                    if old_query != search_query and debugging:
-                        print(f"   Pattern '{pattern}' removed: '{old_query}' → '{search_query}'")
-                
-                old_query = search_query
-                search_query = re.sub(r'[.!?]+\s*$', '', search_query).strip()
-                if old_query != search_query and debugging:
-                    print(f"   Punctuation removed: '{old_query}' → '{search_query}'")
-                
-                if len(search_query) > 2:
-                    if debugging:
-                        print(f"   Final search query: '{search_query}' (length: {len(search_query)})")
-                        print(f"   Calling search tool...")
-                    
-                    search_result = execute_tool("search_web", {"query": search_query})
-                    
-                    if isinstance(search_result, dict) and search_result.get("success"):
-                        if debugging:
-                            print(f"    Search successful! Processing {len(search_result.get('results', []))} results")
-                        
-                        search_info = f"Based on my web search for '{search_query}', here's what I found:\n\n"
-                        
-                        if search_result.get("results"):
-                            for i, result in enumerate(search_result["results"][:3], 1):
-                                title = result.get('title', 'No title')
-                                snippet = result.get('snippet', 'No description available')
-                                snippet = re.sub(r'<[^>]+>', '', snippet)
-                                search_info += f"{i}. **{title}**\n{snippet}\n\n"
-                                
-                                if debugging:
-                                    print(f"     Result {i}: {title[:50]}...")
-                        
-                        if "Current message:" in full_message:
-                            enhanced_message = re.sub(
-                                r"(Current message:\s*)(.+?)(\n\n.*)?$", 
-                                f"\\1{user_message}\\n\\nSearch results:\\n{search_info}\\n\\nPlease provide a helpful response based on this information.\\3", 
-                                full_message, 
-                                flags=re.DOTALL
-                            )
-                        else:
-                            enhanced_message = f"User asked: {user_message}\n\nSearch results:\n{search_info}\n\nPlease provide a helpful response based on this information."
-                        
-                        if debugging:
-                            print(f"    Enhanced message created (length: {len(enhanced_message)})")
-                        
-                        openai_messages[-1]["content"] = enhanced_message
-                    else:
-                        if debugging:
-                            print(f"    Search failed: {search_result.get('error', 'Unknown error')}")
-                else:
-                    if debugging:
-                        print(f"    Search query too short: '{search_query}' (length: {len(search_query)})")
-            
-            has_math_keywords = any(keyword in user_message_lower for keyword in [
-                "calculate", "what is", "solve", "times", "plus", "minus", "divided", "multiply"
-            ])
-            has_math_symbols = any(symbol in user_message for symbol in ["+", "-", "*", "/", "=", "^"])
-            has_numbers = bool(re.search(r'\d', user_message))
-            
-            if debugging:
-                print(f"    Math check: keywords={has_math_keywords}, symbols={has_math_symbols}, numbers={has_numbers}")
-            
-            if has_math_keywords or (has_math_symbols and has_numbers):
-                if debugging:
-                    print(f"    CHECKING FOR MATH EXPRESSIONS")
-                
-                math_patterns = [
-                    r"calculate\s+(.+)",
-                    r"what\s+is\s+(.+)",
-                    r"(\d+[\+\-\*/\^\(\)\s\d\.]+[\d\.]+)\s*[=?]?",
-                    r"solve\s+(.+)",
-                    r"(\d+)\s+(times|multiplied\s+by|plus|minus|divided\s+by)\s+(\d+)",
-                    r"(\d+)\s*[\*\+\-\/\^]\s*(\d+)"
-                ]
-            
-                for i, pattern in enumerate(math_patterns):
-                    match = re.search(pattern, user_message_lower)
-                    if match:
-                        if i == 4:
-                            num1, operator, num2 = match.groups()
-                            expression = f"{num1} {operator} {num2}"
-                            if debugging:
-                                print(f"   Pattern {i+1} matched (natural language): '{num1} {operator} {num2}'")
-                        else:
-                            expression = match.group(1).strip()
-                            if debugging:
-                                print(f"   Pattern {i+1} matched: '{pattern}' → '{expression}'")
-                        
-                        original_expression = expression
-                        expression = expression.replace("times", "*")
-                        expression = expression.replace("multiplied by", "*") 
-                        expression = expression.replace("plus", "+")
-                        expression = expression.replace("minus", "-")
-                        expression = expression.replace("divided by", "/")
-                        expression = expression.replace("×", "*")
-                        expression = expression.replace("÷", "/")
-                        expression = expression.replace("^", "**")
-                        
-                        if debugging and original_expression != expression:
-                            print(f"   Natural language converted: '{original_expression}' → '{expression}'")
-                        
-                        has_numbers = bool(re.search(r'\d', expression))
-                        has_operators = any(op in expression for op in ['+', '-', '*', '/', '**', '(', ')'])
-                        is_long_enough = len(expression.replace(' ', '')) > 2
-                        
-                        if debugging:
-                            print(f"   Has numbers: {has_numbers}, Has operators: {has_operators}, Long enough: {is_long_enough}")
-                        
-                        if has_numbers and (has_operators or "times" in original_expression or "plus" in original_expression):
-                            if debugging:
-                                print(f"     INITIATING MATH CALCULATION")
-                                print(f"   Expression: '{expression}'")
-                            
-                            math_result = execute_tool("calculate_math", {"expression": expression})
-                            
-                            if isinstance(math_result, dict) and math_result.get("success"):
-                                result_value = math_result.get('result')
-                                calc_info = f"\nCalculation result: {original_expression} = {result_value}\n"
-                                
-                                if debugging:
-                                    print(f"    Math calculation successful: {result_value}")
-                                
-                                original_content = openai_messages[-1]["content"]
-                                enhanced_content = f"{original_content}\n{calc_info}\nPlease provide a response that includes this calculation."
-                                openai_messages[-1]["content"] = enhanced_content
-                            else:
-                                if debugging:
-                                    print(f"    Math calculation failed: {math_result.get('error', 'Unknown error')}")
-                            break
-                        elif debugging:
-                            print(f"     Expression doesn't qualify as math: '{expression}'")
-                else:
-                    if debugging:
-                        print(f"   No math expressions detected")
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": model,
-            "messages": openai_messages,
-            "temperature": temperature,
-            "max_tokens": 4000,
-            "stream": False
-        }
-        
-        if debugging:
-            print(f"   DeepSeek API request: {json.dumps(payload, indent=2)[:500]}...")
-        
-        base_timeout = 45 if use_tools else 25
-        message_length = sum(len(msg["content"]) for msg in openai_messages)
-        
-        if message_length > 2000:
-            timeout = base_timeout + 30
-        elif message_length > 1000:
-            timeout = base_timeout + 15
-        else:
-            timeout = base_timeout
-            
-        timeout = min(timeout, 120)
-        
-        max_retries = 3
-        
-        if debugging:
-            print(f"   Using timeout: {timeout}s (message length: {message_length} chars)")
-        
-        for attempt in range(max_retries + 1):
-            try:
-                if debugging and attempt > 0:
-                    print(f"   Retry attempt {attempt + 1}/{max_retries + 1}")
-                
-                if attempt > 0:
-                    import time
-                    backoff_time = min(2 ** attempt, 8)  # Max 8 seconds
-                    if debugging:
-                        print(f"   Waiting {backoff_time}s before retry...")
-                    time.sleep(backoff_time)
-                
-                response = requests.post(
-                    "https://api.deepseek.com/v1/chat/completions",
-                    headers=headers,
-                    json=payload,
-                    timeout=timeout
-                )
-                break
-                
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                if attempt < max_retries:
-                    if debugging:
-                        print(f"   Timeout/connection error on attempt {attempt + 1}, retrying with longer timeout...")
-                    timeout = min(timeout + 20, 150)
-                    continue
-                else:
-                    if debugging:
-                        print(f"   All retry attempts failed, using fallback response")
-                    return "I'm sorry, but my response is taking longer than expected. This might be due to high server load. Please try asking your question again, or try rephrasing it in a simpler way."
-        
-        if debugging:
-            print(f"   DeepSeek API response status: {response.status_code}")
-        
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        if debugging:
-            print(f"   DeepSeek API response: {json.dumps(result, indent=2)[:500]}...")
-        
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"]
-        else:
-            raise DeepSeekAPIError("No response choices found in API result")
+    native_tools = use_tools and native_tool_calling
+    if use_tools and not native_tools and openai_messages:
+        openai_messages[-1]["content"] = yield ("intent", openai_messages[-1]["content"])
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
     
-    except requests.exceptions.RequestException as e:
-        error_msg = f"DeepSeek API request error: {e}"
-        print(error_msg)
-        if debugging:
-            import traceback
-            traceback.print_exc()
-        raise DeepSeekAPIError(f"DeepSeek API request failed: {str(e)}")
+    payload = {
+        "model": model,
+        "messages": openai_messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens or 4000,
+        "stream": False
+    }
+    if native_tools:
+        payload["tools"] = openai_tool_specs()
     
-    except Exception as e:
-        error_msg = f"Error calling DeepSeek API: {e}"
-        print(error_msg)
+    timeout = get_adaptive_timeout("deepseek", "tools" if use_tools else "plain")
+    
+    if debugging:
+        print(f"   Using adaptive timeout: {timeout:.1f}s")
+    
+    rounds = max_tool_rounds if native_tools else 0
+    for tool_round in range(rounds + 1):
+        if native_tools and tool_round == rounds:
+            # Out of rounds: the model has to answer with what it has.
+            payload["tool_choice"] = "none"
+
+        result = yield ("post", headers, payload, timeout)
+        if "choices" not in result or len(result["choices"]) == 0:
+            raise DeepSeekAPIError("No response choices found in API result")
+
+        message = result["choices"][0]["message"]
+        tool_calls = message.get("tool_calls") if native_tools else None
+        if not tool_calls:
+            return message["content"]
+
         if debugging:
-            import traceback
-            traceback.print_exc()
-        
-        raise DeepSeekAPIError(f"DeepSeek API call failed: {str(e)}")
+            print(f"   Tool round {tool_round + 1}: model requested {[call['function']['name'] for call in tool_calls]}")
+        openai_messages.append(message)
+        tool_results = yield ("tools", [(call["function"]["name"], parse_tool_arguments(call["function"].get("arguments"))) for call in tool_calls])
+        for call, tool_result in zip(tool_calls, tool_results):
+            openai_messages.append({
+                "role": "tool",
+                "tool_call_id": call["id"],
+                "content": json.dumps(tool_result, ensure_ascii=False, default=str)
+            })
+
+    raise DeepSeekAPIError("DeepSeek API kept requesting tools after the last round")
+
+def _api_key():
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise RuntimeError("DEEPSEEK_API_KEY environment variable is not set")
+    return api_key
+
+def _request_error_type(e):
+    response = getattr(e, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is not None:
+        return "server_error" if status_code >= 500 else "client_error"
+    if isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return "timeout"
+    return "transport"
+
+def _wrap_error(e, request_errors):
+    if isinstance(e, (DeepSeekAPIError, DeadlineExceededError)):
+        return e
+    error_type = "api_error"
+    if isinstance(e, request_errors):
+        print(f"DeepSeek API request error: {e}")
+        message = f"DeepSeek API request failed: {str(e)}"
+        error_type = _request_error_type(e)
+    else:
+        print(f"Error calling DeepSeek API: {e}")
+        message = f"DeepSeek API call failed: {str(e)}"
+    if debugging:
+        import traceback
+        traceback.print_exc()
+    return DeepSeekAPIError(message, error_type=error_type)
+
+def call_deepseek_api(
+    messages: List[Dict[str, str]],
+    model: str = "deepseek-chat",
+    temperature: float = 0.3,
+    candidate_count: int = 1,
+    use_tools: bool = False,
+    deadline=None,
+    max_tokens: int = 4000,
+    tool_intent=None
+) -> str:
+    steps = _chat_steps(_api_key(), messages, model, temperature, use_tools, max_tokens)
+    try:
+        step = next(steps)
+        while True:
+            if step[0] == "post":
+                result = _post_chat_completion(*step[1:], deadline)
+            elif step[0] == "tools":
+                result = execute_tools(step[1], deadline)
+            else:
+                result = apply_tool_intent(step[1], tool_intent, deadline)
+            step = steps.send(result)
+    except StopIteration as done:
+        return done.value
+    except Exception as e:
+        error = _wrap_error(e, requests.exceptions.RequestException)
+        if error is e:
+            raise
+        raise error
+
+async def call_deepseek_api_async(
+    messages: List[Dict[str, str]],
+    model: str = "deepseek-chat",
+    temperature: float = 0.3,
+    candidate_count: int = 1,
+    use_tools: bool = False,
+    deadline=None,
+    max_tokens: int = 4000,
+    tool_intent=None
+) -> str:
+    # Only the HTTP round trips are awaited on the event loop; tool execution keeps using the
+    # shared tool pool through a worker thread.
+    steps = _chat_steps(_api_key(), messages, model, temperature, use_tools, max_tokens)
+    try:
+        step = next(steps)
+        while True:
+            if step[0] == "post":
+                result = await _post_chat_completion_async(*step[1:], deadline)
+            elif step[0] == "tools":
+                result = await asyncio.to_thread(execute_tools, step[1], deadline)
+            else:
+                result = await asyncio.to_thread(apply_tool_intent, step[1], tool_intent, deadline)
+            step = steps.send(result)
+    except StopIteration as done:
+        return done.value
+    except Exception as e:
+        error = _wrap_error(e, httpx.HTTPError)
+        if error is e:
+            raise
+        raise error
 
 class DeepSeekAPIError(Exception):
     def __init__(self, message, error_type="api_error"):
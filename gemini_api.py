@@ -1,27 +1,25 @@
 
+import asyncio
 import os
-import re
+import httpx
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
-from typing import List, Dict
-from tools import AVAILABLE_TOOLS, execute_tool
+from google.genai import types, errors as genai_errors
+from typing import List, Dict, Optional
+from tools import apply_tool_intent, execute_tools, tool_declarations, native_tool_calling, max_tool_rounds
+from latency_stats import get_adaptive_timeout
+from retry_budget import record_first_attempt
+from deadline import DeadlineExceededError
 
 load_dotenv()
 debugging = os.getenv("debugging", "false").lower() == "true"
 
-def call_gemini_api(
-    messages: List[Dict[str, str]],
-    model: str = "gemini-2.0-flash-exp",
-    temperature: float = 0.3,
-    candidate_count: int = 1,
-    use_tools: bool = False
-) -> str:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY environment variable is not set")
-
-    client = genai.Client(api_key=api_key)
+def _generate_steps(messages, temperature, candidate_count, use_tools, deadline, max_tokens):
+    # The request/tool-round protocol, shared by the blocking and the async client. It yields
+    # ("intent", text), ("generate", contents, config) or ("tools", calls) and is sent the result.
+    timeout = get_adaptive_timeout("gemini", "tools" if use_tools else "plain")
+    if debugging:
+        print(f"Using adaptive Gemini timeout: {timeout:.1f}s")
 
     role_map = {
         "user": "user",
@@ -40,245 +38,148 @@ def call_gemini_api(
             )
         )
 
-    try:
-        if use_tools and contents:
-            if debugging:
-                print(f" GEMINI API DEBUG - Tool processing enabled")
-            
-            full_message = contents[-1].parts[0].text
-            
-            if debugging:
-                print(f"   Full message length: {len(full_message)} characters")
-                print(f"   Full message preview: {full_message[:100]}...")
-            
-            user_message = full_message
-            if "Current message:" in full_message:
+    native_tools = use_tools and native_tool_calling
+    if use_tools and not native_tools and contents:
+        text = yield ("intent", contents[-1].parts[0].text)
+        contents[-1] = types.Content(
+            role="user",
+            parts=[types.Part.from_text(text=text)]
+        )
 
-                current_msg_match = re.search(r"Current message:\s*(.+?)(?:\n\n|$)", full_message, re.DOTALL)
-                if current_msg_match:
-                    user_message = current_msg_match.group(1).strip()
-                    if debugging:
-                        print(f"   Extracted current message: '{user_message}'")
-            elif "User message:" in full_message:
+    config = types.GenerateContentConfig(
+        temperature=temperature,
+        candidate_count=candidate_count,
+        max_output_tokens=max_tokens
+    )
+    if native_tools:
+        config.tools = [types.Tool(function_declarations=tool_declarations())]
+        config.automatic_function_calling = types.AutomaticFunctionCallingConfig(disable=True)
 
-                user_msg_match = re.search(r"User message:\s*(.+?)(?:\n\n|$)", full_message, re.DOTALL)
-                if user_msg_match:
-                    user_message = user_msg_match.group(1).strip()
-                    if debugging:
-                        print(f"   Extracted user message: '{user_message}'")
-            else:
-                if debugging:
-                    print(f"   Using full message as user message")
-            
-            user_message_lower = user_message.lower()
-            
-            if debugging:
-                print(f"   Analyzing message: '{user_message}'")
-            
-            search_keywords = [
-                "search web", "web search", "search for", "look up", 
-                "find information", "current", "latest", "recent", 
-                "what is the", "exchange rate", "news about", "information about",
-                "find", "search", "whats"
-            ]
-            
-            found_keywords = [kw for kw in search_keywords if kw in user_message_lower]
-            should_search = len(found_keywords) > 0 and (
-                "search" in user_message_lower or 
-                "find" in user_message_lower or 
-                "current" in user_message_lower or
-                "latest" in user_message_lower or
-                "what is" in user_message_lower
+    rounds = max_tool_rounds if native_tools else 0
+    for tool_round in range(rounds + 1):
+        if native_tools and tool_round == rounds:
+            # Out of rounds: the model has to answer with what it has.
+            config.tool_config = types.ToolConfig(
+                function_calling_config=types.FunctionCallingConfig(mode="NONE")
             )
-            
-            if debugging:
-                print(f"   Search keywords found: {found_keywords}")
-                print(f"   Should search: {should_search}")
-            
-            if should_search:
-                if debugging:
-                    print(f"    INITIATING WEB SEARCH")
-                
-                search_query = user_message
-                
-                if debugging:
-                    print(f"   Original search query: '{search_query}'")
-                
-                patterns_to_remove = [
-                    r"search\s+(web\s+)?for\s+",
-                    r"look\s+up\s+",
-                    r"find\s+information\s+(about\s+)?",
-                    r"web\s+search\s*",
-                    r"search\s+the\s+web\s+for\s+",
-                    r"can\s+you\s+search\s+(for\s+)?",
-                    r"please\s+search\s+(for\s+)?",
-                    r"\.?\s*search\s+web\s*\.?$"
-                ]
-                
-                for pattern in patterns_to_remove:
-                    old_query = search_query
-                    search_query = re.sub(pattern, "", search_query, flags=re.IGNORECASE).strip()
-                    if old_query != search_query and debugging:
-                        print(f"   Pattern '{pattern}' removed: '{old_query}' → '{search_query}'")
-                
-                old_query = search_query
-                search_query = re.sub(r'[.!?]+\s*$', '', search_query).strip()
-                if old_query != search_query and debugging:
-                    print(f"   Punctuation removed: '{old_query}' → '{search_query}'")
-                
-                if len(search_query) > 2:
-                    if debugging:
-                        print(f"   Final search query: '{search_query}' (length: {len(search_query)})")
-                        print(f"   Calling search tool...")
-                    
-                    search_result = execute_tool("search_web", {"query": search_query})
-                    
-                    if isinstance(search_result, dict) and search_result.get("success"):
-                        if debugging:
-                            print(f"    Search successful! Processing {len(search_result.get('results', []))} results")
-                        
-                        search_info = f"Based on my web search for '{search_query}', here's what I found:\n\n"
-                        
-                        if search_result.get("results"):
-                            for i, result in enumerate(search_result["results"][:3], 1):
-                                title = result.get('title', 'No title')
-                                snippet = result.get('snippet', 'No description available')
 
-                                snippet = re.sub(r'<[^>]+>', '', snippet)
-                                search_info += f"{i}. **{title}**\n{snippet}\n\n"
-                                
-                                if debugging:
-                                    print(f"     Result {i}: {title[:50]}...")
-                        
-                        if "Current message:" in full_message:
+        # Tool calls may have used part of the budget, so size the HTTP timeout per round.
+        round_timeout = timeout
+        if deadline is not None:
+            deadline.check("Gemini API call")
+            round_timeout = deadline.timeout_for(timeout)
+        config.http_options = types.HttpOptions(timeout=max(1, int(round_timeout * 1000)))
+
+        if tool_round == 0:
+            record_first_attempt("gemini_api")
+        response = yield ("generate", contents, config)
+
+        function_calls = response.function_calls if native_tools else None
+        if not function_calls:
+            return response.text
+
+        if debugging:
+            print(f"   Tool round {tool_round + 1}: model requested {[call.name for call in function_calls]}")
+        contents.append(response.candidates[0].content)
+        tool_results = yield ("tools", [(call.name, dict(call.args or {})) for call in function_calls])
+        # Gemini only accepts "user" and "model" turns; function responses go in a user turn.
+        contents.append(types.Content(
+            role="user",
+            parts=[
+                types.Part.from_function_response(name=call.name, response={"result": tool_result})
+                for call, tool_result in zip(function_calls, tool_results)
+            ]
+        ))
+
+    raise GeminiAPIError("Gemini API kept requesting tools after the last round")
+
+def _api_key():
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY environment variable is not set")
+    return api_key
+
+def _error_type(e):
+    if isinstance(e, genai_errors.ServerError):
+        return "server_error"
+    if isinstance(e, (httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    if isinstance(e, (httpx.TransportError, ConnectionError)):
+        return "transport"
+    return "api_error"
 
-                            enhanced_message = re.sub(
-                                r"(Current message:\s*)(.+?)(\n\n.*)?$", 
-                                f"\\1{user_message}\\n\\nSearch results:\\n{search_info}\\n\\nPlease provide a helpful response based on this information.\\3", 
-                                full_message, 
-                                flags=re.DOTALL
-                            )
-                        else:
-                            enhanced_message = f"User asked: {user_message}\n\nSearch results:\n{search_info}\n\nPlease provide a helpful response based on this information."
-                        
-                        if debugging:
-                            print(f"    Enhanced message created (length: {len(enhanced_message)})")
-                        
-                        contents[-1] = types.Content(
-                            role="user",
-                            parts=[types.Part.from_text(text=enhanced_message)]
-                        )
-                    else:
-                        if debugging:
-                            print(f"    Search failed: {search_result.get('error', 'Unknown error')}")
-                else:
-                    if debugging:
-                        print(f"    Search query too short: '{search_query}' (length: {len(search_query)})")
-            
-            has_math_keywords = any(keyword in user_message_lower for keyword in [
-                "calculate", "what is", "solve", "times", "plus", "minus", "divided", "multiply"
-            ])
-            has_math_symbols = any(symbol in user_message for symbol in ["+", "-", "*", "/", "=", "^"])
-            has_numbers = bool(re.search(r'\d', user_message))
-            
-            if debugging:
-                print(f"    Math check: keywords={has_math_keywords}, symbols={has_math_symbols}, numbers={has_numbers}")
-            
-            if has_math_keywords or (has_math_symbols and has_numbers):
-                if debugging:
-                    print(f"    CHECKING FOR MATH EXPRESSIONS")
-                
-                math_patterns = [
-                    r"calculate\s+(.+)",
-                    r"what\s+is\s+(.+)",
-                    r"(\d+[\+\-\*/\^\(\)\s\d\.]+[\d\.]+)\s*[=?]?",
-                    r"solve\s+(.+)",
-                    r"(\d+)\s+(times|multiplied\s+by|plus|minus|divided\s+by)\s+(\d+)",
-                    r"(\d+)\s*[\*\+\-\/\^]\s*(\d+)"
-                ]
-            
-            for i, pattern in enumerate(math_patterns):
-                match = re.search(pattern, user_message_lower)
-                if match:
-                    if i == 4:
-                        num1, operator, num2 = match.groups()
-                        expression = f"{num1} {operator} {num2}"
-                        if debugging:
-                            print(f"   Pattern {i+1} matched (natural language): '{num1} {operator} {num2}'")
-                    else:
-                        expression = match.group(1).strip()
-                        if debugging:
-                            print(f"   Pattern {i+1} matched: '{pattern}' → '{expression}'")
-                    
-                    original_expression = expression
-                    expression = expression.replace("times", "*")
-                    expression = expression.replace("multiplied by", "*") 
-                    expression = expression.replace("plus", "+")
-                    expression = expression.replace("minus", "-")
-                    expression = expression.replace("divided by", "/")
-                    expression = expression.replace("×", "*")
-                    expression = expression.replace("÷", "/")
-                    expression = expression.replace("^", "**")
-                    
-                    if debugging and original_expression != expression:
-                        print(f"   Natural language converted: '{original_expression}' → '{expression}'")
-                    
-                    has_numbers = bool(re.search(r'\d', expression))
-                    has_operators = any(op in expression for op in ['+', '-', '*', '/', '**', '(', ')'])
-                    is_long_enough = len(expression.replace(' ', '')) > 2
-                    
-                    if debugging:
-                        print(f"   Has numbers: {has_numbers}, Has operators: {has_operators}, Long enough: {is_long_enough}")
-                    
-                    if has_numbers and (has_operators or "times" in original_expression or "plus" in original_expression):
-                        if debugging:
-                            print(f"     INITIATING MATH CALCULATION")
-                            print(f"   Expression: '{expression}'")
-                        
-                        math_result = execute_tool("calculate_math", {"expression": expression})
-                        
-                        if isinstance(math_result, dict) and math_result.get("success"):
-                            result_value = math_result.get('result')
-                            calc_info = f"\nCalculation result: {original_expression} = {result_value}\n"
-                            
-                            if debugging:
-                                print(f"    Math calculation successful: {result_value}")
-                            
-                            original_content = contents[-1].parts[0].text
-                            enhanced_content = f"{original_content}\n{calc_info}\nPlease provide a response that includes this calculation."
-                            contents[-1] = types.Content(
-                                role="user",
-                                parts=[types.Part.from_text(text=enhanced_content)]
-                            )
-                        else:
-                            if debugging:
-                                print(f"    Math calculation failed: {math_result.get('error', 'Unknown error')}")
-                        break
-                    elif debugging:
-                        print(f"     Expression doesn't qualify as math: '{expression}'")
+def _wrap_error(e):
+    print(f"Error calling Gemini API: {e}")
+    if debugging:
+        import traceback
+        traceback.print_exc()
+    return GeminiAPIError(f"Gemini API call failed: {str(e)}", error_type=_error_type(e))
+
+def call_gemini_api(
+    messages: List[Dict[str, str]],
+    model: str = "gemini-2.0-flash-exp",
+    temperature: float = 0.3,
+    candidate_count: int = 1,
+    use_tools: bool = False,
+    deadline=None,
+    max_tokens: Optional[int] = None,
+    tool_intent=None
+) -> str:
+    client = genai.Client(api_key=_api_key())
+    steps = _generate_steps(messages, temperature, candidate_count, use_tools, deadline, max_tokens)
+    try:
+        step = next(steps)
+        while True:
+            if step[0] == "generate":
+                result = client.models.generate_content(
+                    model=model,
+                    contents=step[1],
+                    config=step[2]
+                )
+            elif step[0] == "tools":
+                result = execute_tools(step[1], deadline)
             else:
-                if debugging:
-                    print(f"   No math expressions detected")
+                result = apply_tool_intent(step[1], tool_intent, deadline)
+            step = steps.send(result)
+    except StopIteration as done:
+        return done.value
+    except DeadlineExceededError:
+        raise
+    except Exception as e:
+        raise _wrap_error(e)
 
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                temperature=temperature,
-                candidate_count=candidate_count
-            )
-        )
-        
-        return response.text
-    
+async def call_gemini_api_async(
+    messages: List[Dict[str, str]],
+    model: str = "gemini-2.0-flash-exp",
+    temperature: float = 0.3,
+    candidate_count: int = 1,
+    use_tools: bool = False,
+    deadline=None,
+    max_tokens: Optional[int] = None,
+    tool_intent=None
+) -> str:
+    client = genai.Client(api_key=_api_key())
+    steps = _generate_steps(messages, temperature, candidate_count, use_tools, deadline, max_tokens)
+    try:
+        step = next(steps)
+        while True:
+            if step[0] == "generate":
+                result = await client.aio.models.generate_content(
+                    model=model,
+                    contents=step[1],
+                    config=step[2]
+                )
+            elif step[0] == "tools":
+                result = await asyncio.to_thread(execute_tools, step[1], deadline)
+            else:
+                result = await asyncio.to_thread(apply_tool_intent, step[1], tool_intent, deadline)
+            step = steps.send(result)
+    except StopIteration as done:
+        return done.value
+    except DeadlineExceededError:
+        raise
     except Exception as e:
-        error_msg = f"Error calling Gemini API: {e}"
-        print(error_msg)
-        if debugging:
-            import traceback
-            traceback.print_exc()
-        
-        raise GeminiAPIError(f"Gemini API call failed: {str(e)}")
+        raise _wrap_error(e)
 
 class GeminiAPIError(Exception):
     def __init__(self, message, error_type="api_error"):
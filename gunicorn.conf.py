@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# gunicorn -c gunicorn.conf.py
+wsgi_app = "wsgi:application"
+bind = f"{os.getenv('flaskIP', '127.0.0.1')}:{os.getenv('flaskPort', '5000')}"
+
+# Requests spend most of their time waiting on the AI provider, so each worker process runs
+# a pool of threads; one process per core spreads the CPU work (JSON, MinHash, SQLite) out.
+workers = int(os.getenv("GUNICORN_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT_SECONDS", "180"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT_SECONDS", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE_SECONDS", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Preloading imports the app and creates the tables once in the master; workers share the
+# loaded code copy-on-write and start their own background threads after the fork.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+def post_fork(server, worker):
+    from wsgi import start_background_services
+    start_background_services()
+    server.log.info(f"Worker {worker.pid} started background services")
+
+def worker_exit(server, worker):
+    from background_jobs import drain_background_jobs
+    drain_background_jobs()
@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import register_collector
+from deadline import Deadline
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+hedging_enabled = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+hedge_max_extra_percent = float(os.getenv("HEDGE_MAX_EXTRA_PERCENT", "10"))
+hedge_default_delay = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+hedge_min_delay = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1"))
+hedge_worker_threads = int(os.getenv("HEDGE_WORKER_THREADS", "64"))
+
+class HedgeBudget:
+    # Every primary call earns a fraction of a hedge token; each hedge spends a whole one,
+    # so extra calls can never exceed the configured percentage of primary calls.
+    def __init__(self, max_extra_percent, max_tokens=10.0):
+        self.ratio = max(0.0, max_extra_percent) / 100.0
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self.primary_calls = 0
+        self.hedged_calls = 0
+        self._lock = threading.Lock()
+
+    def record_primary_call(self):
+        with self._lock:
+            self.primary_calls += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def can_spend(self):
+        with self._lock:
+            return self.tokens >= 1.0
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            self.hedged_calls += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "primary_calls": self.primary_calls,
+                "hedged_calls": self.hedged_calls,
+                "tokens": round(self.tokens, 3)
+            }
+
+hedge_budget = HedgeBudget(hedge_max_extra_percent)
+hedge_stats = {"primary_wins": 0, "secondary_wins": 0}
+_hedge_stats_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=hedge_worker_threads, thread_name_prefix="hedge")
+
+def compute_hedge_delay(p95_latency):
+    if p95_latency is None:
+        return hedge_default_delay
+    return max(hedge_min_delay, p95_latency)
+
+def _record_winner(name):
+    with _hedge_stats_lock:
+        hedge_stats[f"{name}_wins"] += 1
+
+class _HedgeTimer:
+    # One thread fires each pending hedge at its due time, so waiting out the hedge delay
+    # holds no pool thread; the pool only runs hedges that actually fire.
+    def __init__(self):
+        self._due = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, fn):
+        with self._condition:
+            heapq.heappush(self._due, (time.time() + delay, next(self._sequence), fn))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hedge-timer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._due:
+                    self._condition.wait()
+                due_at, _, fn = self._due[0]
+                wait_time = due_at - time.time()
+                if wait_time > 0:
+                    self._condition.wait(wait_time)
+                    continue
+                heapq.heappop(self._due)
+            try:
+                fn()
+            except Exception as e:
+                print(f"Hedge launch failed: {e}")
+
+_hedge_timer = _HedgeTimer()
+
+class _HedgeRace:
+    # The first successful call resolves the race; the caller returns once it does, or once
+    # every launched call has failed.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.running = 1
+        self.launchable = True
+        self.winner = None
+        self.result = None
+        self.error = None
+
+    def succeed(self, name, result):
+        with self.condition:
+            self.running -= 1
+            if self.winner is not None:
+                return False
+            self.winner = name
+            self.result = result
+            self.condition.notify_all()
+            return True
+
+    def fail(self, error):
+        with self.condition:
+            self.running -= 1
+            # A primary that fails before the hedge fires ends the race; no hedge is started after it.
+            self.launchable = False
+            self.error = error
+            self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            while self.winner is None and self.running > 0:
+                self.condition.wait()
+            self.launchable = False
+            if self.winner is None:
+                raise self.error
+            return self.winner, self.result
+
+def hedged_call(primary_fn, secondary_fn, hedge_delay, deadline=None):
+    # primary_fn/secondary_fn take a Deadline and should stop early once it is cancelled.
+    # Without a hedge token the primary simply runs on the caller's thread. Otherwise both calls
+    # run on the pool, the hedge only if the primary is still running after hedge_delay, and the
+    # caller returns the first success at once. The loser's Deadline is cancelled and it finishes
+    # in the background; a socket read in progress is not interrupted.
+    hedge_budget.record_primary_call()
+    primary_deadline = deadline.child() if deadline is not None else Deadline()
+    if not hedge_budget.can_spend():
+        return primary_fn(primary_deadline)
+
+    secondary_deadline = deadline.child() if deadline is not None else Deadline()
+    race = _HedgeRace()
+
+    def run(name, fn, own_deadline):
+        try:
+            result = fn(own_deadline)
+        except Exception as e:
+            if debugging:
+                print(f"Hedged {name} request failed: {e}")
+            race.fail(e)
+            return
+        race.succeed(name, result)
+
+    def launch():
+        with race.condition:
+            if not race.launchable or race.winner is not None:
+                return
+            if not hedge_budget.try_spend():
+                if debugging:
+                    print("Hedge budget exhausted, waiting on primary provider only")
+                return
+            race.running += 1
+        if debugging:
+            print(f"Primary provider slower than {hedge_delay:.2f}s, firing hedged request")
+        _hedge_executor.submit(run, "secondary", secondary_fn, secondary_deadline)
+
+    _hedge_executor.submit(run, "primary", primary_fn, primary_deadline)
+    _hedge_timer.schedule(hedge_delay, launch)
+
+    winner, result = race.wait()
+    (secondary_deadline if winner == "primary" else primary_deadline).cancel()
+    _record_winner(winner)
+    if debugging:
+        print(f"Hedged call won by {winner} provider")
+    return result
+
+def get_hedging_stats():
+    stats = hedge_budget.stats()
+    with _hedge_stats_lock:
+        stats.update(hedge_stats)
+    stats["enabled"] = hedging_enabled
+    return stats
+
+register_collector("hedging", get_hedging_stats)
@@ -0,0 +1,83 @@
+import functools
+import hashlib
+import json
+import os
+from flask import request
+from dotenv import load_dotenv
+from user_process import get_current_user
+from db_utilities import claim_idempotency_key, complete_idempotency_key, release_idempotency_key
+from single_flight import single_flight, make_call_key
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+idempotency_ttl_seconds = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+idempotency_in_progress_timeout = int(os.getenv("IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS", "300"))
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+def _split_view_result(result):
+    if isinstance(result, tuple):
+        body = result[0]
+        status = result[1] if len(result) > 1 and isinstance(result[1], int) else 200
+        return body, status
+    return result, 200
+
+def _run_once(view, args, kwargs, username, endpoint, key, request_hash):
+    state, stored = claim_idempotency_key(username, endpoint, key, request_hash,
+                                          idempotency_ttl_seconds, idempotency_in_progress_timeout)
+
+    if state == "mismatch":
+        increment_counter("idempotency_requests", endpoint=endpoint, outcome="mismatch")
+        return {"message": "Idempotency-Key was already used with a different request."}, 422
+    if state == "in_progress":
+        increment_counter("idempotency_requests", endpoint=endpoint, outcome="in_progress")
+        return {"message": "A request with this Idempotency-Key is still being processed."}, 409
+    if state == "completed":
+        increment_counter("idempotency_requests", endpoint=endpoint, outcome="replayed")
+        response_status, response_body = stored
+        if debugging:
+            print(f"Replaying stored response for idempotency key {key} on {endpoint}")
+        return json.loads(response_body), response_status, {"Idempotent-Replayed": "true"}
+    if state == "error":
+        return view(*args, **kwargs)
+
+    increment_counter("idempotency_requests", endpoint=endpoint, outcome="executed")
+    try:
+        result = view(*args, **kwargs)
+    except Exception:
+        release_idempotency_key(username, endpoint, key)
+        raise
+
+    body, status = _split_view_result(result)
+    # Only successful replies are replayed; failures release the key so the client can retry.
+    if status < 400 and isinstance(body, dict):
+        complete_idempotency_key(username, endpoint, key, status, json.dumps(body))
+    else:
+        release_idempotency_key(username, endpoint, key)
+    return result
+
+def idempotent(endpoint):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+                return {"message": f"{IDEMPOTENCY_HEADER} must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters."}, 400
+
+            username = get_current_user() or "guest"
+            request_hash = hashlib.sha256(
+                request.query_string + b"\n" + request.get_data(cache=True)
+            ).hexdigest()
+
+            # Concurrent duplicates in this process wait for the first one instead of getting a 409.
+            flight_key = make_call_key("idempotency", username, endpoint, key, request_hash)
+            return single_flight(
+                flight_key,
+                lambda: _run_once(view, args, kwargs, username, endpoint, key, request_hash)
+            )
+        return wrapper
+    return decorator
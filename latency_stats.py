@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import deque
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from metrics import register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+latency_window_size = int(os.getenv("LATENCY_WINDOW_SIZE", "200"))
+latency_min_samples = int(os.getenv("LATENCY_MIN_SAMPLES", "20"))
+adaptive_timeout_multiplier = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "2.0"))
+adaptive_timeout_min = float(os.getenv("ADAPTIVE_TIMEOUT_MIN_SECONDS", "10"))
+adaptive_timeout_max = float(os.getenv("ADAPTIVE_TIMEOUT_MAX_SECONDS", "120"))
+
+DEFAULT_TIMEOUTS = {
+    "plain": 25.0,
+    "tools": 45.0
+}
+
+_samples = {}
+_operation_samples = {}
+_samples_lock = threading.Lock()
+
+def _append_sample(samples, key, seconds):
+    window = samples.get(key)
+    if window is None:
+        window = deque(maxlen=latency_window_size)
+        samples[key] = window
+    window.append(seconds)
+
+def _summarize(values):
+    return {
+        "samples": len(values),
+        "p50": values[int(round(0.50 * (len(values) - 1)))],
+        "p95": values[int(round(0.95 * (len(values) - 1)))],
+        "p99": values[int(round(0.99 * (len(values) - 1)))]
+    }
+
+def record_latency(provider: str, seconds: float, kind: str = "plain"):
+    with _samples_lock:
+        _append_sample(_samples, (provider, kind), seconds)
+
+def record_operation_latency(operation: str, name: str, seconds: float):
+    # Tools and search backends are kept apart from the provider windows, which drive
+    # adaptive timeouts and hedging.
+    with _samples_lock:
+        _append_sample(_operation_samples, (operation, name), seconds)
+
+def get_latency_percentile(provider: str, percentile: float, kind: str = "plain", min_samples: Optional[int] = None) -> Optional[float]:
+    if min_samples is None:
+        min_samples = latency_min_samples
+
+    with _samples_lock:
+        window = _samples.get((provider, kind))
+        values = sorted(window) if window else []
+
+    if len(values) < max(1, min_samples):
+        return None
+
+    index = min(len(values) - 1, max(0, int(round(percentile * (len(values) - 1)))))
+    return values[index]
+
+def get_adaptive_timeout(provider: str, kind: str = "plain") -> float:
+    p99 = get_latency_percentile(provider, 0.99, kind)
+    if p99 is None:
+        return DEFAULT_TIMEOUTS.get(kind, DEFAULT_TIMEOUTS["plain"])
+    return min(adaptive_timeout_max, max(adaptive_timeout_min, p99 * adaptive_timeout_multiplier))
+
+def get_latency_snapshot() -> Dict[str, Dict[str, float]]:
+    with _samples_lock:
+        items = [(key, sorted(window)) for key, window in _samples.items()]
+
+    return {f"{provider}:{kind}": _summarize(values) for (provider, kind), values in items if values}
+
+def get_operation_latency_snapshot() -> Dict[str, Dict[str, float]]:
+    with _samples_lock:
+        items = [(key, sorted(window)) for key, window in _operation_samples.items()]
+    return {f"{operation}:{name}": _summarize(values) for (operation, name), values in items if values}
+
+register_collector("provider_latency", get_latency_snapshot)
+register_collector("operation_latency", get_operation_latency_snapshot)
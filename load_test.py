@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+import chatbot_manage
+import rate_limiter
+import asgi
+
+# Drives the ASGI app in-process with many concurrent guest chats against a stub provider that
+# only sleeps, to show how many in-flight chats one process holds and how many threads it needs.
+
+def _stub_provider(delay):
+    async def call(messages, model, temperature=0.3, candidate_count=1, use_tools=False, deadline=None, max_tokens=None, tool_intent=None):
+        await asyncio.sleep(delay)
+        return f"Stub reply to: {messages[-1]['content'][-40:]}"
+    return call
+
+async def _post(path, payload, query=b"session=guest"):
+    sent = []
+    body = json.dumps(payload).encode("utf-8")
+    events = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if events:
+            return events.pop()
+        await asyncio.Event().wait()
+
+    async def send(event):
+        sent.append(event)
+
+    scope = {
+        "type": "http", "method": "POST", "path": path, "query_string": query,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii"))]
+    }
+    await asgi.application(scope, receive, send)
+    return sent[0]["status"]
+
+async def _run(requests, delay):
+    lifespan_events = asyncio.Queue()
+    await lifespan_events.put({"type": "lifespan.startup"})
+    started = asyncio.Event()
+
+    async def lifespan_send(event):
+        if event["type"] == "lifespan.startup.complete":
+            started.set()
+
+    lifespan = asyncio.create_task(asgi.application({"type": "lifespan"}, lifespan_events.get, lifespan_send))
+    await started.wait()
+
+    peak_threads = threading.active_count()
+    start_time = time.time()
+    tasks = [asyncio.create_task(_post("/chatbot", {"message": f"Tell me a short story, request {i}"})) for i in range(requests)]
+    while not all(task.done() for task in tasks):
+        peak_threads = max(peak_threads, threading.active_count())
+        await asyncio.sleep(0.05)
+    elapsed = time.time() - start_time
+
+    statuses = {}
+    for task in tasks:
+        statuses[task.result()] = statuses.get(task.result(), 0) + 1
+    print(f"{requests} concurrent guest chats, provider delay {delay:g}s: {elapsed:.2f}s total, statuses {statuses}, peak threads {peak_threads}")
+
+    await lifespan_events.put({"type": "lifespan.shutdown"})
+    await lifespan
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the ASGI app against a stub provider.")
+    parser.add_argument("--requests", type=int, default=2000, help="concurrent chat requests")
+    parser.add_argument("--provider-delay", type=float, default=2.0, help="seconds each stub provider call takes")
+    args = parser.parse_args()
+
+    # The stub has no provider quota, so the configured concurrency limits would only measure themselves.
+    rate_limiter.default_provider_concurrency = args.requests
+    chatbot_manage.call_gemini_api_async = _stub_provider(args.provider_delay)
+    chatbot_manage.call_deepseek_api_async = _stub_provider(args.provider_delay)
+    asyncio.run(_run(args.requests, args.provider_delay))
@@ -0,0 +1,226 @@
+import argparse
+import datetime
+import math
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from dotenv import load_dotenv
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+local_index_path = os.getenv("LOCAL_INDEX_PATH", "search_index.sqlite")
+local_index_documents_dir = os.getenv("LOCAL_INDEX_DOCUMENTS_DIR", "knowledge")
+local_index_chunk_chars = int(os.getenv("LOCAL_INDEX_CHUNK_CHARS", "1500"))
+# A chunk must contain at least this share of the query's terms and score at least this much
+# (negated BM25) to be returned; otherwise the search reports no results.
+local_index_min_term_coverage = float(os.getenv("LOCAL_INDEX_MIN_TERM_COVERAGE", "0.6"))
+local_index_min_score = float(os.getenv("LOCAL_INDEX_MIN_SCORE", "0.5"))
+
+INDEXED_EXTENSIONS = {".txt", ".md", ".markdown", ".rst", ".html", ".htm"}
+
+_TAG_RE = re.compile(r"<script.*?</script>|<style.*?</style>|<[^>]+>", re.DOTALL | re.IGNORECASE)
+_HEADING_RE = re.compile(r"^\s*#+\s*(.+)$|<title>(.*?)</title>", re.MULTILINE | re.IGNORECASE)
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further get had has
+have having he her here hers him his how i if in into is it its just me more most my no nor not of
+off on once only or other our ours out over own please same she should show so some such tell than
+that the their theirs them then there these they this those through to too under until up very was
+we were what when where which while who whom why will with would you your yours
+today now currently current latest recent find search look know give explain
+""".split())
+
+def _connect():
+    conn = sqlite3.connect(local_index_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def initialize_local_index():
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS document (
+                path        TEXT    PRIMARY KEY,
+                mtime       REAL    NOT NULL,
+                size        INTEGER NOT NULL,
+                title       TEXT    NOT NULL,
+                indexed_at  DATETIME NOT NULL
+            )
+        """)
+        # One FTS row per chunk so snippets and BM25 scores refer to a passage, not a whole file.
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS document_chunk USING fts5(
+                path UNINDEXED,
+                title,
+                content,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in initialize_local_index:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def _read_document(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as handle:
+        text = handle.read()
+    heading = _HEADING_RE.search(text)
+    title = next((group for group in heading.groups() if group), "").strip() if heading else ""
+    if os.path.splitext(path)[1].lower() in {".html", ".htm"}:
+        text = _TAG_RE.sub(" ", text)
+    return title or os.path.splitext(os.path.basename(path))[0], text
+
+def _chunks(text):
+    chunk = ""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if chunk and len(chunk) + len(paragraph) > local_index_chunk_chars:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk}\n\n{paragraph}" if chunk else paragraph
+        while len(chunk) > local_index_chunk_chars * 2:
+            yield chunk[:local_index_chunk_chars]
+            chunk = chunk[local_index_chunk_chars:]
+    if chunk:
+        yield chunk
+
+def reindex_documents(documents_dir=None, rebuild=False):
+    # Incremental by default: only files whose mtime or size changed are re-read, and
+    # files that disappeared are dropped from the index.
+    documents_dir = os.path.abspath(documents_dir or local_index_documents_dir)
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "chunks": 0}
+    initialize_local_index()
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        if rebuild:
+            cur.execute("DELETE FROM document")
+            cur.execute("DELETE FROM document_chunk")
+        cur.execute("SELECT path, mtime, size FROM document")
+        known = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+        seen = set()
+        for root, _, files in os.walk(documents_dir):
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in INDEXED_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                relative_path = os.path.relpath(path, documents_dir)
+                seen.add(relative_path)
+                file_stat = os.stat(path)
+                if known.get(relative_path) == (file_stat.st_mtime, file_stat.st_size):
+                    stats["unchanged"] += 1
+                    continue
+
+                title, text = _read_document(path)
+                cur.execute("DELETE FROM document_chunk WHERE path = ?", (relative_path,))
+                for chunk in _chunks(text):
+                    cur.execute("INSERT INTO document_chunk (path, title, content) VALUES (?, ?, ?)", (relative_path, title, chunk))
+                    stats["chunks"] += 1
+                cur.execute(
+                    "INSERT INTO document (path, mtime, size, title, indexed_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, "
+                    "title = excluded.title, indexed_at = excluded.indexed_at",
+                    (relative_path, file_stat.st_mtime, file_stat.st_size, title, datetime.datetime.now(datetime.timezone.utc).isoformat())
+                )
+                stats["updated" if relative_path in known else "added"] += 1
+
+        for relative_path in set(known) - seen:
+            cur.execute("DELETE FROM document_chunk WHERE path = ?", (relative_path,))
+            cur.execute("DELETE FROM document WHERE path = ?", (relative_path,))
+            stats["removed"] += 1
+
+        conn.commit()
+        return stats
+    except (sqlite3.Error, OSError) as e:
+        conn.rollback()
+        print(f"Local index rebuild failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def _fold(text):
+    # Mirrors the FTS tokenizer (case and diacritics folded) for the term coverage check.
+    return "".join(char for char in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(char))
+
+def _query_terms(query):
+    tokens = (_fold(token) for token in _TOKEN_RE.findall(query or ""))
+    return list(dict.fromkeys(token for token in tokens if len(token) > 1 and token not in STOPWORDS))[:32]
+
+def _match_expression(terms):
+    # Free text becomes an OR of quoted terms so user punctuation can never be read as FTS syntax;
+    # BM25 ranking still favours chunks that match more of the terms.
+    return " OR ".join(f'"{term}"' for term in terms)
+
+def search_local_index(query, num_results=5):
+    terms = _query_terms(query)
+    if not terms or not os.path.exists(local_index_path):
+        return []
+    required_terms = max(1, math.ceil(len(terms) * local_index_min_term_coverage))
+    conn = sqlite3.connect(local_index_path, timeout=5)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT path, title, content, snippet(document_chunk, 2, '', '', ' ... ', 40), bm25(document_chunk, 0.0, 4.0, 1.0) AS score "
+            "FROM document_chunk WHERE document_chunk MATCH ? ORDER BY score LIMIT ?",
+            (_match_expression(terms), num_results * 3)
+        )
+        results = []
+        seen_paths = set()
+        # Keep the best chunk per document so one long file cannot fill every slot.
+        for path, title, content, snippet, score in cur.fetchall():
+            if path in seen_paths or -score < local_index_min_score:
+                continue
+            chunk_tokens = set(_TOKEN_RE.findall(_fold(f"{title} {content}")))
+            if sum(1 for term in terms if term in chunk_tokens) < required_terms:
+                continue
+            seen_paths.add(path)
+            results.append({
+                "title": title,
+                "snippet": re.sub(r"\s+", " ", snippet).strip(),
+                "url": f"local://{path}",
+                "source": "Local knowledge index",
+                "score": round(-score, 4)
+            })
+            if len(results) >= num_results:
+                break
+        return results
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in search_local_index:", e)
+        return []
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the local search index used by search_web.")
+    parser.add_argument("--dir", default=local_index_documents_dir, help="directory of .txt/.md/.rst/.html documents")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index and re-read every document")
+    parser.add_argument("--query", help="run a test query against the index instead of indexing")
+    args = parser.parse_args()
+
+    if args.query:
+        start_time = time.time()
+        for result in search_local_index(args.query):
+            print(f"{result['score']:8.3f}  {result['url']}  {result['title']}\n          {result['snippet']}")
+        print(f"query took {(time.time() - start_time) * 1000:.1f}ms")
+    else:
+        start_time = time.time()
+        stats = reindex_documents(args.dir, args.rebuild)
+        print(f"Indexed {args.dir} into {local_index_path} in {time.time() - start_time:.1f}s: {stats}")
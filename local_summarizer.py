@@ -0,0 +1,103 @@
+import json
+import os
+import re
+import threading
+from dotenv import load_dotenv
+from metrics import increment_counter, register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+local_summarizer_enabled = os.getenv("LOCAL_SUMMARIZER_ENABLED", "true").lower() == "true"
+trivial_max_user_words = int(os.getenv("LOCAL_SUMMARY_MAX_USER_WORDS", "6"))
+trivial_max_reply_chars = int(os.getenv("LOCAL_SUMMARY_MAX_REPLY_CHARS", "400"))
+local_summary_max_chars = int(os.getenv("LOCAL_SUMMARY_MAX_CHARS", "240"))
+
+ACKNOWLEDGEMENT_PATTERN = re.compile(
+    r"^(?:thanks?(?: you)?(?: (?:so|very) much)?|thx|ty|ok(?:ay)?|k|cool|great|nice|perfect|awesome|got it|"
+    r"sounds good|understood|yes|yeah|yep|no|nope|sure|alright|all right|bye|goodbye|see you|hi|hello|hey|"
+    r"good (?:morning|night|evening)|teşekkürler|teşekkür ederim|sağ ?ol|tamam|peki|evet|hayır|anladım|"
+    r"süper|harika|merhaba|selam|görüşürüz|danke|merci|gracias)[\s!.,?:)\-]*$",
+    re.IGNORECASE
+)
+MATH_ONLY_PATTERN = re.compile(r"^[\s\d+\-*/().,^%=?x×÷]+$")
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+")
+FACT_HINT_PATTERN = re.compile(r"\d|https?://|`", re.IGNORECASE)
+
+_stats = {"local": 0, "provider": 0}
+_stats_lock = threading.Lock()
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", (text or "").strip())
+
+def classify_turn(message, reply):
+    # Returns "acknowledgement", "calculation" or None; None means the turn needs a provider summary.
+    if not local_summarizer_enabled:
+        return None
+    user_text = _normalize(message)
+    reply_text = _normalize(reply)
+    if not user_text or len(reply_text) > trivial_max_reply_chars or "```" in (reply or ""):
+        return None
+    if len(user_text.split()) <= trivial_max_user_words and ACKNOWLEDGEMENT_PATTERN.match(user_text):
+        return "acknowledgement"
+    if MATH_ONLY_PATTERN.match(user_text) and any(ch.isdigit() for ch in user_text):
+        return "calculation"
+    return None
+
+def _extract_gist(text, max_chars):
+    text = _normalize(text)
+    sentences = [s for s in SENTENCE_SPLIT_PATTERN.split(text) if s]
+    if not sentences:
+        return ""
+    # Lead sentence, plus a later one that carries numbers, links or code if the budget allows.
+    gist = sentences[0]
+    for sentence in sentences[1:]:
+        if FACT_HINT_PATTERN.search(sentence) and len(gist) + len(sentence) + 1 <= max_chars:
+            gist = f"{gist} {sentence}"
+            break
+    return gist if len(gist) <= max_chars else gist[:max_chars - 3].rstrip() + "..."
+
+def build_turn_summary(message, reply, turn_type):
+    user_gist = _extract_gist(message, local_summary_max_chars)
+    reply_gist = _extract_gist(reply, local_summary_max_chars)
+    summary = {
+        "timeline": {"user_message": user_gist, "assistant_reply": reply_gist},
+        "important_facts": [f"{user_gist}: {reply_gist}"] if turn_type == "calculation" else [],
+        "summary_source": "local"
+    }
+    return json.dumps(summary, ensure_ascii=False)
+
+def update_rolling_summary(previous_summary, message, reply, turn_type):
+    # Rolling summaries keep their structure; the trivial exchange is appended as a minor note.
+    note = f"{_extract_gist(message, 80)} -> {_extract_gist(reply, local_summary_max_chars)}"
+    try:
+        summary = json.loads(previous_summary) if previous_summary else {}
+    except ValueError:
+        summary = None
+    if isinstance(summary, dict):
+        minor_exchanges = summary.get("minor_exchanges")
+        if not isinstance(minor_exchanges, list):
+            minor_exchanges = []
+        summary["minor_exchanges"] = (minor_exchanges + [note])[-5:]
+        if turn_type == "calculation":
+            facts = summary.get("important_facts") if isinstance(summary.get("important_facts"), list) else []
+            summary["important_facts"] = facts + [note]
+        return json.dumps(summary, ensure_ascii=False)
+    return f"{previous_summary}\nMinor exchange: {note}"
+
+def record_summary_source(source):
+    increment_counter("summary_calls", source=source)
+    with _stats_lock:
+        _stats[source] += 1
+
+def get_local_summarizer_stats():
+    with _stats_lock:
+        total = _stats["local"] + _stats["provider"]
+        return {
+            "enabled": local_summarizer_enabled,
+            "local": _stats["local"],
+            "provider": _stats["provider"],
+            "avoided_fraction": round(_stats["local"] / total, 4) if total else 0.0
+        }
+
+register_collector("local_summarizer", get_local_summarizer_stats)
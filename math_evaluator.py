@@ -0,0 +1,291 @@
+import argparse
+import ast
+import math
+import multiprocessing
+import operator
+import os
+import threading
+import time
+from functools import lru_cache
+from dotenv import load_dotenv
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+math_max_expression_chars = int(os.getenv("MATH_MAX_EXPRESSION_CHARS", "500"))
+math_max_nodes = int(os.getenv("MATH_MAX_NODES", "200"))
+math_max_int_digits = int(os.getenv("MATH_MAX_INT_DIGITS", "1000"))
+math_max_exponent = float(os.getenv("MATH_MAX_EXPONENT", "10000"))
+math_max_factorial = int(os.getenv("MATH_MAX_FACTORIAL", "1000"))
+math_max_sequence_length = int(os.getenv("MATH_MAX_SEQUENCE_LENGTH", "100"))
+math_compile_cache_size = int(os.getenv("MATH_COMPILE_CACHE_SIZE", "1024"))
+math_use_process_pool = os.getenv("MATH_USE_PROCESS_POOL", "true").lower() == "true"
+math_worker_processes = int(os.getenv("MATH_WORKER_PROCESSES", "2"))
+math_timeout_seconds = float(os.getenv("MATH_TIMEOUT_SECONDS", "2"))
+
+_max_int_bits = int(math_max_int_digits * math.log2(10)) + 1
+
+class MathEvaluationError(Exception):
+    def __init__(self, message, error_type="invalid_expression"):
+        self.message = message
+        self.error_type = error_type
+        super().__init__(self.message)
+
+def _check_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise MathEvaluationError(f"Unsupported value of type {type(value).__name__}")
+    if isinstance(value, int) and value.bit_length() > _max_int_bits:
+        raise OverflowError("integer result too large")
+    return value
+
+def _bounded_pow(base, exponent, modulus=None):
+    if modulus is not None:
+        return pow(base, exponent, modulus)
+    if abs(exponent) > math_max_exponent:
+        raise OverflowError("exponent too large")
+    # Reject integer powers before computing them: the size of base**exponent is known up front.
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log2(abs(base)) > _max_int_bits:
+            raise OverflowError("integer result too large")
+    return pow(base, exponent)
+
+def _bounded_factorial(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, int) and value > math_max_factorial:
+        raise OverflowError("factorial argument too large")
+    return math.factorial(value)
+
+def _bounded_round(value, ndigits=None):
+    # round(x, -n) on an int computes 10**n first.
+    if ndigits is not None and abs(ndigits) > math_max_int_digits:
+        raise OverflowError("rounding precision too large")
+    return round(value, ndigits)
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _bounded_pow
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg
+}
+
+FUNCTIONS = {
+    "abs": abs, "round": _bounded_round, "min": min, "max": max,
+    "sum": sum, "pow": _bounded_pow,
+    "sqrt": math.sqrt, "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "asin": math.asin, "acos": math.acos, "atan": math.atan,
+    "log": math.log, "log10": math.log10, "exp": math.exp,
+    "floor": math.floor, "ceil": math.ceil,
+    "degrees": math.degrees, "radians": math.radians,
+    "factorial": _bounded_factorial
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+def _compile_node(node, sequence_allowed=False):
+    # Each AST node becomes a closure; evaluating the expression is then a plain call tree
+    # with no name lookups or node-type dispatch left to do.
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body)
+
+    if isinstance(node, ast.Constant):
+        value = _check_number(node.value)
+        return lambda: value
+
+    if isinstance(node, ast.Name):
+        if node.id not in CONSTANTS:
+            raise MathEvaluationError(f"name '{node.id}' is not defined")
+        value = CONSTANTS[node.id]
+        return lambda: value
+
+    if isinstance(node, ast.BinOp):
+        op = BINARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise MathEvaluationError(f"operator {type(node.op).__name__} is not supported")
+        left = _compile_node(node.left)
+        right = _compile_node(node.right)
+        return lambda: _check_number(op(left(), right()))
+
+    if isinstance(node, ast.UnaryOp):
+        op = UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise MathEvaluationError(f"operator {type(node.op).__name__} is not supported")
+        operand = _compile_node(node.operand)
+        return lambda: op(operand())
+
+    if isinstance(node, (ast.Tuple, ast.List)):
+        # Lists only feed functions like sum(); as operands, [1] * 10**8 would be built before any check.
+        if not sequence_allowed:
+            raise MathEvaluationError("lists are only allowed as function arguments")
+        if len(node.elts) > math_max_sequence_length:
+            raise MathEvaluationError(f"list has more than {math_max_sequence_length} items")
+        items = [_compile_node(item) for item in node.elts]
+        return lambda: [item() for item in items]
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            name = node.func.id if isinstance(node.func, ast.Name) else type(node.func).__name__
+            raise MathEvaluationError(f"function '{name}' is not supported")
+        if node.keywords:
+            raise MathEvaluationError("keyword arguments are not supported")
+        function = FUNCTIONS[node.func.id]
+        args = [_compile_node(arg, sequence_allowed=True) for arg in node.args]
+        return lambda: _check_number(function(*[arg() for arg in args]))
+
+    raise MathEvaluationError(f"{type(node).__name__} is not allowed in expressions")
+
+@lru_cache(maxsize=math_compile_cache_size)
+def compile_expression(expression):
+    if len(expression) > math_max_expression_chars:
+        raise MathEvaluationError(f"expression longer than {math_max_expression_chars} characters")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise MathEvaluationError(f"invalid syntax: {e.msg}")
+    if sum(1 for _ in ast.walk(tree)) > math_max_nodes:
+        raise MathEvaluationError(f"expression has more than {math_max_nodes} terms")
+    return _compile_node(tree)
+
+def _evaluate_locally(expression):
+    # Returns (True, result) or (False, error_type, message) so results cross the process
+    # boundary without pickling exception objects.
+    try:
+        return True, _check_number(compile_expression(expression)())
+    except MathEvaluationError as e:
+        return False, e.error_type, e.message
+    except ZeroDivisionError:
+        return False, "division_by_zero", "Division by zero"
+    except OverflowError as e:
+        return False, "too_large", str(e)
+    except (ValueError, TypeError) as e:
+        return False, "invalid_expression", str(e)
+    except RecursionError:
+        return False, "invalid_expression", "expression nested too deeply"
+
+_pool = None
+_pool_lock = threading.Lock()
+# Evaluations still waiting on each pool. A retired pool is terminated once its count drops to zero.
+_pool_users = {}
+_retired_pools = set()
+
+def _acquire_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process is multi-threaded and forking it is unsafe.
+            _pool = multiprocessing.get_context("spawn").Pool(processes=max(1, math_worker_processes))
+        _pool_users[_pool] = _pool_users.get(_pool, 0) + 1
+        return _pool
+
+def _release_pool(pool):
+    with _pool_lock:
+        _pool_users[pool] -= 1
+        if _pool_users[pool] > 0 or pool not in _retired_pools:
+            return
+        del _pool_users[pool]
+        _retired_pools.discard(pool)
+    pool.terminate()
+
+def _reset_after_fork():
+    # The parent's pool belongs to the parent; a forked server worker creates its own on first use.
+    global _pool, _pool_lock, _pool_users, _retired_pools
+    _pool = None
+    _pool_lock = threading.Lock()
+    _pool_users = {}
+    _retired_pools = set()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _retire_pool(pool):
+    # New evaluations go to a fresh pool; evaluations already waiting on this one still get their
+    # result (or their own timeout) before the stuck worker is killed along with the pool.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        _retired_pools.add(pool)
+
+def evaluate_expression(expression):
+    # Bounds catch runaway sizes before they are computed; the process pool and its
+    # wall-clock timeout cover whatever still runs too long, since a thread cannot be killed.
+    if math_use_process_pool:
+        pool = _acquire_pool()
+        try:
+            outcome = pool.apply_async(_evaluate_locally, (expression,)).get(math_timeout_seconds)
+        except multiprocessing.TimeoutError:
+            increment_counter("math_evaluations", outcome="timeout")
+            if debugging:
+                print(f"Math evaluation exceeded {math_timeout_seconds}s, restarting worker processes")
+            _retire_pool(pool)
+            raise MathEvaluationError(f"Calculation took longer than {math_timeout_seconds:g}s", "timeout")
+        finally:
+            _release_pool(pool)
+    else:
+        outcome = _evaluate_locally(expression)
+
+    if not outcome[0]:
+        increment_counter("math_evaluations", outcome=outcome[1])
+        raise MathEvaluationError(outcome[2], outcome[1])
+    increment_counter("math_evaluations", outcome="success")
+    return outcome[1]
+
+BENCHMARK_EXPRESSIONS = [
+    "2 + 2", "15 * 24", "sqrt(144) + 3 ** 2", "(1 + 2) * (3 + 4) / 5",
+    "sin(pi / 4) ** 2 + cos(pi / 4) ** 2", "log10(1000) * exp(2)", "factorial(20) // 3",
+    "sum([1, 2, 3, 4, 5]) / 5", "max(3, 7, 2) - min(4, 9)", "round(2 ** 0.5, 4)"
+]
+
+ADVERSARIAL_EXPRESSIONS = [
+    "[1] * 10 ** 8", "-[1] * 10 ** 8", "sum([[0] * 10 ** 8])", "9 ** 9 ** 9", "2 ** 10 ** 6",
+    "10 ** 999 * 10 ** 999", "factorial(10 ** 6)", "factorial(1000) ** 10", "round(5, -10 ** 9)",
+    "pow(10 ** 999, 10 ** 999, 10 ** 999 + 7)", "sum([" + ", ".join(["1"] * 150) + "])",
+    "(" * 90 + "1" + ")" * 90, "-" * 300 + "1", "1" * 600, "__import__('os')", "(1).__class__"
+]
+
+def _time_expression(expression, iterations):
+    # Returns (worst latency in seconds, outcome) over the given number of evaluations.
+    worst = 0.0
+    outcome = "success"
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        try:
+            evaluate_expression(expression)
+        except MathEvaluationError as e:
+            outcome = e.error_type
+        worst = max(worst, time.perf_counter() - start_time)
+    return worst, outcome
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the calculator tool on typical and adversarial expressions.")
+    parser.add_argument("--iterations", type=int, default=2000, help="evaluations per typical expression")
+    parser.add_argument("--local", action="store_true", help="evaluate in this process instead of the worker pool")
+    args = parser.parse_args()
+    if args.local:
+        math_use_process_pool = False
+
+    evaluate_expression("1")
+    start_time = time.perf_counter()
+    for expression in BENCHMARK_EXPRESSIONS:
+        evaluate_expression(expression)
+    print(f"cold: {len(BENCHMARK_EXPRESSIONS)} expressions in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    start_time = time.perf_counter()
+    for _ in range(args.iterations):
+        for expression in BENCHMARK_EXPRESSIONS:
+            evaluate_expression(expression)
+    elapsed = time.perf_counter() - start_time
+    count = args.iterations * len(BENCHMARK_EXPRESSIONS)
+    print(f"throughput: {count / elapsed:,.0f} evaluations/s ({elapsed / count * 1e6:.1f}us each)")
+
+    for expression in ADVERSARIAL_EXPRESSIONS:
+        worst, outcome = _time_expression(expression, 3)
+        label = expression if len(expression) <= 40 else expression[:37] + "..."
+        print(f"{worst * 1000:9.2f}ms  {outcome:<18} {label}")
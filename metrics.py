@@ -0,0 +1,56 @@
+import os
+import threading
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+_counters = {}
+_gauges = {}
+_collectors = {}
+_metrics_lock = threading.Lock()
+
+def _metric_key(name, labels):
+    if not labels:
+        return name
+    label_text = ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+    return f"{name}{{{label_text}}}"
+
+def increment_counter(name: str, value: float = 1, **labels):
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name: str, value: float, **labels):
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _gauges[key] = value
+
+def get_counter(name: str, **labels) -> float:
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        return _counters.get(key, 0)
+
+def register_collector(name: str, collector: Callable[[], Any]):
+    with _metrics_lock:
+        _collectors[name] = collector
+
+def get_metrics_snapshot() -> Dict[str, Any]:
+    with _metrics_lock:
+        snapshot = {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges)
+        }
+        collectors = list(_collectors.items())
+
+    for name, collector in collectors:
+        try:
+            snapshot[name] = collector()
+        except Exception as e:
+            if debugging:
+                print(f"Metrics collector {name} failed: {e}")
+            snapshot[name] = {"error": str(e)}
+    return snapshot
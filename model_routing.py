@@ -0,0 +1,93 @@
+import json
+import os
+from typing import Any, Dict
+from dotenv import load_dotenv
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+ai_provider = os.getenv("AI_PROVIDER", "gemini").lower()
+
+PROVIDER_DEFAULT_MODELS = {
+    "gemini": "gemini-2.0-flash-exp",
+    "deepseek": "deepseek-chat"
+}
+
+# Background work (summaries, titles) goes to the cheaper/faster model of each provider.
+PROVIDER_BACKGROUND_MODELS = {
+    "gemini": "gemini-2.0-flash-lite",
+    "deepseek": "deepseek-chat"
+}
+
+TASK_FOR_PROMPT_TYPE = {
+    "first_message": "reply",
+    "continuing": "reply",
+    "guest": "guest",
+    "summary": "summary",
+    "summary_title": "summary",
+    "checkpoint": "summary",
+    "title": "title"
+}
+
+def _default_routes(provider):
+    return {
+        "reply": {"provider": provider, "model": PROVIDER_DEFAULT_MODELS[provider], "max_tokens": 4000, "temperature": 0.3},
+        "guest": {"provider": provider, "model": PROVIDER_DEFAULT_MODELS[provider], "max_tokens": 4000, "temperature": 0.3},
+        "summary": {"provider": provider, "model": PROVIDER_BACKGROUND_MODELS[provider], "max_tokens": 3000, "temperature": 0.2},
+        "title": {"provider": provider, "model": PROVIDER_BACKGROUND_MODELS[provider], "max_tokens": 32, "temperature": 0.2}
+    }
+
+def _load_route_overrides():
+    raw = os.getenv("MODEL_ROUTING", "").strip()
+    routing_file = os.getenv("MODEL_ROUTING_FILE", "").strip()
+    if not raw and routing_file:
+        try:
+            with open(routing_file, "r", encoding="utf-8") as f:
+                raw = f.read()
+        except OSError as e:
+            print(f"Could not read MODEL_ROUTING_FILE {routing_file}: {e}")
+            return {}
+    if not raw:
+        return {}
+    try:
+        overrides = json.loads(raw)
+        return overrides if isinstance(overrides, dict) else {}
+    except ValueError as e:
+        print(f"Ignoring invalid model routing configuration: {e}")
+        return {}
+
+def _build_routes():
+    provider = ai_provider if ai_provider in PROVIDER_DEFAULT_MODELS else "gemini"
+    routes = _default_routes(provider)
+    for task, override in _load_route_overrides().items():
+        if not isinstance(override, dict):
+            continue
+        route = dict(routes.get(task, routes["reply"]))
+        override_provider = str(override.get("provider", route["provider"])).lower()
+        if override_provider not in PROVIDER_DEFAULT_MODELS:
+            print(f"Ignoring unknown provider '{override_provider}' for task {task}")
+            continue
+        if override_provider != route["provider"] and "model" not in override:
+            route["model"] = PROVIDER_DEFAULT_MODELS[override_provider]
+        route.update({key: value for key, value in override.items() if key in ("model", "max_tokens", "temperature")})
+        route["provider"] = override_provider
+        routes[task] = route
+    return routes
+
+task_routes = _build_routes()
+
+if debugging:
+    print(f"Model routing table: {task_routes}")
+
+def task_for_prompt_type(prompt_type) -> str:
+    return TASK_FOR_PROMPT_TYPE.get(prompt_type, "reply")
+
+def get_route(task) -> Dict[str, Any]:
+    return dict(task_routes.get(task, task_routes["reply"]))
+
+def get_route_for_prompt_type(prompt_type) -> Dict[str, Any]:
+    return get_route(task_for_prompt_type(prompt_type))
+
+def record_routing_decision(task, provider, model):
+    increment_counter("routing_decisions", task=task, provider=provider, model=model)
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from metrics import register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+similarity_cache_enabled = os.getenv("SIMILARITY_CACHE_ENABLED", "true").lower() == "true"
+similarity_threshold = float(os.getenv("SIMILARITY_CACHE_THRESHOLD", "0.85"))
+similarity_cache_size = int(os.getenv("SIMILARITY_CACHE_SIZE", "2000"))
+similarity_cache_ttl = int(os.getenv("SIMILARITY_CACHE_TTL_SECONDS", "3600"))
+cacheable_prompt_types = {
+    prompt_type.strip()
+    for prompt_type in os.getenv("SIMILARITY_CACHE_PROMPT_TYPES", "guest,first_message").split(",")
+    if prompt_type.strip()
+}
+
+# Continuing prompts carry per-session state (title, summary), so a reply for one
+# session can never be reused for another no matter how similar the text is.
+STATEFUL_PROMPT_TYPES = {"continuing", "summary", "title", "summary_title", "checkpoint"}
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+def _permutation_params():
+    params = []
+    for i in range(NUM_PERMUTATIONS):
+        digest = hashlib.blake2b(f"minhash-{i}".encode("utf-8"), digest_size=16).digest()
+        a, b = struct.unpack("<QQ", digest)
+        params.append(((a % (_MERSENNE_PRIME - 1)) + 1, b % _MERSENNE_PRIME))
+    return params
+
+_PERMUTATIONS = _permutation_params()
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def normalize_prompt_text(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+def _shingles(normalized: str) -> set:
+    tokens = normalized.split()
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash_signature(normalized: str) -> Tuple[int, ...]:
+    hashes = [
+        struct.unpack("<I", hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest())[0]
+        for shingle in _shingles(normalized)
+    ]
+    if not hashes:
+        return tuple([_MAX_HASH] * NUM_PERMUTATIONS)
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+def estimate_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return matches / NUM_PERMUTATIONS
+
+class SimilarityCache:
+    def __init__(self, max_entries=2000, ttl_seconds=3600, threshold=0.85):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._buckets: Dict[Tuple, set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _band_keys(self, namespace, signature):
+        return [
+            (namespace, band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+            for band in range(LSH_BANDS)
+        ]
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if not entry:
+            return
+        for key in self._band_keys(entry["namespace"], entry["signature"]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(self, namespace, text) -> Optional[str]:
+        normalized = normalize_prompt_text(text)
+        if not normalized:
+            return None
+        signature = minhash_signature(normalized)
+        now = time.time()
+
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(namespace, signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries.get(entry_id)
+                if not entry:
+                    continue
+                if now - entry["created_at"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                if entry["normalized"] == normalized:
+                    best_id, best_score = entry_id, 1.0
+                    break
+                score = estimate_similarity(signature, entry["signature"])
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_id)
+                self.hits += 1
+                if debugging:
+                    print(f"Similarity cache hit ({best_score:.2f}) for namespace {namespace}")
+                return self._entries[best_id]["reply"]
+
+            self.misses += 1
+            return None
+
+    def store(self, namespace, text, reply):
+        normalized = normalize_prompt_text(text)
+        if not normalized or not reply:
+            return
+        signature = minhash_signature(normalized)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "namespace": namespace,
+                "normalized": normalized,
+                "signature": signature,
+                "reply": reply,
+                "created_at": time.time()
+            }
+            for key in self._band_keys(namespace, signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0
+            }
+
+prompt_similarity_cache = SimilarityCache(similarity_cache_size, similarity_cache_ttl, similarity_threshold)
+
+def is_cacheable_prompt_type(prompt_type: Optional[str]) -> bool:
+    if not similarity_cache_enabled or not prompt_type:
+        return False
+    if prompt_type in STATEFUL_PROMPT_TYPES:
+        return False
+    return prompt_type in cacheable_prompt_types
+
+def cache_namespace(provider: str, model: str, prompt_type: str, temperature: float) -> Tuple:
+    return (provider, model, prompt_type, round(float(temperature), 2))
+
+def lookup_similar_reply(namespace: Tuple, text: str) -> Optional[str]:
+    return prompt_similarity_cache.lookup(namespace, text)
+
+def store_reply(namespace: Tuple, text: str, reply: str):
+    prompt_similarity_cache.store(namespace, text, reply)
+
+def get_similarity_cache_stats() -> Dict[str, float]:
+    return prompt_similarity_cache.stats()
+
+register_collector("similarity_cache", get_similarity_cache_stats)
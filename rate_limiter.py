@@ -0,0 +1,305 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import increment_counter, register_collector
+from shared_state import process_id, try_acquire_lease, release_lease, shared_state_poll_seconds
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+default_provider_concurrency = int(os.getenv("DEFAULT_PROVIDER_CONCURRENCY", "8"))
+default_provider_rpm = float(os.getenv("DEFAULT_PROVIDER_RPM", "0"))
+default_provider_tpm = float(os.getenv("DEFAULT_PROVIDER_TPM", "0"))
+background_max_share = float(os.getenv("BACKGROUND_MAX_CONCURRENCY_SHARE", "0.5"))
+interactive_wait_seconds = float(os.getenv("RATE_LIMIT_INTERACTIVE_WAIT_SECONDS", "30"))
+background_wait_seconds = float(os.getenv("RATE_LIMIT_BACKGROUND_WAIT_SECONDS", "120"))
+cancel_poll_seconds = 0.1
+async_poll_seconds = float(os.getenv("RATE_LIMIT_ASYNC_POLL_SECONDS", "0.05"))
+# With several server worker processes, per-process concurrency would multiply by the worker
+# count; shared limits also take a node-wide lease so the configured concurrency holds per node.
+shared_provider_limits = os.getenv("SHARED_PROVIDER_LIMITS", "false").lower() == "true"
+shared_provider_lease_seconds = float(os.getenv("SHARED_PROVIDER_LEASE_SECONDS", "300"))
+
+def _load_provider_limits():
+    raw = os.getenv("PROVIDER_LIMITS", "").strip()
+    if not raw:
+        return {}
+    try:
+        limits = json.loads(raw)
+        return limits if isinstance(limits, dict) else {}
+    except ValueError as e:
+        print(f"Ignoring invalid PROVIDER_LIMITS value: {e}")
+        return {}
+
+provider_limits = _load_provider_limits()
+
+class RateLimitExceededError(Exception):
+    def __init__(self, message, error_type="rate_limited"):
+        self.message = message
+        self.error_type = error_type
+        super().__init__(self.message)
+
+class ProviderLimiter:
+    # One condition guards the concurrency slots and both per-minute buckets, so a waiter is
+    # admitted only when all three allow it. Background work waits while interactive
+    # callers are queued and may only use part of the concurrency slots.
+    def __init__(self, name, concurrency, rpm=0, tpm=0):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.background_concurrency = max(1, int(self.concurrency * background_max_share))
+        self.rpm = float(rpm or 0)
+        self.tpm = float(tpm or 0)
+        self.request_tokens = self.rpm
+        self.token_tokens = self.tpm
+        self.last_refill = time.time()
+        self.in_flight = 0
+        self.waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self.admitted = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.time()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        if self.rpm:
+            self.request_tokens = min(self.rpm, self.request_tokens + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self.token_tokens = min(self.tpm, self.token_tokens + elapsed * self.tpm / 60.0)
+
+    def _refill_wait(self, estimated_tokens):
+        waits = []
+        if self.rpm and self.request_tokens < 1:
+            waits.append((1 - self.request_tokens) * 60.0 / self.rpm)
+        if self.tpm and self.token_tokens < estimated_tokens:
+            waits.append((estimated_tokens - self.token_tokens) * 60.0 / self.tpm)
+        return max(waits) if waits else None
+
+    def _can_admit(self, priority, estimated_tokens):
+        if priority == PRIORITY_BACKGROUND:
+            if self.waiting[PRIORITY_INTERACTIVE] > 0 or self.in_flight >= self.background_concurrency:
+                return False
+        elif self.in_flight >= self.concurrency:
+            return False
+        if self.rpm and self.request_tokens < 1:
+            return False
+        if self.tpm and self.token_tokens < estimated_tokens:
+            return False
+        return True
+
+    def _try_admit(self, priority, estimated_tokens):
+        self._refill()
+        if not self._can_admit(priority, estimated_tokens):
+            return False
+        self.in_flight += 1
+        if self.rpm:
+            self.request_tokens -= 1
+        if self.tpm:
+            self.token_tokens -= estimated_tokens
+        self.admitted += 1
+        return True
+
+    def _stop_waiting(self, priority):
+        self.waiting[priority] -= 1
+        if priority == PRIORITY_INTERACTIVE and self.waiting[PRIORITY_INTERACTIVE] == 0:
+            self._condition.notify_all()
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, estimated_tokens=0, timeout=None, cancelled=None):
+        # cancelled() is polled while waiting so the losing side of a hedged call leaves the queue.
+        if self.tpm:
+            estimated_tokens = min(estimated_tokens, self.tpm)
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    if self._try_admit(priority, estimated_tokens):
+                        return True
+                    if cancelled is not None and cancelled():
+                        return False
+
+                    wait_time = self._refill_wait(estimated_tokens)
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            return False
+                        wait_time = remaining if wait_time is None else min(wait_time, remaining)
+                    if cancelled is not None:
+                        wait_time = cancel_poll_seconds if wait_time is None else min(wait_time, cancel_poll_seconds)
+                    self._condition.wait(wait_time)
+            finally:
+                self._stop_waiting(priority)
+
+    async def acquire_async(self, priority=PRIORITY_INTERACTIVE, estimated_tokens=0, timeout=None):
+        # Same admission rules as acquire, but a queued coroutine polls instead of parking a
+        # thread on the condition, so thousands of waiting requests cost no threads.
+        if self.tpm:
+            estimated_tokens = min(estimated_tokens, self.tpm)
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            if self._try_admit(priority, estimated_tokens):
+                return True
+            self.waiting[priority] += 1
+        try:
+            while True:
+                wait_time = async_poll_seconds
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        with self._condition:
+                            self.rejected += 1
+                        return False
+                    wait_time = min(wait_time, remaining)
+                await asyncio.sleep(wait_time)
+                with self._condition:
+                    if self._try_admit(priority, estimated_tokens):
+                        return True
+        finally:
+            with self._condition:
+                self._stop_waiting(priority)
+
+    def release(self):
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            self._refill()
+            return {
+                "in_flight": self.in_flight,
+                "concurrency": self.concurrency,
+                "background_concurrency": self.background_concurrency,
+                "waiting_interactive": self.waiting[PRIORITY_INTERACTIVE],
+                "waiting_background": self.waiting[PRIORITY_BACKGROUND],
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "request_tokens": round(self.request_tokens, 2),
+                "token_tokens": round(self.token_tokens, 2),
+                "admitted": self.admitted,
+                "rejected": self.rejected
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _limits_for(provider, model):
+    limits = dict(provider_limits.get(provider, {}))
+    limits.update(provider_limits.get(f"{provider}:{model}", {}))
+    return (
+        limits.get("concurrency", default_provider_concurrency),
+        limits.get("rpm", default_provider_rpm),
+        limits.get("tpm", default_provider_tpm)
+    )
+
+def get_limiter(provider, model) -> ProviderLimiter:
+    key = f"{provider}:{model}"
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            concurrency, rpm, tpm = _limits_for(provider, model)
+            limiter = ProviderLimiter(key, concurrency, rpm, tpm)
+            _limiters[key] = limiter
+        return limiter
+
+def estimate_prompt_tokens(messages):
+    return sum(len(m.get("content", "")) for m in messages) // 4 + 1
+
+_lease_sequence = itertools.count()
+
+class ProviderSlot:
+    def __init__(self, provider, model, messages, priority=PRIORITY_INTERACTIVE, deadline=None):
+        self.limiter = get_limiter(provider, model)
+        self.priority = priority
+        self.deadline = deadline
+        self.estimated_tokens = estimate_prompt_tokens(messages)
+        self.lease_name = f"provider:{self.limiter.name}"
+        self.lease_holder = None
+
+    def _try_shared_lease(self):
+        holder = f"{process_id()}:{next(_lease_sequence)}" if self.lease_holder is None else self.lease_holder
+        if try_acquire_lease(self.lease_name, holder, self.limiter.concurrency, shared_provider_lease_seconds):
+            self.lease_holder = holder
+            return True
+        return False
+
+    def _release(self):
+        if self.lease_holder is not None:
+            release_lease(self.lease_name, self.lease_holder)
+            self.lease_holder = None
+        self.limiter.release()
+
+    def _wait_timeout(self):
+        timeout = background_wait_seconds if self.priority == PRIORITY_BACKGROUND else interactive_wait_seconds
+        if self.deadline is not None:
+            timeout = self.deadline.timeout_for(timeout)
+        return timeout
+
+    def _admitted(self, admitted, timeout, start_time):
+        if not admitted:
+            increment_counter("provider_rate_limited", limiter=self.limiter.name, priority=self.priority)
+            raise RateLimitExceededError(f"Rate limit wait timeout for {self.limiter.name} after {timeout:.0f}s")
+        waited = time.time() - start_time
+        if waited > 0.05:
+            increment_counter("provider_rate_limit_wait_seconds", waited, limiter=self.limiter.name, priority=self.priority)
+            if debugging:
+                print(f"Waited {waited:.2f}s for a {self.priority} slot on {self.limiter.name}")
+        return self
+
+    def __enter__(self):
+        timeout = self._wait_timeout()
+        start_time = time.time()
+        cancelled = self.deadline.cancelled if self.deadline is not None else None
+        admitted = self.limiter.acquire(self.priority, self.estimated_tokens, timeout, cancelled)
+        if not admitted and cancelled is not None and cancelled():
+            self.deadline.check("Provider slot wait")
+        if admitted and shared_provider_limits:
+            while not self._try_shared_lease():
+                if time.time() - start_time >= timeout:
+                    self.limiter.release()
+                    admitted = False
+                    break
+                time.sleep(shared_state_poll_seconds)
+        return self._admitted(admitted, timeout, start_time)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._release()
+        return False
+
+class AsyncProviderSlot(ProviderSlot):
+    async def __aenter__(self):
+        timeout = self._wait_timeout()
+        start_time = time.time()
+        admitted = await self.limiter.acquire_async(self.priority, self.estimated_tokens, timeout)
+        if admitted and shared_provider_limits:
+            while not await asyncio.to_thread(self._try_shared_lease):
+                if time.time() - start_time >= timeout:
+                    self.limiter.release()
+                    admitted = False
+                    break
+                await asyncio.sleep(shared_state_poll_seconds)
+        return self._admitted(admitted, timeout, start_time)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.lease_holder is not None:
+            await asyncio.to_thread(release_lease, self.lease_name, self.lease_holder)
+            self.lease_holder = None
+        self.limiter.release()
+        return False
+
+def get_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+register_collector("provider_limits", get_limiter_stats)
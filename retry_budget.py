@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import increment_counter, register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+retry_budget_ratio = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+retry_budget_min_per_second = float(os.getenv("RETRY_BUDGET_MIN_RETRIES_PER_SECOND", "0.1"))
+retry_budget_max_tokens = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "20"))
+
+class RetryBudget:
+    # First attempts deposit `ratio` tokens and a retry costs one, so across every layer
+    # that retries provider calls the process never sends more than ratio extra requests.
+    # A small time-based refill keeps retries possible when traffic is very low.
+    def __init__(self, ratio, min_per_second, max_tokens):
+        self.ratio = max(0.0, ratio)
+        self.min_per_second = max(0.0, min_per_second)
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.last_refill = time.time()
+        self.first_attempts = 0
+        self.retries_allowed = 0
+        self.retries_denied = 0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.last_refill) * self.min_per_second)
+        self.last_refill = now
+
+    def record_first_attempt(self):
+        with self._lock:
+            self._refill()
+            self.first_attempts += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_acquire_retry(self):
+        with self._lock:
+            self._refill()
+            if self.tokens < 1.0:
+                self.retries_denied += 1
+                return False
+            self.tokens -= 1.0
+            self.retries_allowed += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._refill()
+            return {
+                "tokens": round(self.tokens, 3),
+                "first_attempts": self.first_attempts,
+                "retries_allowed": self.retries_allowed,
+                "retries_denied": self.retries_denied
+            }
+
+retry_budget = RetryBudget(retry_budget_ratio, retry_budget_min_per_second, retry_budget_max_tokens)
+
+def record_first_attempt(call_site: str):
+    retry_budget.record_first_attempt()
+    increment_counter("provider_first_attempts", call_site=call_site)
+
+def try_acquire_retry(call_site: str) -> bool:
+    allowed = retry_budget.try_acquire_retry()
+    increment_counter("provider_retries", call_site=call_site, outcome="allowed" if allowed else "denied")
+    if debugging and not allowed:
+        print(f"Retry budget exhausted, skipping retry at {call_site}")
+    return allowed
+
+register_collector("retry_budget", retry_budget.stats)
@@ -0,0 +1,180 @@
+import os
+import time
+import requests
+from typing import Dict, Any, List
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from local_index import search_local_index
+from circuit_breaker import get_breaker
+from latency_stats import record_operation_latency
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+# Backends are tried in this order until one returns results; set SEARCH_BACKENDS=local
+# on hosts without outbound network access so no request waits on an unreachable API.
+search_backend_order = [name.strip() for name in os.getenv("SEARCH_BACKENDS", "duckduckgo,local").split(",") if name.strip()]
+
+search_timeout_seconds = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "8"))
+search_http_pool_size = int(os.getenv("SEARCH_HTTP_POOL_SIZE", "10"))
+
+# One pooled session keeps TLS connections to the search API alive between tool calls.
+search_http_session = requests.Session()
+search_http_session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; SearchBot/1.0)'})
+search_http_session.mount("https://", HTTPAdapter(pool_connections=search_http_pool_size, pool_maxsize=search_http_pool_size))
+
+_backends = {}
+
+# The source names of all registered backends. Only their results are live answers;
+# anything else search_web returns is fallback guidance.
+LIVE_SEARCH_SOURCES = set()
+
+def register_search_backend(name, source, search_fn):
+    # search_fn(query, num_results) returns a list of {"title", "snippet", "url", "source"} dicts.
+    _backends[name] = (source, search_fn)
+    LIVE_SEARCH_SOURCES.add(source)
+
+def run_search_backends(query, num_results):
+    for name in search_backend_order:
+        backend = _backends.get(name)
+        if backend is None:
+            continue
+        source, search_fn = backend
+        start_time = time.time()
+        try:
+            results = search_fn(query, num_results)
+        except Exception as e:
+            print(f"Search backend {name} failed: {e}")
+            results = []
+        record_operation_latency("search_backend", name, time.time() - start_time)
+        increment_counter("search_backend_calls", backend=name, outcome="results" if results else "empty")
+        if results:
+            if debugging:
+                print(f"   Search backend {name} returned {len(results)} results")
+            return source, results
+    return None, []
+
+def search_duckduckgo(query: str, num_results: int) -> List[Dict[str, Any]]:
+    breaker = get_breaker("duckduckgo")
+    if not breaker.allow_request():
+        if debugging:
+            print(f"   DuckDuckGo circuit open, skipping")
+        return []
+
+    try:
+        if debugging:
+            print(f"   Strategy 1: DuckDuckGo Instant Answer API")
+        
+        ddg_url = "https://api.duckduckgo.com/"
+        params = {
+            "q": query,
+            "format": "json",
+            "no_html": "1",
+            "skip_disambig": "1",
+            "no_redirect": "1",
+            "safe_search": "moderate"
+        }
+        
+        if debugging:
+            print(f"   Making request to: {ddg_url}")
+            print(f"   Parameters: {params}")
+        
+        try:
+            response = search_http_session.get(ddg_url, params=params, timeout=search_timeout_seconds)
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        
+        if debugging:
+            print(f"   Response status: {response.status_code}")
+            print(f"   Response length: {len(response.text)} characters")
+        
+        response.raise_for_status()
+        
+        if response.text.strip():
+            try:
+                data = response.json()
+                if debugging:
+                    print(f"    JSON parsed successfully")
+                    print(f"   Response keys: {list(data.keys())}")
+                
+                meta = data.get('meta', {})
+                if (meta.get('name') == 'Just Another Test' or
+                    meta.get('id') == 'just_another_test' or
+                    meta.get('production_state') == 'offline'):
+                    if debugging:
+                        print(f"    Detected test response, skipping DuckDuckGo API")
+                    raise ValueError("Test response detected")
+                
+                results = []
+                
+                if data.get("AbstractText") and len(data.get("AbstractText", "").strip()) > 10:
+                    if debugging:
+                        print(f"   Found instant answer: {data.get('Heading', 'No heading')}")
+                    results.append({
+                        "title": data.get("Heading", query.title()),
+                        "snippet": data.get("AbstractText", ""),
+                        "url": data.get("AbstractURL", ""),
+                        "source": "DuckDuckGo Instant Answer"
+                    })
+                
+                if data.get("Definition") and len(data.get("Definition", "").strip()) > 10:
+                    if debugging:
+                        print(f"   Found definition")
+                    results.append({
+                        "title": f"Definition: {query}",
+                        "snippet": data.get("Definition", ""),
+                        "url": data.get("DefinitionURL", ""),
+                        "source": "DuckDuckGo Definition"
+                    })
+                
+                related_topics = data.get("RelatedTopics", [])
+                if related_topics:
+                    if debugging:
+                        print(f"   Found {len(related_topics)} related topics")
+                    for i, topic in enumerate(related_topics[:num_results-len(results)]):
+                        if isinstance(topic, dict) and topic.get("Text"):
+                            text = topic.get("Text", "")
+                            if len(text.strip()) > 20:
+                                if debugging:
+                                    print(f"     Topic {i+1}: {text[:50]}...")
+                                
+                                title = query.title()
+                                if topic.get("Result"):
+                                    result_text = topic.get("Result", "")
+                                    if " - " in result_text:
+                                        title = result_text.split(" - ")[0]
+                                    elif len(result_text) < 100:
+                                        title = result_text
+                                
+                                results.append({
+                                    "title": title,
+                                    "snippet": text,
+                                    "url": topic.get("FirstURL", ""),
+                                    "source": "DuckDuckGo Related"
+                                })
+                
+                if results:
+                    if debugging:
+                        print(f"    STRATEGY 1 SUCCESS: Found {len(results)} results")
+                        for i, result in enumerate(results, 1):
+                            print(f"     Result {i}: {result['title']}")
+                    
+                    return results[:num_results]
+                else:
+                    if debugging:
+                        print(f"    Strategy 1: No meaningful results found")
+            
+            except ValueError as json_error:
+                if debugging:
+                    print(f"    Strategy 1 JSON ERROR: {json_error}")
+
+    except (requests.RequestException, ValueError) as e:
+        if debugging:
+            print(f"    Strategy 1 ERROR: {e}")
+    return []
+
+register_search_backend("duckduckgo", "DuckDuckGo API", search_duckduckgo)
+register_search_backend("local", "Local knowledge index", search_local_index)
@@ -0,0 +1,143 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from db_utilities import get_search_cache_entry, store_search_cache_entry
+from background_jobs import submit_background_job, JOB_PRIORITY_REFRESH
+from single_flight import single_flight, make_call_key
+from search_backends import LIVE_SEARCH_SOURCES
+from metrics import increment_counter, register_collector
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+search_cache_enabled = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+search_cache_size = int(os.getenv("SEARCH_CACHE_SIZE", "500"))
+search_cache_ttl_seconds = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+search_cache_stale_seconds = float(os.getenv("SEARCH_CACHE_STALE_SECONDS", "86400"))
+search_cache_negative_ttl_seconds = float(os.getenv("SEARCH_CACHE_NEGATIVE_TTL_SECONDS", "300"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_search_query(query):
+    return _WHITESPACE_RE.sub(" ", (query or "").strip().lower()).strip(" ?!.")
+
+class SearchCache:
+    # Two tiers: an in-process LRU answers repeats in microseconds, and the search_cache
+    # table lets every worker process share results and survive restarts.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0, "stale": 0, "miss": 0}
+
+    def _count(self, outcome):
+        with self._lock:
+            self.hits[outcome] += 1
+        increment_counter("search_cache", outcome=outcome)
+
+    def _remember(self, key, result, fresh_until, stale_until):
+        with self._lock:
+            self._entries[key] = (result, fresh_until, stale_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    return entry, "memory"
+                del self._entries[key]
+
+        row = get_search_cache_entry(key, now)
+        if row is None:
+            return None, None
+        try:
+            result = json.loads(row[0])
+        except ValueError:
+            return None, None
+        self._remember(key, result, row[1], row[2])
+        return (result, row[1], row[2]), "disk"
+
+    def _store(self, key, result):
+        # Only answers from a live backend are worth serving stale; fallback guidance is cached
+        # briefly so a flapping API is retried soon.
+        now = time.time()
+        if result.get("source") in LIVE_SEARCH_SOURCES:
+            fresh_until = now + search_cache_ttl_seconds
+            stale_until = fresh_until + search_cache_stale_seconds
+        else:
+            fresh_until = stale_until = now + search_cache_negative_ttl_seconds
+        self._remember(key, result, fresh_until, stale_until)
+        store_search_cache_entry(key, json.dumps(result, ensure_ascii=False), fresh_until, stale_until, now)
+
+    def _refresh(self, key, fetch):
+        try:
+            result = fetch()
+            # A failed refresh keeps serving the stale answer instead of replacing it with guidance.
+            if result.get("success") and result.get("source") in LIVE_SEARCH_SOURCES:
+                self._store(key, result)
+                increment_counter("search_cache_refreshes", outcome="refreshed")
+            else:
+                increment_counter("search_cache_refreshes", outcome="kept_stale")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        if not submit_background_job("search_refresh", self._refresh, (key, fetch), JOB_PRIORITY_REFRESH):
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, key, fetch):
+        now = time.time()
+        entry, tier = self._lookup(key, now)
+        if entry is not None:
+            result, fresh_until, _ = entry
+            if fresh_until > now:
+                self._count(tier)
+            else:
+                self._count("stale")
+                self._schedule_refresh(key, fetch)
+            return result
+
+        self._count("miss")
+        result = single_flight(make_call_key("search", key), fetch)
+        if result.get("success"):
+            self._store(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.hits)
+            stats["entries"] = len(self._entries)
+            stats["refreshing"] = len(self._refreshing)
+        lookups = stats["memory"] + stats["disk"] + stats["stale"] + stats["miss"]
+        stats["hit_rate"] = round((lookups - stats["miss"]) / lookups, 4) if lookups else 0.0
+        stats["enabled"] = search_cache_enabled
+        return stats
+
+search_cache = SearchCache(search_cache_size)
+
+def cached_search(query, num_results, fetch):
+    # fetch() runs the live search; callers get back a result they may modify freely.
+    if not search_cache_enabled:
+        return fetch()
+    key = f"{num_results}:{normalize_search_query(query)}"
+    return dict(search_cache.get_or_fetch(key, fetch))
+
+def get_search_cache_stats():
+    return search_cache.stats()
+
+register_collector("search_cache", get_search_cache_stats)
@@ -0,0 +1,230 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+shared_state_path = os.getenv("SHARED_STATE_PATH", "shared_state.sqlite")
+shared_state_poll_seconds = float(os.getenv("SHARED_STATE_POLL_SECONDS", "0.2"))
+shared_version_poll_seconds = float(os.getenv("SHARED_VERSION_POLL_SECONDS", "1"))
+shared_state_version_ttl_seconds = float(os.getenv("SHARED_STATE_VERSION_TTL_SECONDS", "86400"))
+
+# Bumps made by this process set the key's Event and wake only that key's waiters. Bumps from
+# other worker processes are the slower fallback: one poller thread per process re-reads the
+# versions of all watched keys in a single query.
+_version_watches = {}
+_version_watches_lock = threading.Lock()
+_version_poller_started = False
+
+def _reset_after_fork():
+    global _version_watches, _version_watches_lock, _version_poller_started
+    _version_watches = {}
+    _version_watches_lock = threading.Lock()
+    _version_poller_started = False
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def process_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _connect():
+    conn = sqlite3.connect(shared_state_path, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def initialize_shared_state():
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS shared_version (
+                key         TEXT    PRIMARY KEY,
+                version     INTEGER NOT NULL,
+                updated_at  REAL    NOT NULL
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS shared_lease (
+                name        TEXT    NOT NULL,
+                holder      TEXT    NOT NULL,
+                expires_at  REAL    NOT NULL,
+                PRIMARY KEY (name, holder)
+            )
+        """)
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in initialize_shared_state:", e)
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def bump_version(key):
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO shared_version (key, version, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+            (key, time.time())
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        increment_counter("shared_state_errors", operation="bump_version")
+        if debugging:
+            print("SQLite error in bump_version:", e)
+    finally:
+        cur.close()
+        conn.close()
+    _notify_watchers(key)
+
+def get_version(key):
+    conn = sqlite3.connect(shared_state_path, timeout=5)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT version FROM shared_version WHERE key = ?", (key,))
+        row = cur.fetchone()
+        return row[0] if row else 0
+    except sqlite3.Error as e:
+        increment_counter("shared_state_errors", operation="get_version")
+        if debugging:
+            print("SQLite error in get_version:", e)
+        return 0
+    finally:
+        cur.close()
+        conn.close()
+
+def get_versions(keys):
+    versions = {}
+    conn = sqlite3.connect(shared_state_path, timeout=5)
+    cur = conn.cursor()
+    try:
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            cur.execute(f"SELECT key, version FROM shared_version WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            versions.update(cur.fetchall())
+        return {key: versions.get(key, 0) for key in keys}
+    except sqlite3.Error as e:
+        increment_counter("shared_state_errors", operation="get_versions")
+        if debugging:
+            print("SQLite error in get_versions:", e)
+        return {}
+    finally:
+        cur.close()
+        conn.close()
+
+def _notify_watchers(key):
+    with _version_watches_lock:
+        watch = _version_watches.pop(key, None)
+    if watch is not None:
+        watch[0].set()
+
+def _poll_versions():
+    while True:
+        time.sleep(shared_version_poll_seconds)
+        with _version_watches_lock:
+            watched = {key: watch[2] for key, watch in _version_watches.items()}
+        if not watched:
+            continue
+        for key, version in get_versions(list(watched)).items():
+            if version != watched[key]:
+                _notify_watchers(key)
+
+def _watch_version(key, seen_version):
+    # Waiters on one key share [Event, waiter count, version when the watch started];
+    # the last one to leave removes it.
+    global _version_poller_started
+    with _version_watches_lock:
+        watch = _version_watches.get(key)
+        if watch is None:
+            watch = _version_watches[key] = [threading.Event(), 0, seen_version]
+        watch[1] += 1
+        if not _version_poller_started:
+            _version_poller_started = True
+            threading.Thread(target=_poll_versions, name="shared-version-poller", daemon=True).start()
+        return watch
+
+def _unwatch_version(key, watch):
+    with _version_watches_lock:
+        watch[1] -= 1
+        if watch[1] == 0 and _version_watches.get(key) is watch:
+            del _version_watches[key]
+
+def wait_for_version(key, seen_version, timeout):
+    # True once the version may differ from seen_version, False after timeout; callers re-read
+    # their own state either way.
+    watch = _watch_version(key, seen_version)
+    try:
+        # A bump between the caller reading seen_version and the watch starting is caught here.
+        if get_version(key) != seen_version:
+            return True
+        return watch[0].wait(timeout)
+    finally:
+        _unwatch_version(key, watch)
+
+def try_acquire_lease(name, holder, limit, ttl_seconds):
+    # At most `limit` holders per name across all worker processes. Leases expire after
+    # ttl_seconds so a crashed worker cannot hold a slot forever; holding again renews.
+    # The shared layer fails open: a storage error never blocks the caller.
+    now = time.time()
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("DELETE FROM shared_lease WHERE name = ? AND expires_at <= ?", (name, now))
+        cur.execute("SELECT COUNT(*) FROM shared_lease WHERE name = ? AND holder != ?", (name, holder))
+        if cur.fetchone()[0] >= limit:
+            conn.rollback()
+            return False
+        cur.execute(
+            "INSERT INTO shared_lease (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name, holder) DO UPDATE SET expires_at = excluded.expires_at",
+            (name, holder, now + ttl_seconds)
+        )
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        increment_counter("shared_state_errors", operation="acquire_lease")
+        if debugging:
+            print("SQLite error in try_acquire_lease:", e)
+        return True
+    finally:
+        cur.close()
+        conn.close()
+
+def release_lease(name, holder):
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM shared_lease WHERE name = ? AND holder = ?", (name, holder))
+        conn.commit()
+    except sqlite3.Error as e:
+        increment_counter("shared_state_errors", operation="release_lease")
+        if debugging:
+            print("SQLite error in release_lease:", e)
+    finally:
+        cur.close()
+        conn.close()
+
+def prune_shared_state():
+    now = time.time()
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM shared_lease WHERE expires_at <= ?", (now,))
+        cur.execute("DELETE FROM shared_version WHERE updated_at <= ?", (now - shared_state_version_ttl_seconds,))
+        conn.commit()
+    except sqlite3.Error as e:
+        if debugging:
+            print("SQLite error in prune_shared_state:", e)
+    finally:
+        cur.close()
+        conn.close()
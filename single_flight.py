@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import threading
+from dotenv import load_dotenv
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+single_flight_enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def make_call_key(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def single_flight(key, fn):
+    if not single_flight_enabled:
+        return fn()
+
+    with _in_flight_lock:
+        call = _in_flight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _InFlightCall()
+            _in_flight[key] = call
+        else:
+            call.followers += 1
+
+    if not is_leader:
+        increment_counter("single_flight_shared")
+        if debugging:
+            print(f"Joining in-flight call {key[:12]}")
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    increment_counter("single_flight_leader")
+    try:
+        call.result = fn()
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        call.done.set()
+
+def get_in_flight_count():
+    with _in_flight_lock:
+        return len(_in_flight)
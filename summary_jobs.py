@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from db_utilities import (enqueue_summary_job, enqueue_missing_summary_jobs, get_due_summary_job_ids,
+                          claim_summary_job, complete_summary_job, reschedule_summary_job, dead_letter_summary_job,
+                          requeue_failed_summaries)
+from background_jobs import submit_background_job, JOB_PRIORITY_SUMMARY
+from retry_budget import try_acquire_retry
+from metrics import increment_counter
+from shared_state import process_id, try_acquire_lease, prune_shared_state
+from deadline import Deadline
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+summary_job_lease_seconds = float(os.getenv("SUMMARY_JOB_LEASE_SECONDS", "180"))
+# The whole job (summary, title and checkpoint calls) must finish this long before its lease
+# expires, so an expired lease always means the worker is gone and the job is never run twice.
+summary_job_lease_margin_seconds = float(os.getenv("SUMMARY_JOB_LEASE_MARGIN_SECONDS", "20"))
+summary_job_max_attempts = int(os.getenv("SUMMARY_JOB_MAX_ATTEMPTS", "4"))
+summary_job_backoff_seconds = float(os.getenv("SUMMARY_JOB_BACKOFF_SECONDS", "5"))
+summary_job_max_backoff_seconds = float(os.getenv("SUMMARY_JOB_MAX_BACKOFF_SECONDS", "300"))
+summary_job_poll_seconds = float(os.getenv("SUMMARY_JOB_POLL_SECONDS", "5"))
+summary_job_poll_batch = int(os.getenv("SUMMARY_JOB_POLL_BATCH", "20"))
+summary_sweep_interval_seconds = float(os.getenv("SUMMARY_SWEEP_INTERVAL_SECONDS", "60"))
+summary_sweep_batch_size = int(os.getenv("SUMMARY_SWEEP_BATCH_SIZE", "10"))
+summary_sweep_cooldown_seconds = float(os.getenv("SUMMARY_SWEEP_COOLDOWN_SECONDS", "600"))
+summary_sweep_max_requeues = int(os.getenv("SUMMARY_SWEEP_MAX_REQUEUES", "3"))
+
+SWEEPER_LEASE = "summary_sweeper"
+
+worker_id = process_id()
+
+_job_handler = None
+_job_finished = None
+_queued_job_ids = set()
+_queued_job_ids_lock = threading.Lock()
+_dispatcher_started = False
+
+def _reset_after_fork():
+    # A worker forked from a preloaded parent needs its own lease owner id and its own dispatcher thread.
+    global worker_id, _queued_job_ids, _queued_job_ids_lock, _dispatcher_started
+    worker_id = process_id()
+    _queued_job_ids = set()
+    _queued_job_ids_lock = threading.Lock()
+    _dispatcher_started = False
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def register_summary_job_handler(handler, on_finished=None):
+    # handler(job, deadline) raises on failure and stops its provider calls once deadline expires; on_finished(job, succeeded) runs once the job is done or dead-lettered.
+    global _job_handler, _job_finished
+    _job_handler = handler
+    _job_finished = on_finished
+
+def _backoff_for(attempts):
+    return min(summary_job_max_backoff_seconds, summary_job_backoff_seconds * (2 ** max(0, attempts - 1)))
+
+def _finish(job, succeeded):
+    if _job_finished is None:
+        return
+    try:
+        _job_finished(job, succeeded)
+    except Exception as e:
+        print(f"Summary job {job['id']} finish hook failed: {e}")
+
+def process_summary_job(job_id):
+    with _queued_job_ids_lock:
+        _queued_job_ids.discard(job_id)
+
+    job = claim_summary_job(job_id, worker_id, summary_job_lease_seconds)
+    if job is None:
+        return
+
+    deadline = Deadline(max(1.0, summary_job_lease_seconds - summary_job_lease_margin_seconds))
+    try:
+        _job_handler(job, deadline)
+    except Exception as e:
+        if job["attempts"] >= summary_job_max_attempts:
+            dead_letter_summary_job(job_id, worker_id, e)
+            increment_counter("summary_jobs", outcome="dead_lettered")
+            if job["sweep_count"]:
+                increment_counter("summary_sweeper", outcome="failed_again")
+            print(f"Summary job {job_id} for message {job['message_id']} dead-lettered after {job['attempts']} attempts: {e}")
+            _finish(job, False)
+            return
+        # Without retry budget the job is not dropped, only pushed back to the longest backoff.
+        delay = _backoff_for(job["attempts"]) if try_acquire_retry("summary_job") else summary_job_max_backoff_seconds
+        reschedule_summary_job(job_id, worker_id, delay, e)
+        increment_counter("summary_jobs", outcome="rescheduled")
+        if debugging:
+            print(f"Summary job {job_id} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {e}")
+        return
+
+    complete_summary_job(job_id, worker_id)
+    increment_counter("summary_jobs", outcome="completed")
+    if job["sweep_count"]:
+        increment_counter("summary_sweeper", outcome="recovered")
+    _finish(job, True)
+
+def _submit(job_id):
+    with _queued_job_ids_lock:
+        if job_id in _queued_job_ids:
+            return False
+        _queued_job_ids.add(job_id)
+    # A job the pool cannot take stays pending in the table and is picked up by the next poll.
+    if not submit_background_job("summary_job", process_summary_job, (job_id,), JOB_PRIORITY_SUMMARY):
+        with _queued_job_ids_lock:
+            _queued_job_ids.discard(job_id)
+        return False
+    return True
+
+def enqueue_summary(message_id, session_id, needs_title=False):
+    job_id = enqueue_summary_job(message_id, session_id, needs_title)
+    if job_id is None:
+        return None
+    increment_counter("summary_jobs", outcome="enqueued")
+    _submit(job_id)
+    return job_id
+
+def _dispatch_due_jobs():
+    for job_id in get_due_summary_job_ids(summary_job_poll_batch):
+        _submit(job_id)
+
+def sweep_failed_summaries():
+    # Failed summaries go back through the job queue a bounded batch at a time, after a cooldown
+    # and at most summary_sweep_max_requeues times, so recovery never happens on a request thread.
+    requeued = requeue_failed_summaries(summary_sweep_batch_size, summary_sweep_cooldown_seconds, summary_sweep_max_requeues)
+    if requeued:
+        increment_counter("summary_sweeper", requeued, outcome="requeued")
+        if debugging:
+            print(f"Summary sweeper requeued {requeued} failed summaries")
+    return requeued
+
+def _dispatcher_loop():
+    next_sweep = 0
+    while True:
+        try:
+            if time.time() >= next_sweep:
+                next_sweep = time.time() + summary_sweep_interval_seconds
+                # One worker process sweeps per interval; the lease passes on if it stops renewing.
+                if try_acquire_lease(SWEEPER_LEASE, worker_id, 1, summary_sweep_interval_seconds * 2):
+                    sweep_failed_summaries()
+                    prune_shared_state()
+            _dispatch_due_jobs()
+        except Exception as e:
+            print(f"Summary job dispatcher error: {e}")
+        time.sleep(summary_job_poll_seconds)
+
+def start_summary_job_dispatcher():
+    # Resumes work lost to a restart: unsummarized messages become jobs, and expired leases
+    # from crashed workers (in this or another process) are reclaimed on the next poll.
+    global _dispatcher_started
+    if _dispatcher_started:
+        return
+    _dispatcher_started = True
+    enqueue_missing_summary_jobs()
+    threading.Thread(target=_dispatcher_loop, name="summary-job-dispatcher", daemon=True).start()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+# Hundreds of sessions wait for their pending summary at once while worker threads finish the
+# jobs in random order. Reports how fast each waiter wakes after its own job completes and how
+# much CPU the waiting costs. Runs against a throwaway database in a temporary directory.
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percentile * (len(values) - 1))))]
+
+def _complete_jobs(jobs, workers, completed_at):
+    from db_utilities import claim_summary_job, complete_summary_job
+    from chatbot_manage import mark_summary_complete
+
+    pending = list(jobs)
+    random.shuffle(pending)
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                session_id, job_id = pending.pop()
+            claim_summary_job(job_id, "stress-test", 60)
+            complete_summary_job(job_id, "stress-test")
+            completed_at[session_id] = time.time()
+            mark_summary_complete(session_id)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def run(sessions, idle_seconds, workers, cross_process):
+    from db_utilities import initialize_summary_job_table, enqueue_summary_job
+    from shared_state import initialize_shared_state
+    from chatbot_manage import wait_for_pending_summary_completion
+
+    initialize_summary_job_table()
+    initialize_shared_state()
+    jobs = [(session_id, enqueue_summary_job(session_id, session_id)) for session_id in range(1, sessions + 1)]
+
+    woke_at = {}
+    results = {}
+
+    def wait(session_id):
+        results[session_id] = wait_for_pending_summary_completion(session_id, timeout=idle_seconds + 60)
+        woke_at[session_id] = time.time()
+
+    waiters = [threading.Thread(target=wait, args=(session_id,)) for session_id, _ in jobs]
+    for thread in waiters:
+        thread.start()
+
+    cpu_start, wall_start = time.process_time(), time.time()
+    time.sleep(idle_seconds)
+    idle_cpu = time.process_time() - cpu_start
+    idle_wall = time.time() - wall_start
+
+    completed_at = {}
+    if cross_process:
+        # Another worker process finishes the jobs; only the SQLite fallback can wake the waiters.
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _complete_jobs(jobs, workers, completed_at)
+            os.write(write_fd, json.dumps(completed_at).encode("utf-8"))
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as pipe:
+            completed_at = {int(session_id): at for session_id, at in json.loads(pipe.read()).items()}
+        os.waitpid(pid, 0)
+    else:
+        _complete_jobs(jobs, workers, completed_at)
+    for thread in waiters:
+        thread.join()
+
+    delays = [woke_at[session_id] - completed_at[session_id] for session_id, _ in jobs]
+    print(f"{sessions} sessions waiting {'across processes' if cross_process else 'in one process'}, {workers} completing workers")
+    print(f"idle waiting: {idle_cpu:.3f}s CPU over {idle_wall:.1f}s wall ({idle_cpu / idle_wall * 100:.1f}% of one core)")
+    print(f"completed: {sum(1 for ok in results.values() if ok)}/{sessions}")
+    print(f"wake delay after own completion: p50 {_percentile(delays, 0.5) * 1000:.1f}ms, "
+          f"p99 {_percentile(delays, 0.99) * 1000:.1f}ms, max {max(delays) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress test waiting for pending summaries across many sessions.")
+    parser.add_argument("--sessions", type=int, default=500, help="concurrently waiting sessions")
+    parser.add_argument("--idle-seconds", type=float, default=5.0, help="how long every session waits before jobs complete")
+    parser.add_argument("--workers", type=int, default=8, help="threads completing summary jobs")
+    parser.add_argument("--cross-process", action="store_true", help="complete the jobs from a forked worker process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        os.environ["SHARED_STATE_PATH"] = os.path.join(work_dir, "shared_state.sqlite")
+        run(args.sessions, args.idle_seconds, args.workers, args.cross_process)
@@ -0,0 +1,202 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from dotenv import load_dotenv
+from metrics import increment_counter
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+TOOL_KEYWORDS = {"search", "find", "calculate", "what is", "current", "latest", "what's", "whats"}
+SEARCH_KEYWORDS = {
+    "search web", "web search", "search for", "look up",
+    "find information", "current", "latest", "recent",
+    "what is the", "exchange rate", "news about", "information about",
+    "find", "search", "whats"
+}
+SEARCH_TRIGGER_KEYWORDS = {"search", "find", "current", "latest", "what is"}
+MATH_KEYWORDS = {"calculate", "what is", "solve", "times", "plus", "minus", "divided", "multiply"}
+
+TOOL_SYMBOL_PATTERN = re.compile(r"[+\-*/=]")
+MATH_SYMBOL_PATTERN = re.compile(r"[+\-*/=^]")
+DIGIT_PATTERN = re.compile(r"\d")
+TRAILING_PUNCTUATION_PATTERN = re.compile(r"[.!?]+\s*$")
+
+SEARCH_PREFIX_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r"search\s+(web\s+)?for\s+",
+    r"look\s+up\s+",
+    r"find\s+information\s+(about\s+)?",
+    r"web\s+search\s*",
+    r"search\s+the\s+web\s+for\s+",
+    r"can\s+you\s+search\s+(for\s+)?",
+    r"please\s+search\s+(for\s+)?",
+    r"\.?\s*search\s+web\s*\.?$"
+]]
+
+NATURAL_LANGUAGE_MATH_PATTERN_INDEX = 4
+MATH_PATTERNS = [re.compile(pattern) for pattern in [
+    r"calculate\s+(.+)",
+    r"what\s+is\s+(.+)",
+    r"(\d+[\+\-\*/\^\(\)\s\d\.]+[\d\.]+)\s*[=?]?",
+    r"solve\s+(.+)",
+    r"(\d+)\s+(times|multiplied\s+by|plus|minus|divided\s+by)\s+(\d+)",
+    r"(\d+)\s*[\*\+\-\/\^]\s*(\d+)"
+]]
+
+MATH_WORD_REPLACEMENTS = [
+    ("times", "*"), ("multiplied by", "*"), ("plus", "+"), ("minus", "-"),
+    ("divided by", "/"), ("×", "*"), ("÷", "/"), ("^", "**")
+]
+
+class KeywordMatcher:
+    # Aho-Corasick automaton: every keyword is found in one pass over the text, however
+    # many keywords there are, instead of one substring scan per keyword.
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+                self._goto[state][ch] = next_state
+            state = next_state
+        self._output[state].add(keyword)
+
+    def _build_failure_links(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        found = set()
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+keyword_matcher = KeywordMatcher(TOOL_KEYWORDS | SEARCH_KEYWORDS | SEARCH_TRIGGER_KEYWORDS | MATH_KEYWORDS)
+
+class ToolIntent:
+    def __init__(self, message, needs_tools, search_query=None, math_expression=None, math_label=None):
+        self.message = message
+        self.needs_tools = needs_tools
+        self.search_query = search_query
+        self.math_expression = math_expression
+        self.math_label = math_label
+
+def _extract_search_query(message):
+    search_query = message
+    for pattern in SEARCH_PREFIX_PATTERNS:
+        search_query = pattern.sub("", search_query).strip()
+    search_query = TRAILING_PUNCTUATION_PATTERN.sub("", search_query).strip()
+    return search_query if len(search_query) > 2 else None
+
+def _extract_math_expression(message_lower):
+    for index, pattern in enumerate(MATH_PATTERNS):
+        match = pattern.search(message_lower)
+        if not match:
+            continue
+        if index == NATURAL_LANGUAGE_MATH_PATTERN_INDEX:
+            label = " ".join(match.groups())
+        else:
+            label = match.group(1).strip()
+
+        expression = label
+        for word, symbol in MATH_WORD_REPLACEMENTS:
+            expression = expression.replace(word, symbol)
+
+        # Only the first matching pattern is considered, as the providers always did.
+        has_operators = any(op in expression for op in ["+", "-", "*", "/", "**", "(", ")"])
+        if DIGIT_PATTERN.search(expression) and (has_operators or "times" in label or "plus" in label):
+            return expression, label
+        if debugging:
+            print(f"   Expression doesn't qualify as math: '{expression}'")
+        return None, None
+    return None, None
+
+def detect_tool_intent(message):
+    # Decided once per user message; the result is passed down to the provider call.
+    message = (message or "").strip()
+    message_lower = message.lower()
+    found = keyword_matcher.find_all(message_lower)
+
+    needs_tools = bool(found & TOOL_KEYWORDS) or bool(TOOL_SYMBOL_PATTERN.search(message))
+    if not needs_tools:
+        return ToolIntent(message, False)
+
+    search_query = None
+    if found & SEARCH_KEYWORDS and found & SEARCH_TRIGGER_KEYWORDS:
+        search_query = _extract_search_query(message)
+
+    math_expression = math_label = None
+    has_digits = bool(DIGIT_PATTERN.search(message))
+    if found & MATH_KEYWORDS or (has_digits and MATH_SYMBOL_PATTERN.search(message)):
+        math_expression, math_label = _extract_math_expression(message_lower)
+
+    if debugging:
+        print(f"Tool intent: keywords={sorted(found)}, search={search_query!r}, math={math_expression!r}")
+    increment_counter("tool_intents", search=search_query is not None, math=math_expression is not None)
+    return ToolIntent(message, True, search_query, math_expression, math_label)
+
+def _load_corpus(path):
+    # User messages from a text file (one per line) or from the chat database.
+    if path:
+        with open(path, encoding="utf-8") as corpus_file:
+            return [line.strip() for line in corpus_file if line.strip()]
+    conn = sqlite3.connect('database.sqlite')
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT content FROM message WHERE sender = 'user' AND content IS NOT NULL")
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+
+def _per_message_us(function, corpus, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for message in corpus:
+            function(message)
+    return (time.perf_counter() - start_time) / (repeat * len(corpus)) * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time keyword matching and tool intent detection on real messages.")
+    parser.add_argument("--corpus", help="text file with one message per line (default: user messages in database.sqlite)")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the corpus")
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args.corpus)
+    if not corpus:
+        raise SystemExit("No messages to benchmark")
+    lowered = [message.lower() for message in corpus]
+    keywords = TOOL_KEYWORDS | SEARCH_KEYWORDS | SEARCH_TRIGGER_KEYWORDS | MATH_KEYWORDS
+    mismatches = sum(1 for text in lowered if keyword_matcher.find_all(text) != {k for k in keywords if k in text})
+    print(f"{len(corpus)} messages, {sum(len(m) for m in corpus) / len(corpus):.0f} chars on average, {mismatches} keyword mismatches")
+    print(f"substring scan:      {_per_message_us(lambda text: {k for k in keywords if k in text}, lowered, args.repeat):8.1f}us/message")
+    print(f"Aho-Corasick:        {_per_message_us(keyword_matcher.find_all, lowered, args.repeat):8.1f}us/message")
+    print(f"detect_tool_intent:  {_per_message_us(detect_tool_intent, corpus, args.repeat):8.1f}us/message")
@@ -0,0 +1,35 @@
+import math_evaluator
+from tools import execute_tool, calculate_math
+
+# Checks that the calculator memo only serves a result for an expression the evaluator would
+# read the same way. Run directly: python tool_memo_test.py
+
+def check(name, condition):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return condition
+
+def run():
+    memo = calculate_math.memo
+    passed = True
+
+    first = execute_tool("calculate_math", {"expression": "23"})
+    hits = memo.hits
+    split = execute_tool("calculate_math", {"expression": "2 3"})
+    passed &= check("'23' is evaluated", first.get("success") and first.get("result") == 23)
+    passed &= check("'2 3' after '23' is not a memo hit", memo.hits == hits)
+    passed &= check("'2 3' is rejected", not split.get("success"))
+
+    execute_tool("calculate_math", {"expression": "2 + 3"})
+    hits = memo.hits
+    spaced = execute_tool("calculate_math", {"expression": "  2   +\t3 "})
+    passed &= check("whitespace runs share the memo entry", memo.hits == hits + 1 and spaced.get("result") == 5)
+
+    execute_tool("calculate_math", {"expression": "2^10"})
+    hits = memo.hits
+    power = execute_tool("calculate_math", {"expression": "2**10"})
+    passed &= check("'^' and '**' share the memo entry", memo.hits == hits + 1 and power.get("result") == 1024)
+    return passed
+
+if __name__ == "__main__":
+    math_evaluator.math_use_process_pool = False
+    raise SystemExit(0 if run() else 1)
@@ -1,13 +1,121 @@
-import requests
-import math
 import re
-from typing import Dict, Any
+import json
+from typing import Dict, Any, List, Tuple
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
+from math_evaluator import evaluate_expression, MathEvaluationError
+from search_cache import cached_search
+from search_backends import run_search_backends, LIVE_SEARCH_SOURCES
+from latency_stats import record_operation_latency
+from metrics import increment_counter, register_collector
 
 load_dotenv()
 debugging = os.getenv("debugging", "false").lower() == "true"
 
+tool_worker_threads = int(os.getenv("TOOL_WORKER_THREADS", "16"))
+default_tool_timeout = float(os.getenv("TOOL_TIMEOUT_SECONDS", "5"))
+tool_timeouts = {
+    "search_web": float(os.getenv("SEARCH_TOOL_TIMEOUT_SECONDS", "5")),
+    "calculate_math": float(os.getenv("MATH_TOOL_TIMEOUT_SECONDS", "3"))
+}
+_tool_executor = ThreadPoolExecutor(max_workers=tool_worker_threads, thread_name_prefix="tool")
+
+# Native function calling lets the model decide which tools to call; when disabled the
+# regex-based tool_intent results are spliced into the prompt instead.
+native_tool_calling = os.getenv("NATIVE_TOOL_CALLING", "true").lower() == "true"
+max_tool_rounds = int(os.getenv("MAX_TOOL_ROUNDS", "3"))
+
+tool_memo_enabled = os.getenv("TOOL_MEMO_ENABLED", "true").lower() == "true"
+math_memo_ttl_seconds = float(os.getenv("MATH_MEMO_TTL_SECONDS", "86400"))
+math_memo_size = int(os.getenv("MATH_MEMO_SIZE", "2000"))
+search_memo_ttl_seconds = float(os.getenv("SEARCH_MEMO_TTL_SECONDS", "300"))
+search_memo_size = int(os.getenv("SEARCH_MEMO_SIZE", "500"))
+
+class ToolMemo:
+    def __init__(self, tool_name, ttl_seconds, max_entries, normalize=None, cacheable=None):
+        self.tool_name = tool_name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.normalize = normalize
+        self.cacheable = cacheable
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, parameters: Dict[str, Any]):
+        if self.normalize is not None:
+            parameters = self.normalize(parameters)
+        return json.dumps(parameters, sort_keys=True, default=str, ensure_ascii=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                result = None
+        increment_counter("tool_memo", tool=self.tool_name, outcome="miss" if result is None else "hit")
+        return None if result is None else dict(result)
+
+    def should_store(self, result):
+        if not isinstance(result, dict) or not result.get("success"):
+            return False
+        return self.cacheable is None or self.cacheable(result)
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def memoized_tool(ttl_seconds: float, max_entries: int, normalize=None, cacheable=None):
+    # Attaches a ToolMemo to the tool; execute_tool checks it before running the tool and
+    # stores successful results that pass cacheable(result), so direct calls to the function stay uncached.
+    def decorator(function):
+        function.memo = ToolMemo(function.__name__, ttl_seconds, max_entries, normalize, cacheable)
+        return function
+    return decorator
+
+def _normalize_math_parameters(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    expression = str(parameters.get("expression", ""))
+    for symbol, replacement in (("^", "**"), ("×", "*"), ("÷", "/")):
+        expression = expression.replace(symbol, replacement)
+    # Whitespace runs collapse to one space rather than vanishing: "2 3" is not "23".
+    return {"expression": re.sub(r"\s+", " ", expression).strip()}
+
+def _normalize_search_parameters(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "query": re.sub(r"\s+", " ", str(parameters.get("query", ""))).strip().lower(),
+        "num_results": parameters.get("num_results", 5)
+    }
+
+def _is_live_search_result(result: Dict[str, Any]) -> bool:
+    # Fallback guidance is not memoized, so the next call tries the backends again.
+    return result.get("source") in LIVE_SEARCH_SOURCES
+
+@memoized_tool(math_memo_ttl_seconds, math_memo_size, _normalize_math_parameters)
 def calculate_math(expression: str) -> Dict[str, Any]:
     try:
         if debugging:
@@ -19,23 +127,6 @@ def calculate_math(expression: str) -> Dict[str, Any]:
         if debugging:
             print(f"   Cleaned expression: '{expression}'")
         
-        safe_dict = {
-
-            "abs": abs, "round": round, "min": min, "max": max,
-            "sum": sum, "pow": pow,
-            
-            "sqrt": math.sqrt, "sin": math.sin, "cos": math.cos, "tan": math.tan,
-            "asin": math.asin, "acos": math.acos, "atan": math.atan,
-            "log": math.log, "log10": math.log10, "exp": math.exp,
-            "floor": math.floor, "ceil": math.ceil,
-            "degrees": math.degrees, "radians": math.radians,
-            "factorial": math.factorial,
-            
-            "pi": math.pi, "e": math.e,
-            
-            "__builtins__": {}
-        }
-        
         original_expr = expression
         expression = expression.replace("^", "**")
         expression = expression.replace("×", "*")
@@ -45,9 +136,9 @@ def calculate_math(expression: str) -> Dict[str, Any]:
             print(f"   Symbol replacement: '{original_expr}' → '{expression}'")
         
         if debugging:
-            print(f"   Evaluating with safe environment...")
+            print(f"   Evaluating with bounded evaluator...")
         
-        result = eval(expression, safe_dict)
+        result = evaluate_expression(expression)
         
         if debugging:
             print(f"    MATH SUCCESS: {expression} = {result} (type: {type(result).__name__})")
@@ -59,6 +150,19 @@ def calculate_math(expression: str) -> Dict[str, Any]:
             "type": type(result).__name__
         }
         
+    except MathEvaluationError as e:
+        if debugging:
+            print(f"    MATH ERROR: {e.error_type} - {e.message}")
+        errors = {
+            "division_by_zero": "Division by zero",
+            "too_large": "Result too large",
+            "timeout": e.message
+        }
+        return {
+            "expression": expression,
+            "error": errors.get(e.error_type, f"Invalid expression: {e.message}"),
+            "success": False
+        }
     except ZeroDivisionError:
         if debugging:
             print(f"    MATH ERROR: Division by zero")
@@ -92,6 +196,147 @@ def calculate_math(expression: str) -> Dict[str, Any]:
             "success": False
         }
 
+def _search_live(query: str, original_query: str, num_results: int) -> Dict[str, Any]:
+    source, results = run_search_backends(query, num_results)
+    if results:
+        return {
+            "query": query,
+            "original_query": original_query,
+            "results": results[:num_results],
+            "total_results": len(results),
+            "success": True,
+            "source": source
+        }
+    
+    if any(tld in query.lower() for tld in ['.com', '.org', '.net', '.edu', '.gov', '.io', '.co']):
+        if debugging:
+            print(f"   Strategy 2: Domain-specific search")
+        
+        domain_match = re.search(r'([a-zA-Z0-9-]+\.(?:com|org|net|edu|gov|io|co|uk|de|fr|tr))', query.lower())
+        if domain_match:
+            domain = domain_match.group(1)
+            
+            results = [
+                {
+                    "title": f"Visit {domain}",
+                    "snippet": f"To visit {domain}, you can go directly to https://{domain} or http://{domain}. This appears to be a website domain.",
+                    "url": f"https://{domain}",
+                    "source": "Domain suggestion"
+                },
+                {
+                    "title": f"Information about {domain}",
+                    "snippet": f"For information about {domain}, you could check: 1) The website directly, 2) WHOIS databases, 3) Web archives, or 4) Search engines like Google.",
+                    "url": f"https://www.google.com/search?q={domain}",
+                    "source": "Domain research guidance"
+                }
+            ]
+            
+            if debugging:
+                print(f"    STRATEGY 2 SUCCESS: Created domain-specific results for {domain}")
+            
+            return {
+                "query": query,
+                "original_query": original_query,
+                "results": results,
+                "total_results": len(results),
+                "success": True,
+                "source": "Domain-specific search"
+            }
+    
+    if debugging:
+        print(f"   Strategy 3: Enhanced fallback guidance")
+    
+    fallback_message = f"I would search for '{query}' but don't have access to live web search at the moment."
+    search_suggestions = []
+    
+    query_lower = query.lower()
+    
+    if any(term in query_lower for term in ["exchange rate", "currency", "usd", "try", "eur", "gbp", "bitcoin", "crypto"]):
+        guidance_type = "currency/finance"
+        fallback_message += " For current financial information, I recommend:"
+        search_suggestions = [
+            "XE.com for exchange rates",
+            "Google Finance or Yahoo Finance",
+            "CoinMarketCap for cryptocurrency",
+            "Your bank's website for official rates"
+        ]
+    elif any(term in query_lower for term in ["news", "latest", "current", "recent", "breaking"]):
+        guidance_type = "news"
+        fallback_message += " For latest news, try:"
+        search_suggestions = [
+            "Google News (news.google.com)",
+            "BBC News (bbc.com/news)",
+            "Reuters (reuters.com)",
+            "Associated Press (apnews.com)"
+        ]
+    elif any(term in query_lower for term in ["weather", "temperature", "forecast", "climate"]):
+        guidance_type = "weather"
+        fallback_message += " For weather information, check:"
+        search_suggestions = [
+            "Weather.com",
+            "AccuWeather.com",
+            "Google Weather (search 'weather [location]')",
+            "Your local meteorological service"
+        ]
+    elif any(term in query_lower for term in ["stock", "share", "market", "trading", "nasdaq", "dow"]):
+        guidance_type = "stocks"
+        fallback_message += " For stock market information:"
+        search_suggestions = [
+            "Yahoo Finance (finance.yahoo.com)",
+            "Google Finance",
+            "Bloomberg (bloomberg.com)",
+            "MarketWatch (marketwatch.com)"
+        ]
+    elif any(term in query_lower for term in ["recipe", "cooking", "ingredient", "food"]):
+        guidance_type = "recipes"
+        fallback_message += " For recipes and cooking information:"
+        search_suggestions = [
+            "AllRecipes (allrecipes.com)",
+            "Food Network (foodnetwork.com)",
+            "BBC Good Food",
+            "Serious Eats (seriouseats.com)"
+        ]
+    else:
+        guidance_type = "general"
+        fallback_message += " You can search for this on:"
+        search_suggestions = [
+            "Google (google.com)",
+            "DuckDuckGo (duckduckgo.com)",
+            "Bing (bing.com)",
+            "Specialized search engines for your topic"
+        ]
+    
+    if search_suggestions:
+        fallback_message += "\n• " + "\n• ".join(search_suggestions)
+    
+    if debugging:
+        print(f"   Guidance type: {guidance_type}")
+        print(f"   Suggestions count: {len(search_suggestions)}")
+    
+    result = {
+        "query": query,
+        "original_query": original_query,
+        "results": [
+            {
+                "title": f"Search guidance for: {query}",
+                "snippet": fallback_message,
+                "url": f"https://www.google.com/search?q={query.replace(' ', '+')}",
+                "source": "Search guidance"
+            }
+        ],
+        "total_results": 1,
+        "success": True,
+        "source": "Enhanced fallback guidance",
+        "note": "Live web search not available - providing enhanced search guidance",
+        "guidance_type": guidance_type
+    }
+    
+    if debugging:
+        print(f"    STRATEGY 3 SUCCESS: Returning enhanced guidance for {guidance_type} query")
+    
+    return result
+
+@memoized_tool(search_memo_ttl_seconds, search_memo_size, _normalize_search_parameters, _is_live_search_result)
 def search_web(query: str, num_results: int = 5) -> Dict[str, Any]:
     try:
         if debugging:
@@ -157,248 +402,8 @@ def search_web(query: str, num_results: int = 5) -> Dict[str, Any]:
         if debugging:
             print(f"   Final cleaned query: '{query}'")
         
-        try:
-            if debugging:
-                print(f"   Strategy 1: DuckDuckGo Instant Answer API")
-            
-            ddg_url = "https://api.duckduckgo.com/"
-            params = {
-                "q": query,
-                "format": "json",
-                "no_html": "1",
-                "skip_disambig": "1",
-                "no_redirect": "1",
-                "safe_search": "moderate"
-            }
-            
-            if debugging:
-                print(f"   Making request to: {ddg_url}")
-                print(f"   Parameters: {params}")
-            
-            response = requests.get(ddg_url, params=params, timeout=8,
-                                  headers={'User-Agent': 'Mozilla/5.0 (compatible; SearchBot/1.0)'})
-            
-            if debugging:
-                print(f"   Response status: {response.status_code}")
-                print(f"   Response length: {len(response.text)} characters")
-            
-            response.raise_for_status()
-            
-            if response.text.strip():
-                try:
-                    data = response.json()
-                    if debugging:
-                        print(f"    JSON parsed successfully")
-                        print(f"   Response keys: {list(data.keys())}")
-                    
-                    meta = data.get('meta', {})
-                    if (meta.get('name') == 'Just Another Test' or
-                        meta.get('id') == 'just_another_test' or
-                        meta.get('production_state') == 'offline'):
-                        if debugging:
-                            print(f"    Detected test response, skipping DuckDuckGo API")
-                        raise ValueError("Test response detected")
-                    
-                    results = []
-                    
-                    if data.get("AbstractText") and len(data.get("AbstractText", "").strip()) > 10:
-                        if debugging:
-                            print(f"   Found instant answer: {data.get('Heading', 'No heading')}")
-                        results.append({
-                            "title": data.get("Heading", query.title()),
-                            "snippet": data.get("AbstractText", ""),
-                            "url": data.get("AbstractURL", ""),
-                            "source": "DuckDuckGo Instant Answer"
-                        })
-                    
-                    if data.get("Definition") and len(data.get("Definition", "").strip()) > 10:
-                        if debugging:
-                            print(f"   Found definition")
-                        results.append({
-                            "title": f"Definition: {query}",
-                            "snippet": data.get("Definition", ""),
-                            "url": data.get("DefinitionURL", ""),
-                            "source": "DuckDuckGo Definition"
-                        })
-                    
-                    related_topics = data.get("RelatedTopics", [])
-                    if related_topics:
-                        if debugging:
-                            print(f"   Found {len(related_topics)} related topics")
-                        for i, topic in enumerate(related_topics[:num_results-len(results)]):
-                            if isinstance(topic, dict) and topic.get("Text"):
-                                text = topic.get("Text", "")
-                                if len(text.strip()) > 20:
-                                    if debugging:
-                                        print(f"     Topic {i+1}: {text[:50]}...")
-                                    
-                                    title = query.title()
-                                    if topic.get("Result"):
-                                        result_text = topic.get("Result", "")
-                                        if " - " in result_text:
-                                            title = result_text.split(" - ")[0]
-                                        elif len(result_text) < 100:
-                                            title = result_text
-                                    
-                                    results.append({
-                                        "title": title,
-                                        "snippet": text,
-                                        "url": topic.get("FirstURL", ""),
-                                        "source": "DuckDuckGo Related"
-                                    })
-                    
-                    if results:
-                        if debugging:
-                            print(f"    STRATEGY 1 SUCCESS: Found {len(results)} results")
-                            for i, result in enumerate(results, 1):
-                                print(f"     Result {i}: {result['title']}")
-                        
-                        return {
-                            "query": query,
-                            "original_query": original_query,
-                            "results": results[:num_results],
-                            "total_results": len(results),
-                            "success": True,
-                            "source": "DuckDuckGo API"
-                        }
-                    else:
-                        if debugging:
-                            print(f"    Strategy 1: No meaningful results found")
-                
-                except ValueError as json_error:
-                    if debugging:
-                        print(f"    Strategy 1 JSON ERROR: {json_error}")
-
-        except (requests.RequestException, ValueError) as e:
-            if debugging:
-                print(f"    Strategy 1 ERROR: {e}")
-        
-        if any(tld in query.lower() for tld in ['.com', '.org', '.net', '.edu', '.gov', '.io', '.co']):
-            if debugging:
-                print(f"   Strategy 2: Domain-specific search")
-            
-            domain_match = re.search(r'([a-zA-Z0-9-]+\.(?:com|org|net|edu|gov|io|co|uk|de|fr|tr))', query.lower())
-            if domain_match:
-                domain = domain_match.group(1)
-                
-                results = [
-                    {
-                        "title": f"Visit {domain}",
-                        "snippet": f"To visit {domain}, you can go directly to https://{domain} or http://{domain}. This appears to be a website domain.",
-                        "url": f"https://{domain}",
-                        "source": "Domain suggestion"
-                    },
-                    {
-                        "title": f"Information about {domain}",
-                        "snippet": f"For information about {domain}, you could check: 1) The website directly, 2) WHOIS databases, 3) Web archives, or 4) Search engines like Google.",
-                        "url": f"https://www.google.com/search?q={domain}",
-                        "source": "Domain research guidance"
-                    }
-                ]
-                
-                if debugging:
-                    print(f"    STRATEGY 2 SUCCESS: Created domain-specific results for {domain}")
-                
-                return {
-                    "query": query,
-                    "original_query": original_query,
-                    "results": results,
-                    "total_results": len(results),
-                    "success": True,
-                    "source": "Domain-specific search"
-                }
-        
-        if debugging:
-            print(f"   Strategy 3: Enhanced fallback guidance")
-        
-        fallback_message = f"I would search for '{query}' but don't have access to live web search at the moment."
-        search_suggestions = []
-        
-        query_lower = query.lower()
-        
-        if any(term in query_lower for term in ["exchange rate", "currency", "usd", "try", "eur", "gbp", "bitcoin", "crypto"]):
-            guidance_type = "currency/finance"
-            fallback_message += " For current financial information, I recommend:"
-            search_suggestions = [
-                "XE.com for exchange rates",
-                "Google Finance or Yahoo Finance",
-                "CoinMarketCap for cryptocurrency",
-                "Your bank's website for official rates"
-            ]
-        elif any(term in query_lower for term in ["news", "latest", "current", "recent", "breaking"]):
-            guidance_type = "news"
-            fallback_message += " For latest news, try:"
-            search_suggestions = [
-                "Google News (news.google.com)",
-                "BBC News (bbc.com/news)",
-                "Reuters (reuters.com)",
-                "Associated Press (apnews.com)"
-            ]
-        elif any(term in query_lower for term in ["weather", "temperature", "forecast", "climate"]):
-            guidance_type = "weather"
-            fallback_message += " For weather information, check:"
-            search_suggestions = [
-                "Weather.com",
-                "AccuWeather.com",
-                "Google Weather (search 'weather [location]')",
-                "Your local meteorological service"
-            ]
-        elif any(term in query_lower for term in ["stock", "share", "market", "trading", "nasdaq", "dow"]):
-            guidance_type = "stocks"
-            fallback_message += " For stock market information:"
-            search_suggestions = [
-                "Yahoo Finance (finance.yahoo.com)",
-                "Google Finance",
-                "Bloomberg (bloomberg.com)",
-                "MarketWatch (marketwatch.com)"
-            ]
-        elif any(term in query_lower for term in ["recipe", "cooking", "ingredient", "food"]):
-            guidance_type = "recipes"
-            fallback_message += " For recipes and cooking information:"
-            search_suggestions = [
-                "AllRecipes (allrecipes.com)",
-                "Food Network (foodnetwork.com)",
-                "BBC Good Food",
-                "Serious Eats (seriouseats.com)"
-            ]
-        else:
-            guidance_type = "general"
-            fallback_message += " You can search for this on:"
-            search_suggestions = [
-                "Google (google.com)",
-                "DuckDuckGo (duckduckgo.com)",
-                "Bing (bing.com)",
-                "Specialized search engines for your topic"
-            ]
-        
-        if search_suggestions:
-            fallback_message += "\n• " + "\n• ".join(search_suggestions)
-        
-        if debugging:
-            print(f"   Guidance type: {guidance_type}")
-            print(f"   Suggestions count: {len(search_suggestions)}")
-        
-        result = {
-            "query": query,
-            "original_query": original_query,
-            "results": [
-                {
-                    "title": f"Search guidance for: {query}",
-                    "snippet": fallback_message,
-                    "url": f"https://www.google.com/search?q={query.replace(' ', '+')}",
-                    "source": "Search guidance"
-                }
-            ],
-            "total_results": 1,
-            "success": True,
-            "source": "Enhanced fallback guidance",
-            "note": "Live web search not available - providing enhanced search guidance",
-            "guidance_type": guidance_type
-        }
-        
-        if debugging:
-            print(f"    STRATEGY 3 SUCCESS: Returning enhanced guidance for {guidance_type} query")
-        
+        result = cached_search(query, num_results, lambda: _search_live(query, original_query, num_results))
+        result["original_query"] = original_query
         return result
         
     except Exception as e:
@@ -461,6 +466,28 @@ TOOL_FUNCTIONS = {
     "search_web": search_web
 }
 
+def get_tool_memo_stats() -> Dict[str, Any]:
+    return {name: function.memo.stats() for name, function in TOOL_FUNCTIONS.items() if hasattr(function, "memo")}
+
+register_collector("tool_memo", get_tool_memo_stats)
+
+def tool_declarations() -> List[Dict[str, Any]]:
+    return [declaration for tool in AVAILABLE_TOOLS for declaration in tool["function_declarations"]]
+
+def openai_tool_specs() -> List[Dict[str, Any]]:
+    return [{"type": "function", "function": declaration} for declaration in tool_declarations()]
+
+def parse_tool_arguments(arguments) -> Dict[str, Any]:
+    if isinstance(arguments, dict):
+        return arguments
+    try:
+        parsed = json.loads(arguments or "{}")
+    except ValueError:
+        if debugging:
+            print(f"    Could not parse tool arguments: {arguments!r}")
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
 def execute_tool(function_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     if debugging:
         print(f"TOOL EXECUTION DEBUG")
@@ -478,10 +505,21 @@ def execute_tool(function_name: str, parameters: Dict[str, Any]) -> Dict[str, An
     
     try:
         function = TOOL_FUNCTIONS[function_name]
+        memo = getattr(function, "memo", None) if tool_memo_enabled else None
+        memo_key = memo.key(parameters) if memo is not None else None
+        if memo is not None:
+            cached_result = memo.get(memo_key)
+            if cached_result is not None:
+                if debugging:
+                    print(f"    Serving {function_name} result from memo")
+                return cached_result
+
         if debugging:
             print(f"    Function found, executing...")
         
         result = function(**parameters)
+        if memo is not None and memo.should_store(result):
+            memo.put(memo_key, result)
         
         if debugging:
             print(f"    TOOL SUCCESS: Execution completed")
@@ -513,4 +551,81 @@ def execute_tool(function_name: str, parameters: Dict[str, Any]) -> Dict[str, An
         return {
             "error": f"Error executing {function_name}: {str(e)}",
             "success": False
-        }
\ No newline at end of file
+        }
+
+def _timed_tool(function_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    start_time = time.time()
+    try:
+        return execute_tool(function_name, parameters)
+    finally:
+        record_operation_latency("tool", function_name, time.time() - start_time)
+
+def execute_tools(calls: List[Tuple[str, Dict[str, Any]]], deadline=None) -> List[Dict[str, Any]]:
+    # Runs independent tool calls side by side. Each call gets its own timeout from submission;
+    # a call that misses it is reported as timed out while the others' results are still used.
+    start_time = time.time()
+    futures = [(name, _tool_executor.submit(_timed_tool, name, parameters)) for name, parameters in calls]
+    results = []
+    for name, future in futures:
+        timeout = tool_timeouts.get(name, default_tool_timeout)
+        if deadline is not None:
+            timeout = deadline.timeout_for(timeout)
+        try:
+            result = future.result(timeout=max(0.0, start_time + timeout - time.time()))
+            increment_counter("tool_calls", tool=name, outcome="success" if isinstance(result, dict) and result.get("success") else "failed")
+        except FutureTimeoutError:
+            # The call keeps running in the pool; a late search result still lands in the search cache.
+            future.cancel()
+            increment_counter("tool_calls", tool=name, outcome="timeout")
+            if debugging:
+                print(f"    TOOL TIMEOUT: {name} did not finish within {timeout:.1f}s")
+            result = {"error": f"Tool '{name}' timed out after {timeout:.1f}s", "success": False, "timed_out": True}
+        results.append(result)
+    return results
+
+def apply_tool_intent(content: str, intent, deadline=None) -> str:
+    if intent is None or not intent.needs_tools:
+        return content
+
+    calls = []
+    if intent.search_query:
+        calls.append(("search_web", {"query": intent.search_query}))
+    if intent.math_expression:
+        calls.append(("calculate_math", {"expression": intent.math_expression}))
+    if not calls:
+        return content
+
+    if debugging:
+        print(f"    INITIATING TOOLS: {[name for name, _ in calls]}")
+    results = dict(zip([name for name, _ in calls], execute_tools(calls, deadline)))
+
+    search_result = results.get("search_web")
+    if search_result is not None:
+        if search_result.get("success"):
+            search_info = f"Based on my web search for '{intent.search_query}', here's what I found:\n\n"
+            for i, result in enumerate(search_result.get("results", [])[:3], 1):
+                title = result.get('title', 'No title')
+                snippet = re.sub(r'<[^>]+>', '', result.get('snippet', 'No description available'))
+                search_info += f"{i}. **{title}**\n{snippet}\n\n"
+
+            if "Current message:" in content:
+                content = re.sub(
+                    r"(Current message:\s*)(.+?)(\n\n.*)?$",
+                    lambda match: f"{match.group(1)}{intent.message}\n\nSearch results:\n{search_info}\n\nPlease provide a helpful response based on this information.{match.group(3) or ''}",
+                    content,
+                    flags=re.DOTALL
+                )
+            else:
+                content = f"User asked: {intent.message}\n\nSearch results:\n{search_info}\n\nPlease provide a helpful response based on this information."
+        elif debugging:
+            print(f"    Search failed: {search_result.get('error', 'Unknown error')}")
+
+    math_result = results.get("calculate_math")
+    if math_result is not None:
+        if math_result.get("success"):
+            calc_info = f"\nCalculation result: {intent.math_label} = {math_result.get('result')}\n"
+            content = f"{content}\n{calc_info}\nPlease provide a response that includes this calculation."
+        elif debugging:
+            print(f"    Math calculation failed: {math_result.get('error', 'Unknown error')}")
+
+    return content
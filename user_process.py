@@ -12,7 +12,9 @@ load_dotenv()
 debugging = os.getenv("debugging", "false").lower() == "true"
 
 def get_current_user():
-    auth = request.headers.get('Authorization', '')
+    return get_user_for_authorization(request.headers.get('Authorization', ''), current_app.config['JWT_SECRET_KEY'])
+
+def get_user_for_authorization(auth, secret_key):
     if debugging:
         print("Authorization header:", auth)
 
@@ -21,7 +23,7 @@ def get_current_user():
         try:
             payload = jwt.decode(
                 token,
-                current_app.config['JWT_SECRET_KEY'],
+                secret_key,
                 algorithms=['HS256']
             )
             if debugging:
@@ -0,0 +1,20 @@
+import os
+from dotenv import load_dotenv
+from __init__ import create_app, start_background_services, flaskIP, flaskPort
+
+load_dotenv()
+debugging = os.getenv("debugging", "false").lower() == "true"
+
+waitress_threads = int(os.getenv("WAITRESS_THREADS", "32"))
+
+# Background services are started per worker process (gunicorn.conf.py post_fork), never in
+# a parent that is about to fork, since its threads would not exist in the workers.
+# Processes spawned by the math evaluator pool re-run this script as __mp_main__ and only
+# need its imports, not another round of storage setup.
+if __name__ != "__mp_main__":
+    application = create_app(start_services=False)
+
+if __name__ == "__main__":
+    from waitress import serve
+    start_background_services()
+    serve(application, host=flaskIP, port=flaskPort, threads=waitress_threads)